@@ -0,0 +1,230 @@
+import collections
+import datetime
+import email.utils
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 通信（HTTPのGET）をまとめて引き受けるモジュール
+# 天気予報アプリ（lecture-5・lecture-6）とスクレイピング（最終課題）で、このファイル1つを共有している
+# （各フォルダの http_client.py がこのファイルを読み込むので、どのプログラムからも import http_client で使える）
+#   - 接続を使い回す（requests.Session）ので、2回目からはTCP/TLSの接続の手間がかからない
+#   - タイムアウトを必ず付けるので、相手のサーバーが応答しなくてもアプリが固まらない
+#   - 混雑（429）やサーバーエラー（5xx）・通信エラーは、待ち時間を倍にしながらやり直す
+#   - 同じサーバー（ホスト）で失敗が続いたら、しばらくそのサーバーには送らずにすぐエラーにする（サーキットブレーカー）
+#   - サーバーごとに、リクエスト数・エラー数・かかった時間を記録する
+#   - on_response を渡すと、1回の通信ごとに結果を知らせる（やり直しの分も含む。送るペースの調整などに使う）
+#
+# 使い方:
+#   client = get_client()              # アプリ全体で共有する1つのクライアント
+#   response = client.get(url)         # requests.get と同じように使える
+#   print(format_metrics(client.metrics()))
+
+__all__ = [
+    "DEFAULT_TIMEOUT", "DEFAULT_RETRIES", "DEFAULT_BACKOFF", "DEFAULT_POOL_SIZE",
+    "DEFAULT_FAILURE_THRESHOLD", "DEFAULT_RESET_TIMEOUT", "RETRY_STATUSES",
+    "CircuitOpenError", "HostState", "HttpClient",
+    "retry_after_seconds", "format_metrics", "get_client",
+]
+
+# タイムアウト（秒）: (接続するまで, 応答を待つ間)
+DEFAULT_TIMEOUT = (5, 10)
+# やり直す回数と、最初の待ち時間（秒）
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.5
+# 同じサーバーに同時につなぐ接続の数
+DEFAULT_POOL_SIZE = 10
+# この回数続けて失敗したら、そのサーバーへの送信を止める
+DEFAULT_FAILURE_THRESHOLD = 5
+# 送信を止めてから、もう一度試してみるまでの時間（秒）
+DEFAULT_RESET_TIMEOUT = 30
+
+# やり直す価値のある応答（混雑・サーバー側の一時的なエラー）
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# 記録しておく応答時間の数（サーバーごと）
+_LATENCY_SAMPLES = 200
+
+
+# 応答の Retry-After（あと何秒待ってほしいか）を秒数で返す関数（指定がなければ None）
+# 秒数（"120"）と日時（"Wed, 21 Oct 2026 07:28:00 GMT"）のどちらの形でも受け付ける
+def retry_after_seconds(response):
+    value = response.headers.get("Retry-After", "").strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        # タイムゾーンのない日時は、HTTPの決まりどおりGMT（UTC）とみなす
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+# サーキットブレーカーが開いている（そのサーバーへの送信を止めている）ときのエラー
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    pass
+
+
+# 1つのサーバー（ホスト）ごとの、失敗の状況と応答時間の記録
+class HostState:
+    def __init__(self):
+        self.consecutive_failures = 0
+        # 送信を止めた時刻（止めていなければ None）
+        self.opened_at = None
+        # 送信を止めたあと、お試しのリクエストを1つ送っている最中か
+        self.trial_in_flight = False
+        self.requests = 0
+        self.errors = 0
+        self.latencies = collections.deque(maxlen=_LATENCY_SAMPLES)
+
+
+class HttpClient:
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 pool_size=DEFAULT_POOL_SIZE, headers=None,
+                 failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT,
+                 on_response=None):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # on_response(url, response, elapsed): response は通信エラーのとき None
+        self.on_response = on_response
+
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _state(self, host):
+        with self._lock:
+            return self._hosts.setdefault(host, HostState())
+
+    # サーキットブレーカーを確認する（送ってはいけないときは CircuitOpenError）
+    def _before_request(self, host):
+        state = self._state(host)
+        with self._lock:
+            if state.opened_at is None:
+                return
+            if time.monotonic() - state.opened_at < self.reset_timeout or state.trial_in_flight:
+                raise CircuitOpenError(f"{host} への送信を一時的に止めています（失敗が続いたため）")
+            # 止めてから十分に時間がたったので、1つだけ送ってみる
+            state.trial_in_flight = True
+
+    # 1回の通信の結果を記録する
+    def _after_request(self, host, elapsed, ok):
+        state = self._state(host)
+        with self._lock:
+            state.requests += 1
+            state.latencies.append(elapsed)
+            state.trial_in_flight = False
+            if ok:
+                state.consecutive_failures = 0
+                state.opened_at = None
+                return
+            state.errors += 1
+            state.consecutive_failures += 1
+            if state.consecutive_failures >= self.failure_threshold or state.opened_at is not None:
+                state.opened_at = time.monotonic()
+
+    # 次にやり直すまでの待ち時間（秒）
+    # サーバーが Retry-After で待ち時間を指定してきたときは、それに従う
+    def _retry_delay(self, attempt, response=None):
+        if response is not None:
+            retry_after = retry_after_seconds(response)
+            if retry_after is not None:
+                return retry_after
+        # 指数バックオフ（0.5秒, 1秒, 2秒...）に少しだけランダムな揺らぎを加える
+        return self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    # GETリクエストを送る（requests.get と同じ引数を受け取り、requests.Response を返す）
+    # 404 などのやり直しても変わらないエラーは、そのまま応答を返す（raise_for_status は呼ぶ側で行う）
+    def get(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlsplit(url).netloc
+
+        for attempt in range(self.retries + 1):
+            self._before_request(host)
+            start = time.monotonic()
+            try:
+                response = self.session.get(url, **kwargs)
+            except requests.exceptions.RequestException:
+                elapsed = time.monotonic() - start
+                self._after_request(host, elapsed, ok=False)
+                if self.on_response:
+                    self.on_response(url, None, elapsed)
+                if attempt == self.retries:
+                    raise
+                time.sleep(self._retry_delay(attempt))
+                continue
+
+            elapsed = time.monotonic() - start
+            retryable = response.status_code in RETRY_STATUSES
+            self._after_request(host, elapsed, ok=not retryable)
+            if self.on_response:
+                self.on_response(url, response, elapsed)
+            if not retryable or attempt == self.retries:
+                return response
+            time.sleep(self._retry_delay(attempt, response))
+
+    # サーバーごとの記録を {ホスト: {...}} で返す
+    def metrics(self):
+        with self._lock:
+            result = {}
+            for host, state in self._hosts.items():
+                latencies = sorted(state.latencies)
+                result[host] = {
+                    "requests": state.requests,
+                    "errors": state.errors,
+                    "circuit_open": state.opened_at is not None,
+                    "median_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+                    "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else None,
+                }
+            return result
+
+    # 接続をすべて閉じる
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# metrics() の結果を、表示しやすい文字列にする関数
+def format_metrics(metrics):
+    lines = []
+    for host, m in sorted(metrics.items()):
+        state = "（送信停止中）" if m["circuit_open"] else ""
+        lines.append(
+            f"{host}: {m['requests']} 件（エラー {m['errors']} 件）"
+            f" 中央値 {m['median_ms']} ms / 95% {m['p95_ms']} ms{state}"
+        )
+    return "\n".join(lines)
+
+
+# アプリ全体で共有するクライアント
+_client = None
+_client_lock = threading.Lock()
+
+
+# 共有のクライアントを返す関数（最初に呼ばれたときに作る）
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+import time
+
+import requests
+
+from http_client import get_client
+
+# 気象庁の地域リスト（エリア定義）を取得するURL
+AREA_URL = "http://www.jma.go.jp/bosai/common/const/area.json"
+
+# キャッシュファイルの置き場所（実行時のカレントディレクトリに左右されないよう、このファイルの場所を基準にする）
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+CACHE_FILE = os.path.join(CACHE_DIR, "area.json")
+# ETag / Last-Modified / 保存時刻を記録するファイル
+META_FILE = os.path.join(CACHE_DIR, "area_meta.json")
+
+# キャッシュの有効期限（秒）。地域定義はめったに変わらないので1日にしておく
+CACHE_TTL_SECONDS = 24 * 60 * 60
+
+
+# キャッシュファイルを読み込む関数
+# キャッシュがない・壊れている場合は (None, {}) を返す
+def read_cache():
+    try:
+        with open(CACHE_FILE, encoding="utf-8") as f:
+            area_data = json.load(f)
+    except (OSError, ValueError):
+        return None, {}
+
+    try:
+        with open(META_FILE, encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = {}
+
+    return area_data, meta
+
+
+# キャッシュファイルを書き込む関数
+# 書き込み途中で落ちても壊れたファイルが残らないよう、一時ファイルに書いてから置き換える
+def write_cache(area_data, meta):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    for path, data in ((CACHE_FILE, area_data), (META_FILE, meta)):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+# キャッシュが有効期限内かどうかを判定する関数
+def is_fresh(meta, ttl=CACHE_TTL_SECONDS):
+    saved_at = meta.get("saved_at")
+    if saved_at is None:
+        return False
+    return time.time() - saved_at < ttl
+
+
+# 条件付きリクエストで地域データを取り直す関数
+# サーバー側で変更がなければ（304 Not Modified）本文は受け取らず、area_data に None を返す
+def revalidate_area_data(meta):
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    response = get_client().get(AREA_URL, headers=headers)
+
+    new_meta = {
+        "etag": response.headers.get("ETag", meta.get("etag")),
+        "last_modified": response.headers.get("Last-Modified", meta.get("last_modified")),
+        "saved_at": time.time(),
+    }
+
+    if response.status_code == 304:
+        return None, new_meta
+
+    response.raise_for_status()
+    return response.json(), new_meta
+
+
+# バックグラウンドでキャッシュを再検証する関数
+# 新しいデータはキャッシュに保存するだけで、画面には次回の起動から反映される
+def _revalidate_in_background(area_data, meta):
+    def worker():
+        try:
+            new_data, new_meta = revalidate_area_data(meta)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"地域データの再検証に失敗しました: {e}")
+            return
+        # 変更なし（304）なら、保存時刻だけ更新して、しばらく再検証しないようにする
+        write_cache(new_data if new_data is not None else area_data, new_meta)
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    return thread
+
+
+# 地域データを読み込む関数（アプリ起動時に使う）
+#   1. ディスクのキャッシュがあれば、通信を待たずにそれを返す（期限切れならバックグラウンドで再検証）
+#   2. なければ、その場で気象庁から取得してキャッシュに保存する
+# lecture-5 にはデータベースがないので、オフライン時に使えるのは一度保存したキャッシュだけ
+def load_area_data(ttl=CACHE_TTL_SECONDS):
+    area_data, meta = read_cache()
+    if area_data is not None:
+        if not is_fresh(meta, ttl):
+            _revalidate_in_background(area_data, meta)
+        return area_data
+
+    area_data, new_meta = revalidate_area_data({})
+    write_cache(area_data, new_meta)
+    return area_data
@@ -1,5 +1,10 @@
 import flet as ft
-import requests
+
+# 接続の使い回し・タイムアウト・やり直し・サーキットブレーカーをまとめた通信用のクライアント
+# （本体は lecture-6・最終課題と共有している common/http_client_core.py）
+from http_client import get_client
+# 地域データ（area.json）のキャッシュ
+from area_cache import load_area_data
 
 # 天気の文字からアイコンを判定する補助関数（これはデザイン用の追加機能です）
 # 修正: 判定ロジックを強化し、誤判定を防ぐ
@@ -54,13 +59,9 @@ def main(page: ft.Page):
 
     # --- データ取得処理 ---
 
-    # 気象庁の地域リスト（エリア定義）を取得するURL
-    area_url = "http://www.jma.go.jp/bosai/common/const/area.json"
-    
-    # APIから地域データを取得する
-    # requestsを使ってWeb上のデータをJSON形式として読み込む
-    response = requests.get(area_url)
-    area_data = response.json()
+    # 気象庁の地域リスト（エリア定義）を読み込む
+    # ディスクのキャッシュがあれば通信を待たずに使い、期限切れならバックグラウンドで取り直す（area_cache.py）
+    area_data = load_area_data()
 
     # 「centers」が地方（関東、近畿など）、「offices」が都道府県ごとの気象台を表している
     centers = area_data["centers"]
@@ -123,7 +124,8 @@ def main(page: ft.Page):
         try:
             # 選択された地域の天気予報JSONを取得するURLを作成する
             forecast_url = f"https://www.jma.go.jp/bosai/forecast/data/forecast/{region_code}.json"
-            forecast_res = requests.get(forecast_url)
+            forecast_res = get_client().get(forecast_url)
+            forecast_res.raise_for_status()
             forecast_data = forecast_res.json()
 
             # 取得したデータから必要な情報を取り出す
@@ -0,0 +1,160 @@
+import argparse
+
+from db import get_manager
+
+# weather.db にたまった過去の予報を分析するプログラム
+# 同じ日（target_date）の予報が、取得するたびにどう変わったか（予報の修正履歴）と、
+# 最終的な予報とどれくらい一致していたか（的中率）を調べる
+#
+# 予報1件ずつPythonでループするのではなく、SQLのウィンドウ関数（LAG / LAST_VALUE）で
+# 全期間をまとめて計算するので、データが増えても数秒で終わる
+#
+# 使い方: python analysis.py --area 130000
+
+# 予報の対象日（'2026-01-07T11:00:00+09:00' → '2026-01-07'）と、取得した日から何日先の予報か
+_SNAPSHOTS_SQL = """
+    SELECT
+        area_code,
+        substr(target_date, 1, 10) AS target_day,
+        fetched_at,
+        weather_text,
+        weather_code,
+        CAST(julianday(substr(target_date, 1, 10)) - julianday(substr(fetched_at, 1, 10)) AS INTEGER) AS lead_days
+    FROM forecasts
+    WHERE (:area_code IS NULL OR area_code = :area_code)
+"""
+
+
+# 予報の修正履歴を返す関数
+# 地域・対象日ごとに、天気の文字か天気コードが前回の取得から変わった行だけを返す（最初の予報も含む）
+# 戻り値は (area_code, target_day, fetched_at, 前回の天気, 今回の天気, 前回の天気コード, 今回の天気コード) のリスト
+def revision_timeline(conn, area_code=None):
+    return conn.execute(
+        f"""
+        WITH snapshots AS ({_SNAPSHOTS_SQL}),
+        with_previous AS (
+            SELECT
+                *,
+                LAG(weather_text) OVER w AS prev_text,
+                LAG(weather_code) OVER w AS prev_code
+            FROM snapshots
+            WINDOW w AS (PARTITION BY area_code, target_day ORDER BY fetched_at)
+        )
+        SELECT area_code, target_day, fetched_at, prev_text, weather_text, prev_code, weather_code
+        FROM with_previous
+        WHERE prev_text IS NULL
+           OR prev_text <> weather_text
+           OR COALESCE(prev_code, '') <> COALESCE(weather_code, '')
+        ORDER BY area_code, target_day, fetched_at
+        """,
+        {"area_code": area_code},
+    ).fetchall()
+
+
+# 地域・対象日ごとに、予報が何回取得され、何回変わったかを返す関数
+# 戻り値は (area_code, target_day, 取得回数, 修正回数, 最初の予報, 最終的な予報) のリスト
+# forecasts には内容が変わったときの予報しか保存されない（同じ内容なら fetches だけに記録される）ので、
+# 取得回数は forecasts の行数ではなく、fetches で同じ内容（payload_hash）を取得した回数を足して数える
+# （payload_hash を記録する前の取得は、1行を1回として数える）
+def revision_summary(conn, area_code=None):
+    return conn.execute(
+        f"""
+        WITH snapshots AS ({_SNAPSHOTS_SQL}),
+        payload_fetches AS (
+            SELECT area_code, payload_hash, COUNT(*) AS fetch_count
+            FROM fetches
+            WHERE payload_hash IS NOT NULL
+              AND (:area_code IS NULL OR area_code = :area_code)
+            GROUP BY area_code, payload_hash
+        ),
+        with_previous AS (
+            SELECT
+                *,
+                LAG(weather_text) OVER w AS prev_text,
+                FIRST_VALUE(weather_text) OVER w_all AS first_text,
+                LAST_VALUE(weather_text) OVER w_all AS final_text
+            FROM snapshots
+            WINDOW w AS (PARTITION BY area_code, target_day ORDER BY fetched_at),
+                   w_all AS (PARTITION BY area_code, target_day ORDER BY fetched_at
+                             ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+        )
+        SELECT
+            p.area_code,
+            p.target_day,
+            SUM(COALESCE(pf.fetch_count, 1)) AS fetch_count,
+            SUM(p.prev_text IS NOT NULL AND p.prev_text <> p.weather_text) AS revision_count,
+            MAX(p.first_text) AS first_text,
+            MAX(p.final_text) AS final_text
+        FROM with_previous AS p
+        LEFT JOIN fetches AS f
+            ON f.area_code = p.area_code AND f.fetched_at = p.fetched_at
+        LEFT JOIN payload_fetches AS pf
+            ON pf.area_code = f.area_code AND pf.payload_hash = f.payload_hash
+        GROUP BY p.area_code, p.target_day
+        ORDER BY p.area_code, p.target_day
+        """,
+        {"area_code": area_code},
+    ).fetchall()
+
+
+# 的中率を返す関数
+# 実際の天気の観測データはないので、「対象日に一番近いタイミングで取得した予報（最終予報）」を正解とみなし、
+# 何日前の予報がどれくらい最終予報と一致していたかを、地域・日数ごとに集計する
+# forecasts には内容が変わったときの予報しか保存されないので、revision_summary と同じく
+# fetches で同じ内容（payload_hash）を取得した1回1回を予報1件として数え、何日前かもその取得日時から計算する
+# （payload_hash を記録する前の取得は、1行を1回として数える）
+# 戻り値は (area_code, 何日前の予報か, 予報の件数, 一致した件数, 一致率) のリスト
+def accuracy_stats(conn, area_code=None):
+    return conn.execute(
+        f"""
+        WITH snapshots AS ({_SNAPSHOTS_SQL}),
+        observations AS (
+            SELECT
+                s.area_code,
+                s.target_day,
+                s.weather_text,
+                COALESCE(f.fetched_at, s.fetched_at) AS fetched_at
+            FROM snapshots AS s
+            LEFT JOIN fetches AS saved
+                ON saved.area_code = s.area_code AND saved.fetched_at = s.fetched_at
+            LEFT JOIN fetches AS f
+                ON f.area_code = saved.area_code AND f.payload_hash = saved.payload_hash
+        ),
+        with_final AS (
+            SELECT
+                *,
+                CAST(julianday(target_day) - julianday(substr(fetched_at, 1, 10)) AS INTEGER) AS lead_days,
+                LAST_VALUE(weather_text) OVER (
+                    PARTITION BY area_code, target_day ORDER BY fetched_at
+                    ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+                ) AS final_text
+            FROM observations
+        )
+        SELECT
+            area_code,
+            lead_days,
+            COUNT(*) AS forecast_count,
+            SUM(weather_text = final_text) AS match_count,
+            ROUND(AVG(weather_text = final_text), 3) AS match_rate
+        FROM with_final
+        GROUP BY area_code, lead_days
+        ORDER BY area_code, lead_days
+        """,
+        {"area_code": area_code},
+    ).fetchall()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="weather.db の予報の修正履歴と的中率を表示する")
+    parser.add_argument("--db", default=None, help="分析するデータベースファイル（省略時は weather.db）")
+    parser.add_argument("--area", default=None, help="地域コード（省略すると全地域）")
+    args = parser.parse_args()
+
+    with get_manager(args.db).reader() as conn:
+        print("--- 【予報の修正回数】 ---")
+        for area, day, fetch_count, revisions, first, final in revision_summary(conn, args.area):
+            print(f"{area} {day}: 取得 {fetch_count} 回 / 修正 {revisions} 回  {first} → {final}")
+
+        print("\n--- 【最終予報との一致率】（何日前の予報か） ---")
+        for area, lead_days, total, matches, rate in accuracy_stats(conn, args.area):
+            print(f"{area} {lead_days}日前: {matches}/{total} 件一致（{rate:.1%}）")
@@ -0,0 +1,156 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+
+from db import get_manager
+from http_client import get_client
+from jma import JMA_BASE_URL
+
+# 気象庁の地域リスト（エリア定義）を取得するURL
+AREA_URL = JMA_BASE_URL + "/bosai/common/const/area.json"
+
+# キャッシュファイルの置き場所（実行時のカレントディレクトリに左右されないよう、このファイルの場所を基準にする）
+# 環境変数 WEATHER_CACHE_DIR を設定すると、別の場所を使うこともできる
+CACHE_DIR = os.environ.get("WEATHER_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+CACHE_FILE = os.path.join(CACHE_DIR, "area.json")
+# ETag / Last-Modified / 保存時刻を記録するファイル
+META_FILE = os.path.join(CACHE_DIR, "area_meta.json")
+
+# キャッシュの有効期限（秒）。地域定義はめったに変わらないので1日にしておく
+CACHE_TTL_SECONDS = 24 * 60 * 60
+
+# 通信のタイムアウト（秒）
+REQUEST_TIMEOUT = 10
+
+
+# キャッシュファイルを読み込む関数
+# キャッシュがない・壊れている場合は (None, {}) を返す
+def read_cache():
+    try:
+        with open(CACHE_FILE, encoding="utf-8") as f:
+            area_data = json.load(f)
+    except (OSError, ValueError):
+        return None, {}
+
+    try:
+        with open(META_FILE, encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = {}
+
+    return area_data, meta
+
+
+# キャッシュファイルを書き込む関数
+# 書き込み途中で落ちても壊れたファイルが残らないよう、一時ファイルに書いてから置き換える
+def write_cache(area_data, meta):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    for path, data in ((CACHE_FILE, area_data), (META_FILE, meta)):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+# キャッシュが有効期限内かどうかを判定する関数
+def is_fresh(meta, ttl=CACHE_TTL_SECONDS):
+    saved_at = meta.get("saved_at")
+    if saved_at is None:
+        return False
+    return time.time() - saved_at < ttl
+
+
+# 条件付きリクエストで地域データを取り直す関数
+# サーバー側で変更がなければ（304 Not Modified）本文は受け取らず、area_data に None を返す
+def revalidate_area_data(meta):
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    response = get_client().get(AREA_URL, headers=headers, timeout=REQUEST_TIMEOUT)
+
+    new_meta = {
+        "etag": response.headers.get("ETag", meta.get("etag")),
+        "last_modified": response.headers.get("Last-Modified", meta.get("last_modified")),
+        "saved_at": time.time(),
+    }
+
+    if response.status_code == 304:
+        return None, new_meta
+
+    response.raise_for_status()
+    return response.json(), new_meta
+
+
+# オフライン時の代わりに、データベースの areas テーブルから地域データを組み立てる関数
+# areas テーブルには地方（centers）の情報がないため、全地域を1つのグループにまとめる
+def load_area_data_from_db(db_path=None):
+    try:
+        with get_manager(db_path).reader() as conn:
+            rows = conn.execute("SELECT area_code, area_name FROM areas ORDER BY area_code").fetchall()
+    except sqlite3.Error:
+        return None
+
+    if not rows:
+        return None
+
+    offices = {code: {"name": name} for code, name in rows}
+    centers = {
+        "saved": {"name": "保存済みの地域", "children": [code for code, _ in rows]}
+    }
+    return {"centers": centers, "offices": offices}
+
+
+# バックグラウンドでキャッシュを再検証する関数
+# 内容が変わっていた場合だけ on_update(area_data) を呼ぶ
+def _revalidate_in_background(meta, on_update):
+    def worker():
+        try:
+            area_data, new_meta = revalidate_area_data(meta)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"地域データの再検証に失敗しました: {e}")
+            return
+
+        if area_data is None:
+            # 変更なし: 保存時刻だけ更新して、しばらく再検証しないようにする
+            cached_data, _ = read_cache()
+            if cached_data is not None:
+                write_cache(cached_data, new_meta)
+            return
+
+        write_cache(area_data, new_meta)
+        if on_update:
+            on_update(area_data)
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    return thread
+
+
+# 地域データを読み込む関数（アプリ起動時に使う）
+# 戻り値は (area_data, source)。source は "cache" / "network" / "db" のどれか
+#   1. ディスクのキャッシュがあれば、通信を待たずにそれを返す（期限切れならバックグラウンドで再検証）
+#   2. キャッシュがなく areas テーブルにデータがあれば、それを返してバックグラウンドで取得する
+#   3. どちらもなければ、その場で気象庁から取得する
+# バックグラウンド取得で新しいデータが届いたときは on_update(area_data) が呼ばれる
+def load_area_data(db_path=None, on_update=None, ttl=CACHE_TTL_SECONDS):
+    area_data, meta = read_cache()
+    if area_data is not None:
+        if not is_fresh(meta, ttl):
+            _revalidate_in_background(meta, on_update)
+        return area_data, "cache"
+
+    db_data = load_area_data_from_db(db_path)
+    if db_data is not None:
+        _revalidate_in_background({}, on_update)
+        return db_data, "db"
+
+    area_data, new_meta = revalidate_area_data({})
+    write_cache(area_data, new_meta)
+    return area_data, "network"
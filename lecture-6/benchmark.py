@@ -0,0 +1,243 @@
+import argparse
+import datetime
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import requests
+
+from mock_jma import start_server, synthetic_forecast
+
+# 天気予報アプリの性能を測るプログラム
+# 模擬サーバー（mock_jma.py）と一時的なデータベースを使うので、ネットワークがなくても毎回同じ条件で測れる
+#   - 起動（地域データの読み込み・保存・索引の作成）にかかる時間
+#   - 地域をクリックしてから表示するまでの時間（通信する場合 / お気に入りでDBから読む場合）
+#   - データベースへの書き込みの速さ
+#   - 全地域の一括取り込み（ingest.py）にかかる時間
+# それぞれの処理で使ったメモリの最大量も表示する
+#
+# 使い方:
+#   python benchmark.py --output before.json
+#   （コードを変更したあと）python benchmark.py --compare before.json
+
+# 前回の結果と比べて、この割合より遅くなったら知らせる
+REGRESSION_THRESHOLD = 0.2
+
+
+# 関数を1回実行して (かかった秒数, 使ったメモリの最大量（バイト）, 戻り値) を返す関数
+def measure(func, *args, **kwargs):
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, peak, result
+
+
+# 測れなかった項目（全てのクリックが失敗した場合など）に入れる値
+NOT_AVAILABLE = "n/a"
+
+
+# 何回か測った時間から、中央値と95パーセンタイル（遅い方から5%の位置）をまとめる関数
+# 1回も測れなかったときは、値の代わりに "n/a" を入れる
+def summarize(samples):
+    ordered = sorted(samples)
+    if not ordered:
+        return {"median_ms": NOT_AVAILABLE, "p95_ms": NOT_AVAILABLE, "count": 0}
+    return {
+        "median_ms": round(statistics.median(ordered) * 1000, 2),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+        "count": len(ordered),
+    }
+
+
+# 何回か測ったメモリの最大量（バイト）から、一番多かったものをKBで返す関数（1回も測れなければ "n/a"）
+def peak_kb(peaks):
+    return max(peaks) // 1024 if peaks else NOT_AVAILABLE
+
+
+# クライアントの metrics() から、全てのサーバーに送ったリクエストの合計を返す関数
+def total_requests(metrics):
+    return sum(m["requests"] for m in metrics.values())
+
+
+# 模擬サーバーと一時的なデータベースを用意してから、全てのベンチマークを実行する関数
+def run_benchmarks(clicks=30, snapshots=200, latency=0.05, failure_rate=0.0, workers=4):
+    # 起動の測定は失敗させずに行い、クリックと一括取り込みのときだけ failure_rate で失敗させる
+    server = start_server(latency=latency, vary=True)
+    work_dir = tempfile.mkdtemp(prefix="weather-bench-")
+
+    # アプリのモジュールは、読み込んだときに接続先やファイルの場所を決めるので、環境変数を先に設定する
+    os.environ["JMA_BASE_URL"] = server.base_url
+    os.environ["WEATHER_DB_PATH"] = os.path.join(work_dir, "weather.db")
+    os.environ["WEATHER_CACHE_DIR"] = os.path.join(work_dir, "cache")
+
+    from area_cache import CACHE_FILE, load_area_data
+    from db import init_database
+    from http_client import get_client
+    from ingest import ingest_all
+    from jma import fetch_forecast
+    from region_index import load_region_index
+    from storage import (fetch_times_before, latest_fetch_time, load_forecast, save_areas, save_forecast,
+                         save_forecasts)
+
+    # 画面の部品（カード）を作る時間は、Fletが入っているときだけ測る
+    try:
+        from main import HISTORY_PAGE_SIZE, create_forecast_card, create_region_controls
+    except ImportError:
+        HISTORY_PAGE_SIZE, create_forecast_card, create_region_controls = 20, None, None
+
+    results = {}
+    try:
+        # --- 1. 起動: キャッシュなし（通信する）と、キャッシュあり ---
+        def cold_start():
+            init_database()
+            area_data, source = load_area_data()
+            if source == "network":
+                save_areas(area_data["offices"])
+            region_index = load_region_index(area_data, CACHE_FILE if source != "db" else None)
+            if create_region_controls:
+                create_region_controls(region_index, None)
+            return area_data
+
+        elapsed, peak, area_data = measure(cold_start)
+        results["cold_start"] = {"ms": round(elapsed * 1000, 2), "peak_kb": peak // 1024}
+        elapsed, peak, _ = measure(load_area_data)
+        results["warm_start"] = {"ms": round(elapsed * 1000, 2), "peak_kb": peak // 1024}
+
+        codes = list(area_data["offices"])
+        server.options["failure_rate"] = failure_rate
+
+        # --- 2. 地域をクリックしたとき（main.py の show_forecast と同じ流れ） ---
+        # 通信 → 保存 → 履歴のドロップダウン用の読み込み → カードの作成
+        def click(region_code):
+            forecast_data = fetch_forecast(region_code)
+            current_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            db_results = save_forecast(region_code, forecast_data, current_time)
+            fetch_times_before(region_code, current_time, limit=HISTORY_PAGE_SIZE, inclusive=True)
+            if create_forecast_card:
+                for target_date, weather_text in db_results:
+                    create_forecast_card(target_date[:10], weather_text)
+
+        # 画面と同じ共有のクライアント（失敗したら DEFAULT_RETRIES 回までやり直す）を使うので、
+        # 時間にはやり直しの分も含まれる。やり直したリクエストの数と、やり直しても失敗した回数も数える
+        samples, peaks, errors, retried = [], [], 0, 0
+        client = get_client()
+        for i in range(clicks):
+            sent_before = total_requests(client.metrics())
+            try:
+                elapsed, peak, _ = measure(click, codes[i % len(codes)])
+            except requests.exceptions.RequestException:
+                errors += 1
+                continue
+            finally:
+                # 1回のクリックで2回目以降に送ったリクエストが、やり直した分
+                retried += max(total_requests(client.metrics()) - sent_before - 1, 0)
+            samples.append(elapsed)
+            peaks.append(peak)
+        results["click_network"] = {**summarize(samples), "errors": errors, "retried": retried,
+                                    "peak_kb": peak_kb(peaks)}
+
+        # --- 3. お気に入りをクリックしたとき（通信せず、保存済みの最新の予報をDBから読む） ---
+        def favorite_click(region_code):
+            fetched_at = latest_fetch_time(region_code)
+            fetch_times_before(region_code, fetched_at, limit=HISTORY_PAGE_SIZE, inclusive=True)
+            return load_forecast(region_code, fetched_at)
+
+        # 通信のクリックが全て失敗した場合は、保存済みの地域がないので測れない
+        saved_codes = [code for code in codes if latest_fetch_time(code)]
+        samples, peaks = [], []
+        for i in range(clicks if saved_codes else 0):
+            elapsed, peak, _ = measure(favorite_click, saved_codes[i % len(saved_codes)])
+            samples.append(elapsed)
+            peaks.append(peak)
+        results["click_favorite"] = {**summarize(samples), "peak_kb": peak_kb(peaks)}
+
+        # --- 4. データベースへの書き込み（内容の違う予報を1回のトランザクションでまとめて保存） ---
+        base_time = datetime.datetime(2000, 1, 1)
+        batch = [
+            (codes[i % len(codes)], synthetic_forecast(codes[i % len(codes)], revision=1000 + i),
+             (base_time + datetime.timedelta(minutes=i)).strftime('%Y-%m-%d %H:%M:%S'))
+            for i in range(snapshots)
+        ]
+        elapsed, peak, row_count = measure(save_forecasts, batch)
+        results["db_write"] = {
+            "ms": round(elapsed * 1000, 2),
+            "snapshots_per_sec": round(snapshots / elapsed, 1),
+            "rows_per_sec": round(row_count / elapsed, 1),
+            "peak_kb": peak // 1024,
+        }
+
+        # --- 5. 全地域の一括取り込み（ingest.py） ---
+        requests_before = server.request_count
+        elapsed, peak, (area_count, row_count, failed) = measure(
+            ingest_all, workers=workers, rate=1000.0, backoff=0.1,
+        )
+        results["ingest"] = {
+            "ms": round(elapsed * 1000, 2),
+            "areas": area_count,
+            "failed": len(failed),
+            "requests": server.request_count - requests_before,
+            "areas_per_sec": round(area_count / elapsed, 1),
+            "peak_kb": peak // 1024,
+        }
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return results
+
+
+# 前回の結果と比べて表示する関数
+# 時間（ms）が REGRESSION_THRESHOLD より増えた項目の名前のリストを返す
+def compare(results, baseline):
+    regressions = []
+    for name, metrics in results.items():
+        for key in ("ms", "median_ms", "p95_ms"):
+            if key not in metrics or key not in baseline.get(name, {}):
+                continue
+            before, after = baseline[name][key], metrics[key]
+            # どちらかが測れていなければ（"n/a"）比べられない
+            if not isinstance(before, (int, float)) or not isinstance(after, (int, float)):
+                print(f"{name}.{key}: {before} → {after}（比べられません）")
+                continue
+            change = (after - before) / before if before else 0.0
+            mark = "  ← 遅くなりました" if change > REGRESSION_THRESHOLD else ""
+            print(f"{name}.{key}: {before} → {after} ms（{change:+.0%}）{mark}")
+            if mark:
+                regressions.append(f"{name}.{key}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="天気予報アプリの性能を、模擬サーバーを使って測る")
+    parser.add_argument("--clicks", type=int, default=30, help="クリックを何回測るか")
+    parser.add_argument("--snapshots", type=int, default=200, help="書き込みの測定でまとめて保存する予報の数")
+    parser.add_argument("--latency", type=float, default=0.05, help="模擬サーバーの応答の遅れ（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="模擬サーバーが失敗する割合（0〜1）")
+    parser.add_argument("--workers", type=int, default=4, help="一括取り込みで同時に通信する数")
+    parser.add_argument("--output", default=None, help="結果を保存するJSONファイル")
+    parser.add_argument("--compare", default=None, help="比べる前回の結果（JSONファイル）")
+    args = parser.parse_args()
+
+    results = run_benchmarks(clicks=args.clicks, snapshots=args.snapshots, latency=args.latency,
+                             failure_rate=args.failure_rate, workers=args.workers)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f))
+        if regressions:
+            raise SystemExit(1)
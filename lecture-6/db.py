@@ -1,10 +1,121 @@
+import os
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
+
+# --- データベースファイルの場所 ---
+# 実行時のカレントディレクトリに左右されないよう、このファイルと同じフォルダの weather.db を使う
+# 環境変数 WEATHER_DB_PATH を設定すると、別の場所のファイルを使うこともできる
+DB_PATH = os.path.abspath(
+    os.environ.get("WEATHER_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "weather.db"))
+)
+
+# 読み込み用の接続をいくつまで使い回すか
+READER_POOL_SIZE = 4
+
+
+# db_path が省略された場合は DB_PATH を使い、相対パスは絶対パスに直す関数
+def resolve_db_path(db_path=None):
+    return os.path.abspath(db_path) if db_path else DB_PATH
+
+
+# 接続を開いて、性能のための設定（PRAGMA）をする関数
+def _open_connection(db_path):
+    # 別のスレッドで作った接続も使えるように check_same_thread=False にする（使う側はロックやプールで管理する）
+    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+    # WAL モード: 書き込み中でも他の接続から読み込める
+    conn.execute("PRAGMA journal_mode = WAL")
+    # WAL モードでは NORMAL でも壊れることはなく、コミットごとのディスク同期（fsync）が減る
+    conn.execute("PRAGMA synchronous = NORMAL")
+    # ページキャッシュを約8MBにする（マイナスの値はKB単位の指定）
+    conn.execute("PRAGMA cache_size = -8000")
+    # ロックが取れないときに、すぐエラーにせず最大5秒待つ
+    conn.execute("PRAGMA busy_timeout = 5000")
+    return conn
+
+
+# --- 接続の管理 ---
+# 書き込みは1本の接続だけで順番に行い、読み込みは複数の接続を使い回す。
+# 先読み（バックグラウンド）と画面の表示が同時に動いても「database is locked」にならないようにするため。
+class ConnectionManager:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._readers = queue.LifoQueue(maxsize=READER_POOL_SIZE)
+
+    # 書き込み用の接続を使う（with の中が1つのトランザクションになる）
+    # with manager.writer() as conn:
+    #     conn.execute("INSERT ...")
+    @contextmanager
+    def writer(self):
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = _open_connection(self.db_path)
+            with self._writer:
+                yield self._writer
+
+    # 読み込み用の接続を借りる（使い終わったらプールに戻す）
+    @contextmanager
+    def reader(self):
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            conn = _open_connection(self.db_path)
+        try:
+            yield conn
+        finally:
+            # 読み込みだけでも、念のためトランザクションを閉じてから戻す
+            conn.rollback()
+            try:
+                self._readers.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    # 書き込み用の接続を、トランザクションを開始せずに使う（VACUUMなど、トランザクションの中では実行できない処理用）
+    # 書き込みのロックは持ったままなので、その間は他の書き込みは待たされる
+    @contextmanager
+    def maintenance(self):
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = _open_connection(self.db_path)
+            yield self._writer
+
+    # 全ての接続を閉じる
+    def close(self):
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# ファイルごとに1つの ConnectionManager を共有する
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+# 指定したファイル（省略時は DB_PATH）の ConnectionManager を返す関数
+def get_manager(db_path=None):
+    path = resolve_db_path(db_path)
+    with _managers_lock:
+        if path not in _managers:
+            _managers[path] = ConnectionManager(path)
+        return _managers[path]
+
 
 # データベースの初期設定を行う関数
-def init_database():
+# db_path を変えると、別のファイルにデータベースを作ることもできる（省略時は DB_PATH）
+def init_database(db_path=None):
     # データベースファイルに接続する
     # 'weather.db' というファイルがなければ新しく作られ、あればそのファイルを開く
-    conn = sqlite3.connect('weather.db')
+    # WAL モードの設定はファイルに記録されるので、ここで一度設定しておく
+    conn = _open_connection(resolve_db_path(db_path))
     
     # SQL（データベースへの命令文）を実行するためのカーソル（操作役）を作成する
     cursor = conn.cursor()
@@ -32,10 +143,173 @@ def init_database():
         )
     """)
 
-    
-    # 完了したことをコンソールに表示する
-    print("データベース（weather.db）とテーブルの作成が完了しました。")
+    # --- 3. 後から追加したインデックスやテーブルを反映する ---
+    migrate_database(conn)
+
+    conn.close()
+
+
+# --- スキーマの移行（マイグレーション） ---
+# マイグレーションの1段階分を、1つのトランザクションで実行するためのコンテキストマネージャー
+# Python の sqlite3 は CREATE / ALTER TABLE の前にはトランザクションを自動で始めないので、`with conn:` だけでは
+# 途中で落ちたときに一部だけ反映された状態が残り、次の起動で ALTER TABLE が "duplicate column name" で失敗してしまう
+# BEGIN から COMMIT までをまとめて行えば、途中で落ちても全て取り消されて、次の起動でやり直せる
+# （PRAGMA user_version の変更も同じトランザクションに含まれる）
+@contextmanager
+def _migration_step(conn):
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN")
+    try:
+        yield
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+# すでに作られている weather.db に対して、後から追加したインデックスやテーブルを反映する関数
+# PRAGMA user_version にどこまで反映したかを記録しておき、まだの分だけを実行する
+def migrate_database(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+
+    # バージョン1: 履歴検索用のインデックスと、取得履歴（fetches）テーブルの追加
+    if version < 1:
+        with _migration_step(conn):
+            # 「この地域の、この取得日時の予報」を探すためのインデックス
+            # target_date と weather_text も含めておくと、表本体を見に行かずに結果を返せる（カバリングインデックス）
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_forecasts_area_fetched
+                ON forecasts (area_code, fetched_at, target_date, weather_text)
+            """)
+
+            # 取得1回分を1行で表すテーブル
+            # 履歴のドロップダウンは forecasts を DISTINCT するのではなく、このテーブルを主キー順に読むだけでよくなる
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS fetches (
+                    area_code TEXT NOT NULL,     -- 地域コード
+                    fetched_at TEXT NOT NULL,    -- データを取り込んだ日時
+                    row_count INTEGER NOT NULL,  -- この取得で保存した予報の件数
+                    PRIMARY KEY (area_code, fetched_at)
+                ) WITHOUT ROWID
+            """)
+
+            # すでに保存されている予報から、取得履歴を作っておく
+            conn.execute("""
+                INSERT OR IGNORE INTO fetches (area_code, fetched_at, row_count)
+                SELECT area_code, fetched_at, COUNT(*)
+                FROM forecasts
+                GROUP BY area_code, fetched_at
+            """)
+            conn.execute("PRAGMA user_version = 1")
+        version = 1
+
+    # バージョン2: 予報JSONの全体を保存するためのテーブルと、同じ内容の重複を防ぐためのハッシュ値
+    if version < 2:
+        with _migration_step(conn):
+            # 取得した予報JSON1つ分を表すテーブル
+            # payload_hash は中身から計算したハッシュ値で、同じ内容の予報は1行にまとまる
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS forecast_payloads (
+                    payload_hash TEXT PRIMARY KEY,    -- 予報JSONの中身のハッシュ値
+                    area_code TEXT NOT NULL,          -- 地域コード
+                    report_datetime TEXT,             -- 気象庁の発表日時
+                    first_fetched_at TEXT NOT NULL    -- この内容を最初に取得した日時
+                )
+            """)
+
+            # 予報JSONの全ての時系列・細かい地域の値を保存するテーブル
+            # 数値は数値の列に、文字は文字の列に入れる（値がないところはNULL）
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS forecast_details (
+                    payload_hash TEXT NOT NULL,       -- どの予報JSONの値か（forecast_payloadsと対応）
+                    report_kind INTEGER NOT NULL,     -- 0: 3日間の詳細予報, 1: 週間予報
+                    sub_area_code TEXT NOT NULL,      -- 細かい地域のコード（一次細分区域や観測地点）
+                    sub_area_name TEXT,               -- 細かい地域の名前
+                    target_time TEXT NOT NULL,        -- 予報の対象時刻
+                    weather_code INTEGER,             -- 天気コード
+                    weather_text TEXT,                -- 天気の説明
+                    wind TEXT,                        -- 風
+                    wave TEXT,                        -- 波
+                    pop INTEGER,                      -- 降水確率（%）
+                    temp REAL,                        -- 気温
+                    temp_min REAL,                    -- 最低気温
+                    temp_min_upper REAL,              -- 最低気温の予測範囲（上端）
+                    temp_min_lower REAL,              -- 最低気温の予測範囲（下端）
+                    temp_max REAL,                    -- 最高気温
+                    temp_max_upper REAL,              -- 最高気温の予測範囲（上端）
+                    temp_max_lower REAL,              -- 最高気温の予測範囲（下端）
+                    reliability TEXT,                 -- 週間予報の信頼度（A/B/C）
+                    PRIMARY KEY (payload_hash, report_kind, sub_area_code, target_time)
+                ) WITHOUT ROWID
+            """)
+
+            # 取得履歴に「どの内容を取得したか」を記録する列を追加する
+            conn.execute("ALTER TABLE fetches ADD COLUMN payload_hash TEXT")
+            conn.execute("PRAGMA user_version = 2")
+        version = 2
+
+    # バージョン3: お気に入り地域を保存するテーブル（アプリを閉じても消えないように）
+    if version < 3:
+        with _migration_step(conn):
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS favorites (
+                    area_code TEXT PRIMARY KEY,  -- お気に入りに登録した地域コード
+                    added_at TEXT NOT NULL       -- 登録した日時
+                )
+            """)
+            conn.execute("PRAGMA user_version = 3")
+        version = 3
+
+    # バージョン4: VACUUMなどの定期メンテナンスを最後にいつ実行したかを記録するテーブル
+    if version < 4:
+        with _migration_step(conn):
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS maintenance (
+                    task TEXT PRIMARY KEY,       -- 処理の名前（例: vacuum）
+                    last_run_at TEXT NOT NULL    -- 最後に実行した日時
+                )
+            """)
+            conn.execute("PRAGMA user_version = 4")
+        version = 4
+
+    # バージョン5: 日時を整数（UNIX時間・秒）でも持たせる
+    # target_date は気象庁の '2026-01-07T11:00:00+09:00'（タイムゾーン付き）、
+    # fetched_at は '2026-01-07 10:56:33'（このPCの時刻）と形式がばらばらで、文字列のままでは範囲検索がしにくい。
+    # どちらもUTCの秒数に直しておけば、「今週の全地域の予報」をインデックスの範囲検索で取り出せる
+    if version < 5:
+        with _migration_step(conn):
+            conn.execute("ALTER TABLE forecasts ADD COLUMN target_epoch INTEGER")
+            conn.execute("ALTER TABLE forecasts ADD COLUMN fetched_epoch INTEGER")
+            conn.execute("ALTER TABLE fetches ADD COLUMN fetched_epoch INTEGER")
+
+            # すでに保存されている行も変換しておく
+            # strftime('%s', ...) はタイムゾーン付きの日時をUTCに直し、'utc' を付けるとPCの時刻として扱ってUTCに直す
+            conn.execute("""
+                UPDATE forecasts
+                SET target_epoch = CAST(strftime('%s', target_date) AS INTEGER),
+                    fetched_epoch = CAST(strftime('%s', fetched_at, 'utc') AS INTEGER)
+            """)
+            conn.execute("""
+                UPDATE fetches
+                SET fetched_epoch = CAST(strftime('%s', fetched_at, 'utc') AS INTEGER)
+            """)
+
+            # 対象日時の範囲で、全地域の予報を探すためのインデックス（表本体を見に行かずに済むよう列を含める）
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_forecasts_target_epoch
+                ON forecasts (target_epoch, area_code, fetched_epoch, target_date, weather_text)
+            """)
+            # 取得日時の範囲で、全地域の取得履歴を探すためのインデックス
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_fetches_fetched_epoch
+                ON fetches (fetched_epoch, area_code)
+            """)
+            conn.execute("PRAGMA user_version = 5")
+        version = 5
 
 # このファイルを直接実行した時だけ、init_database関数を動かす
 if __name__ == "__main__":
-    init_database()
\ No newline at end of file
+    init_database()
+    # 完了したことをコンソールに表示する
+    print(f"データベース（{DB_PATH}）とテーブルの作成が完了しました。")
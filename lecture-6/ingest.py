@@ -0,0 +1,151 @@
+import argparse
+import datetime
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from area_cache import load_area_data
+from db import init_database
+from http_client import CircuitOpenError, HttpClient, format_metrics
+from jma import fetch_forecast, extract_weathers, parse_forecast
+from storage import save_areas, save_forecasts
+
+# 画面を使わずに、全地域（offices）の天気予報をまとめて取得してweather.dbに保存するプログラム
+# cronなどで定期的に実行して、過去の予報の履歴をためていくために使う
+#
+# 使い方: python ingest.py --workers 4 --rate 5
+
+# 同時に通信する数
+DEFAULT_WORKERS = 4
+# 1秒あたりに送ってよいリクエストの数（気象庁のサーバーに負担をかけないため）
+DEFAULT_RATE = 5.0
+# 失敗したときにやり直す回数と、最初の待ち時間（秒）
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+
+
+# 一定の間隔でしかリクエストを送らないようにするための仕組み
+# 複数のスレッドから呼ばれても、全体で「1秒あたり rate 件」を超えないようにする
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    # 次にリクエストを送ってよい時刻まで待つ
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+# 接続を使い回すためのクライアントを作る関数
+# 同時に通信する数だけ接続を持っておけるようにする
+# やり直しは、1回ごとに RateLimiter を通すため fetch_with_retry の側で行う（クライアントではやり直さない）
+def create_client(workers):
+    return HttpClient(pool_size=workers, retries=0)
+
+
+# 予報JSONを、保存するとき（storage._insert_snapshot）と同じように解析してみる関数
+# 形が崩れていれば ValueError にする（やり直しても直らないので、やり直さない）
+def check_forecast(forecast_data):
+    try:
+        extract_weathers(forecast_data)
+        parse_forecast(forecast_data)
+    except (KeyError, IndexError, TypeError, AttributeError) as e:
+        raise ValueError(f"予報JSONの形が正しくありません: {e!r}") from e
+
+
+# 1地域分の予報を取得する関数（失敗したら待ち時間を倍にしながらやり直す）
+# 戻り値は (area_code, forecast_data, fetched_at)
+def fetch_with_retry(client, limiter, region_code, retries, backoff):
+    for attempt in range(retries + 1):
+        limiter.wait()
+        try:
+            forecast_data = fetch_forecast(region_code, session=client)
+            # 形の崩れたJSONは、保存するときと同じ解析をここで行って、この地域の失敗にしておく
+            # （まとめて保存するトランザクションの中で例外になると、全地域の保存が取り消されてしまうため）
+            check_forecast(forecast_data)
+            fetched_at = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            return region_code, forecast_data, fetched_at
+        except CircuitOpenError:
+            # 気象庁のサーバーで失敗が続いているときは、待ってもすぐには直らないので諦める
+            raise
+        except requests.exceptions.HTTPError as e:
+            # 404などのクライアントエラーはやり直しても変わらないので諦める
+            if e.response is not None and 400 <= e.response.status_code < 500 and e.response.status_code != 429:
+                raise
+            if attempt == retries:
+                raise
+        except requests.exceptions.RequestException:
+            if attempt == retries:
+                raise
+        # 指数バックオフ（1秒, 2秒, 4秒...）に少しだけランダムな揺らぎを加える
+        time.sleep(backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+
+# 全地域を取得して、1回のトランザクションでまとめて保存する関数
+# 保存した (地域数, 予報件数, 失敗した地域コードのリスト) を返す
+def ingest_all(db_path=None, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE,
+               retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+    init_database(db_path)
+
+    area_data, area_source = load_area_data(db_path)
+    offices = area_data["offices"]
+    if area_source == "network":
+        save_areas(offices, db_path=db_path)
+
+    limiter = RateLimiter(rate)
+    snapshots = []
+    failed = []
+
+    with create_client(workers) as client:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(fetch_with_retry, client, limiter, code, retries, backoff): code
+                for code in offices
+            }
+            for future in as_completed(futures):
+                code = futures[future]
+                try:
+                    snapshots.append(future.result())
+                except (requests.exceptions.RequestException, KeyError, IndexError, ValueError) as e:
+                    print(f"取得に失敗しました（{code}）: {e}")
+                    failed.append(code)
+        # サーバーごとのリクエスト数・エラー数・応答時間を表示する
+        print(format_metrics(client.metrics()))
+
+    # 取得できた分を、1回のトランザクションでまとめて保存する
+    total_rows = save_forecasts(snapshots, db_path=db_path)
+    return len(snapshots), total_rows, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="全地域の天気予報を取得してweather.dbに保存する")
+    parser.add_argument("--db", default=None, help="保存先のデータベースファイル（省略時は weather.db）")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="同時に通信する数")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="1秒あたりの最大リクエスト数")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="失敗したときのやり直し回数")
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    try:
+        area_count, row_count, failed_codes = ingest_all(
+            db_path=args.db, workers=args.workers, rate=args.rate, retries=args.retries,
+        )
+    except sqlite3.Error as e:
+        print(f"データベースへの保存に失敗しました: {e}")
+        raise SystemExit(1)
+
+    elapsed = time.monotonic() - start
+    print(f"{area_count} 地域・{row_count} 件の予報を保存しました（{elapsed:.1f} 秒）。")
+    if failed_codes:
+        print(f"取得に失敗した地域: {', '.join(sorted(failed_codes))}")
+        raise SystemExit(1)
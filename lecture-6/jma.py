@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+
+from http_client import get_client
+
+# 気象庁の天気予報JSONを取得・整理するための関数をまとめたモジュール
+# 画面（main.py）からも、バックグラウンドの先読み（prefetch.py）からも同じものを使う
+
+# 気象庁のサーバーのURL
+# 環境変数 JMA_BASE_URL を設定すると、手元の模擬サーバー（mock_jma.py）などに向けることができる
+JMA_BASE_URL = os.environ.get("JMA_BASE_URL", "https://www.jma.go.jp").rstrip("/")
+
+# 天気予報JSONのURL（{code}の部分に地域コードが入る）
+FORECAST_URL = JMA_BASE_URL + "/bosai/forecast/data/forecast/{code}.json"
+
+# 通信のタイムアウト（秒）
+REQUEST_TIMEOUT = 10
+
+
+# 指定した地域の天気予報JSONを取得する関数
+# 省略時はアプリ全体で共有するクライアント（http_client.py）を使うので、接続が使い回される
+# session（HttpClient や requests.Session）を渡すと、そちらを使って取得する
+def fetch_forecast(region_code, session=None):
+    http = session or get_client()
+    response = http.get(FORECAST_URL.format(code=region_code), timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+# 取得したJSONから、日付のリスト・天気のリスト・天気コードのリストを取り出す関数
+# データ構造: [0] -> timeSeries[0] -> areas[0] -> weathers (天気の配列) / weatherCodes (天気コードの配列)
+# ※気象庁のJSONは複雑なため、ここでは一番手前の「詳細な天気」を取得する（画面のカード表示用）
+def extract_weathers(forecast_data):
+    time_series = forecast_data[0]["timeSeries"][0]
+    area = time_series["areas"][0]
+    weather_list = area["weathers"]
+    weather_codes = area.get("weatherCodes", [""] * len(weather_list))
+    time_defines = time_series["timeDefines"]
+    return time_defines, weather_list, weather_codes
+
+
+# 予報JSONの「発表日時」を取り出す関数
+def report_datetime(forecast_data):
+    return forecast_data[0].get("reportDatetime")
+
+
+# 予報JSONの中身から、内容が同じかどうかを判定するためのハッシュ値を作る関数
+# キーの順番や空白の違いに左右されないよう、整形してから計算する
+def payload_hash(forecast_data):
+    canonical = json.dumps(forecast_data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# 空文字は「値なし」として None にし、それ以外は指定した型に変換する
+def _to_value(value, convert):
+    if value is None or value == "":
+        return None
+    try:
+        return convert(value)
+    except ValueError:
+        return None
+
+
+# JSONの要素名と、保存先の列名・型の対応表
+ELEMENT_COLUMNS = {
+    "weatherCodes": ("weather_code", int),
+    "weathers": ("weather_text", str),
+    "winds": ("wind", str),
+    "waves": ("wave", str),
+    "pops": ("pop", int),
+    "temps": ("temp", float),
+    "tempsMin": ("temp_min", float),
+    "tempsMinUpper": ("temp_min_upper", float),
+    "tempsMinLower": ("temp_min_lower", float),
+    "tempsMax": ("temp_max", float),
+    "tempsMaxUpper": ("temp_max_upper", float),
+    "tempsMaxLower": ("temp_max_lower", float),
+    "reliabilities": ("reliability", str),
+}
+
+# 保存する列の並び（forecast_detailsテーブルの列と同じ順番）
+DETAIL_COLUMNS = [column for column, _ in ELEMENT_COLUMNS.values()]
+
+
+# 予報JSONの全ての時系列（timeSeries）・全ての地域（areas）を、1行ずつの辞書のリストに直す関数
+# 1行は「どの予報（0: 3日間の詳細予報, 1: 週間予報）の・どの細かい地域の・どの時刻の値か」を表す
+# 天気・降水確率・気温は時刻の区切りが違うので、同じ時刻のものは1行にまとめる
+def parse_forecast(forecast_data):
+    rows = {}
+    for report_kind, report in enumerate(forecast_data):
+        for series in report.get("timeSeries", []):
+            time_defines = series["timeDefines"]
+            for area in series.get("areas", []):
+                sub_area_code = area["area"]["code"]
+                sub_area_name = area["area"].get("name")
+                for element, (column, convert) in ELEMENT_COLUMNS.items():
+                    values = area.get(element)
+                    if values is None:
+                        continue
+                    for target_time, value in zip(time_defines, values):
+                        key = (report_kind, sub_area_code, target_time)
+                        row = rows.setdefault(key, {
+                            "report_kind": report_kind,
+                            "sub_area_code": sub_area_code,
+                            "sub_area_name": sub_area_name,
+                            "target_time": target_time,
+                        })
+                        row[column] = _to_value(value, convert)
+    return list(rows.values())
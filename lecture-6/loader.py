@@ -0,0 +1,62 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 画面の処理（イベントハンドラ）を止めずに、時間のかかる処理を裏で動かすための仕組み
+# 地域を次々にクリックしたときは、最後にクリックした地域の結果だけを画面に反映する
+
+
+class LatestOnlyLoader:
+    def __init__(self, max_workers=2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # 何番目の依頼かを表す番号（新しい依頼が来るたびに1増える）
+        self._generation = 0
+        self._future = None
+        # 番号の確認・更新を同時に行わないためのロック
+        self._lock = threading.Lock()
+
+    # 新しい処理を依頼する
+    # work(is_cancelled) は裏のスレッドで実行され、その戻り値が on_done(result) に渡される
+    # 例外が起きたときは on_error(err) が呼ばれる
+    # どちらも、この依頼がまだ最新のときだけ呼ばれる
+    def submit(self, work, on_done, on_error):
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            # まだ始まっていない前の依頼は取り消す
+            if self._future is not None:
+                self._future.cancel()
+
+            def is_cancelled():
+                return generation != self._generation
+
+            def run():
+                try:
+                    result = work(is_cancelled)
+                except Exception as err:
+                    self._apply(generation, on_error, err)
+                else:
+                    self._apply(generation, on_done, result)
+
+            self._future = self._executor.submit(run)
+
+    # 実行中・待機中の依頼をすべて無効にする（DBから直接表示する場合など）
+    def cancel(self):
+        with self._lock:
+            self._generation += 1
+            if self._future is not None:
+                self._future.cancel()
+                self._future = None
+
+    # 依頼が最新のままなら callback を呼ぶ
+    # ロックは番号の確認の間だけ持ち、callback（画面の更新）はロックを外してから呼ぶ
+    # （画面の更新中に submit / cancel が待たされたり、callback から submit を呼んで止まったりしないように）
+    def _apply(self, generation, callback, value):
+        with self._lock:
+            if generation != self._generation:
+                return
+        callback(value)
+
+    # 裏のスレッドを片付ける
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
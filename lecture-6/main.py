@@ -1,27 +1,62 @@
 import flet as ft
-import requests
-# 追加機能: データベース操作と日付管理のためのライブラリを読み込む
-import sqlite3
+# 追加機能: 天気の判定結果を覚えておく（キャッシュする）ためのライブラリ
+import functools
+# 追加機能: 日付管理のためのライブラリを読み込む
 import datetime
+# 追加機能: バックグラウンドで届いた地域データと、起動時の地域データを取り違えないためのロック
+import threading
+# 追加機能: 地域データのキャッシュ（起動時に通信を待たないため）
+from area_cache import load_area_data, CACHE_FILE
+# 追加機能: 地域の索引（名前の逆引きと、サイドバーの検索に使う）
+from region_index import load_region_index
+# 追加機能: データベースへの読み書き（まとめて書き込むことで保存を速くする）
+from storage import save_areas, save_forecast, load_forecast, latest_fetch_time
+from storage import fetch_times_before, fetch_times_after
+from storage import load_favorites, add_favorite, remove_favorite
+# 追加機能: 気象庁の予報JSONの取得と、お気に入りのバックグラウンド先読み
+from jma import fetch_forecast
+from prefetch import PrefetchScheduler
+# 追加機能: 通信・保存を画面の処理とは別のスレッドで行い、最新の結果だけを反映する
+from loader import LatestOnlyLoader
+# 追加機能: 起動時にテーブル・インデックスを最新の形にそろえる
+from db import init_database
+
+
+# --- 天気の判定（キャッシュ付き） ---
+# 判定用に不要な文字（スペースなど）を削除してシンプルにする関数
+def normalize_weather_text(weather_text):
+    return weather_text.replace("　", "").replace(" ", "")
+
+# 天気の文字（スペース除去済み）から、どの形のアイコンを出すかを判定する関数
+# 戻り値は ("time", (アイコン1, 色1), (アイコン2, 色2)) / ("occasional", ...) / ("single", (アイコン, 色)) の形
+# 天気の表現は種類が少なく同じ文字が何度も出てくるので、lru_cacheで判定結果を覚えておき、2回目以降は計算しない
+@functools.lru_cache(maxsize=1024)
+def classify_weather(search_text):
+    # 時間による変化（「のち」「から」）があるか調べる
+    time_split_keyword = "のち" if "のち" in search_text else "から" if "から" in search_text else None
+    # 一時的な変化（「時々」「一時」）があるか調べる
+    occasional_split_keyword = "時々" if "時々" in search_text else "一時" if "一時" in search_text else None
 
+    if time_split_keyword:
+        parts = search_text.split(time_split_keyword, 1)
+        return ("time", get_weather_icon(parts[0]), get_weather_icon(parts[1]))
+    elif occasional_split_keyword:
+        parts = search_text.split(occasional_split_keyword, 1)
+        return ("occasional", get_weather_icon(parts[0]), get_weather_icon(parts[1]))
+    else:
+        return ("single", get_weather_icon(search_text))
 
 # --- UIコンポーネント作成関数 ---
 # この関数は、天気予報の文字列(例:「晴れ、曇り」)を受け取り、それに対応するアイコンの組み合わせ(ft.Rowやft.Stack)を生成して返す役割を持つ。これにより、メインの表示ロジックがシンプルになる。
+# 文字の判定は classify_weather に任せる（判定結果はキャッシュされる）
+# ※Fletの部品は1つの画面の場所にしか置けないため、部品そのものは毎回新しく作る
 def create_weather_visual(weather_text):
-    # 判定用に不要な文字（スペースなど）を削除してシンプルにする
-    search_text = weather_text.replace("　", "").replace(" ", "")
-    
-    # 時間による変化（「のち」「から」）があるか調べる
-    time_split_keyword = "のち" if "のち" in search_text else "から" if "から" in search_text else None
-    # 一時的な変化（「時々」「一時」）があるか調べる
-    occasional_split_keyword = "時々" if "時々" in search_text else "一時" if "一時" in search_text else None
+    kind, *icons = classify_weather(normalize_weather_text(weather_text))
     
     # アイコン作成ロジック
-    if time_split_keyword:
+    if kind == "time":
         #  時間変化がある場合 (矢印スタイル)
-        parts = search_text.split(time_split_keyword, 1)
-        icon1, col1 = get_weather_icon(parts[0])
-        icon2, col2 = get_weather_icon(parts[1])
+        (icon1, col1), (icon2, col2) = icons
         # 2つのアイコンを矢印でつないだRowコントロールを生成して返す
         return ft.Row(
             [
@@ -32,11 +67,9 @@ def create_weather_visual(weather_text):
             alignment=ft.MainAxisAlignment.START,
         )
     
-    elif occasional_split_keyword:
+    elif kind == "occasional":
         # 「時々」や「一時」の場合
-        parts = search_text.split(occasional_split_keyword, 1)
-        main_icon_data, main_col = get_weather_icon(parts[0])
-        sub_icon_data, sub_col = get_weather_icon(parts[1])
+        (main_icon_data, main_col), (sub_icon_data, sub_col) = icons
         # 2つのアイコンを重ねて表示するStackコントロールを生成して返す
         return ft.Stack(
             controls=[
@@ -60,13 +93,21 @@ def create_weather_visual(weather_text):
 
     else:
         #  通常の（変化がない、または単純な）天気の場合
-        icon_data, icon_color = get_weather_icon(search_text)
+        (icon_data, icon_color), = icons
         # 1つのアイコンとテキストを並べたRowコントロールを生成して返す
         return ft.Row([
             ft.Icon(icon_data, size=40, color=icon_color),
             ft.Text("天気", size=14, weight="bold", color=ft.Colors.GREY_800)
         ])
 
+# カードの影は全てのカードで同じなので、1回だけ作って使い回す
+CARD_SHADOW = ft.BoxShadow(
+    blur_radius=10,
+    spread_radius=1,
+    color=ft.Colors.with_opacity(0.1, ft.Colors.BLACK),
+    offset=ft.Offset(0, 4)
+)
+
 # 1日分の天気予報カードを作成する関数
 # この関数は、日付や天気などの情報を受け取り、一つのカード型UIコンポーネント(ft.Container)を生成して返す。
 # これにより、表示ロジック内のforループがシンプルになる。
@@ -81,12 +122,7 @@ def create_forecast_card(date_str, weather_text):
         padding=20,
         bgcolor=ft.Colors.WHITE,
         border_radius=15,
-        shadow=ft.BoxShadow(
-            blur_radius=10,
-            spread_radius=1,
-            color=ft.Colors.with_opacity(0.1, ft.Colors.BLACK),
-            offset=ft.Offset(0, 4)
-        ),
+        shadow=CARD_SHADOW,
         content=ft.Column([
             ft.Text(f"日付: {date_str}", size=14, color=ft.Colors.GREY_600),
             ft.Divider(height=10, color=ft.Colors.TRANSPARENT),
@@ -99,106 +135,127 @@ def create_forecast_card(date_str, weather_text):
         ], spacing=5)
     )
 
-# サイドバーの中身を構築する関数
-# この関数は、地域データやお気に入り情報を受け取り、サイドバーを構成するFletコントロールのリストを生成して返す。
-# これにより、render_sidebar関数がシンプルになる。
-def create_sidebar_controls(centers, offices, favorite_codes, on_tile_click):
-    sidebar_controls = []
-    
+# 履歴のドロップダウンに一度に入れる取得日時の数
+HISTORY_PAGE_SIZE = 20
+
+# お気に入りボタン（星）の見た目を、お気に入りかどうかに合わせる関数
+def set_favorite_button_state(button, is_favorite):
+    # アイコンの状態を決める（お気に入りなら塗りつぶし星、そうでなければ枠線のみ）
+    button.icon = ft.Icons.STAR if is_favorite else ft.Icons.STAR_BORDER
+    button.icon_color = ft.Colors.AMBER if is_favorite else ft.Colors.GREY
+
+# --- サイドバーの部品を作成する関数 ---
+# サイドバーは最初に1回だけ組み立て、お気に入りが変わったときは「お気に入り」の部分だけを書き換える。
+# そのため、部品ごとに関数を分けている。
+
+# サイドバーのタイトル部分を作成する関数
+def create_sidebar_title():
     # デザイン変更: サイドバーのタイトルを追加
-    sidebar_controls.append(
-        ft.Container(
-            content=ft.Text("地域一覧", size=18, weight="bold", color=ft.Colors.WHITE),
-            padding=20,
-            bgcolor=ft.Colors.BLUE_800
-        )
+    return ft.Container(
+        content=ft.Text("地域一覧", size=18, weight="bold", color=ft.Colors.WHITE),
+        padding=20,
+        bgcolor=ft.Colors.BLUE_800
     )
 
-    # --- お気に入りセクションの表示 ---
-    if favorite_codes: # お気に入りが1つでもある場合のみ表示
-        fav_tiles = []
-        for code in favorite_codes:
-            # 地域コードから名前を取得する（offices辞書を使う）
-            if code in offices:
-                name = offices[code]["name"]
-                # お気に入り用のListTile作成
-                tile = ft.ListTile(
-                    leading=ft.Icon(ft.Icons.STAR, size=16, color=ft.Colors.AMBER), # 星アイコン
-                    title=ft.Text(name, color=ft.Colors.WHITE, size=14, weight="bold"),
-                    data=code,
-                    on_click=on_tile_click,
-                    hover_color=ft.Colors.with_opacity(0.1, ft.Colors.WHITE),
-                    bgcolor=ft.Colors.with_opacity(0.1, ft.Colors.AMBER) # 少し背景色をつける
-                )
-                fav_tiles.append(tile)
-        
-        # お気に入りリストをまとめる
-        sidebar_controls.append(
-            ft.ExpansionTile(
-                leading=ft.Icon(ft.Icons.BOOKMARK, color=ft.Colors.AMBER),
-                title=ft.Text("お気に入り", weight="bold"),
-                controls=fav_tiles,
-                collapsed_text_color=ft.Colors.AMBER,
-                text_color=ft.Colors.AMBER,
-                icon_color=ft.Colors.AMBER,
-                collapsed_icon_color=ft.Colors.AMBER,
-                initially_expanded=True # 最初から開いておく
-            )
-        )
-        # 区切り線を入れる
-        sidebar_controls.append(ft.Divider(color=ft.Colors.BLUE_GREY_700))
+# お気に入り1件分のListTileを作成する関数
+def create_favorite_tile(code, name, on_tile_click):
+    return ft.ListTile(
+        leading=ft.Icon(ft.Icons.STAR, size=16, color=ft.Colors.AMBER), # 星アイコン
+        title=ft.Text(name, color=ft.Colors.WHITE, size=14, weight="bold"),
+        data=code,
+        on_click=on_tile_click,
+        hover_color=ft.Colors.with_opacity(0.1, ft.Colors.WHITE),
+        bgcolor=ft.Colors.with_opacity(0.1, ft.Colors.AMBER) # 少し背景色をつける
+    )
+
+# お気に入りセクション（見出しのExpansionTileと区切り線）を作成する関数
+# 中身のListTileは後から追加・削除するので、空の状態で作る
+# 戻り値は (セクション全体, お気に入りのListTileを入れるExpansionTile)
+def create_favorites_section():
+    favorites_tile = ft.ExpansionTile(
+        leading=ft.Icon(ft.Icons.BOOKMARK, color=ft.Colors.AMBER),
+        title=ft.Text("お気に入り", weight="bold"),
+        controls=[],
+        collapsed_text_color=ft.Colors.AMBER,
+        text_color=ft.Colors.AMBER,
+        icon_color=ft.Colors.AMBER,
+        collapsed_icon_color=ft.Colors.AMBER,
+        initially_expanded=True # 最初から開いておく
+    )
+    # お気に入りが1つもないときは、セクションごと隠しておく
+    section = ft.Column(
+        [favorites_tile, ft.Divider(color=ft.Colors.BLUE_GREY_700)], # 区切り線を入れる
+        spacing=0,
+        visible=False,
+    )
+    return section, favorites_tile
+
+# サイドバーの検索欄を作成する関数
+def create_search_field(on_change):
+    return ft.Container(
+        content=ft.TextField(
+            hint_text="地域名・読みがなで検索",
+            prefix_icon=ft.Icons.SEARCH,
+            dense=True,
+            color=ft.Colors.WHITE,
+            border_color=ft.Colors.BLUE_GREY_600,
+            on_change=on_change,
+        ),
+        padding=ft.padding.symmetric(horizontal=10, vertical=8),
+    )
+
+# 通常の地域リスト（地方ごとのExpansionTile）を作成する関数
+# 地域の索引（region_index）から、地方とその中の都道府県を順番に取り出して組み立てる
+def create_region_controls(region_index, on_tile_click):
+    region_controls = []
 
-    # --- 通常の地域リスト ---
     # 地方（centers）ごとにループ処理を行う
-    for center_code, center_info in centers.items():
-        # その地方に含まれる都道府県（子供の要素）のコードリストを取得する
-        child_codes = center_info["children"]
-        
+    for center_code, center_name in region_index.centers():
         # 都道府県ごとのListTileを入れるリストを作る
         prefecture_tiles = []
         
-        for child_code in child_codes:
-            # officesの中に詳細情報があればリストに追加する
-            if child_code in offices:
-                office_name = offices[child_code]["name"]
-                
-                # ListTileを作成する
-                # data属性にコードを持たせておき、クリック時に使えるようにする
-                # デザイン変更: アイコンを追加し、クリック時の色設定を追加
-                tile = ft.ListTile(
-                    leading=ft.Icon(ft.Icons.LOCATION_CITY, size=16, color=ft.Colors.BLUE_GREY_200),
-                    title=ft.Text(office_name, color=ft.Colors.BLUE_GREY_100, size=14),
-                    data=child_code,
-                    on_click=on_tile_click,
-                    hover_color=ft.Colors.with_opacity(0.1, ft.Colors.WHITE)
-                )
-                prefecture_tiles.append(tile)
+        # その地方に含まれる都道府県（子供の要素）のコードと名前を取得する
+        for child_code, office_name in region_index.offices_in(center_code):
+            # ListTileを作成する
+            # data属性にコードを持たせておき、クリック時に使えるようにする
+            # デザイン変更: アイコンを追加し、クリック時の色設定を追加
+            tile = ft.ListTile(
+                leading=ft.Icon(ft.Icons.LOCATION_CITY, size=16, color=ft.Colors.BLUE_GREY_200),
+                title=ft.Text(office_name, color=ft.Colors.BLUE_GREY_100, size=14),
+                data=child_code,
+                on_click=on_tile_click,
+                hover_color=ft.Colors.with_opacity(0.1, ft.Colors.WHITE)
+            )
+            prefecture_tiles.append(tile)
         
         # ExpansionTile（開閉可能なリスト）を作成し、その中に都道府県リストを入れる
         # 地方名（関東甲信地方など）をタイトルにする
         # デザイン変更: 色とアイコンを調整して視認性を向上
         expansion_tile = ft.ExpansionTile(
             leading=ft.Icon(ft.Icons.MAP_OUTLINED, color=ft.Colors.WHITE),
-            title=ft.Text(center_info["name"], weight="bold"),
+            title=ft.Text(center_name, weight="bold"),
             controls=prefecture_tiles,
             collapsed_text_color=ft.Colors.WHITE,
             text_color=ft.Colors.LIGHT_BLUE_200,
             icon_color=ft.Colors.WHITE,
             collapsed_icon_color=ft.Colors.WHITE,
         )
-        sidebar_controls.append(expansion_tile)
+        region_controls.append(expansion_tile)
     
     # 組み立てたUIコントロールのリストを返す
-    return sidebar_controls
+    return region_controls
 
 # ---  ここまでが新しいコード  ---
 
 # 天気の文字からアイコンを判定する補助関数（これはデザイン用の追加機能です）
 # 修正: 判定ロジックを強化し、誤判定を防ぐ
 def get_weather_icon(weather_text):
-    # 判定用に不要な文字（スペースなど）を削除してシンプルにする
-    text = weather_text.replace(" ", "").replace("　", "")
-    
+    # 判定用に不要な文字（スペースなど）を削除してから、キャッシュ付きの判定を使う
+    return _weather_icon_for(normalize_weather_text(weather_text))
+
+# get_weather_iconの本体（スペース除去済みの文字をキーにして判定結果を覚えておく）
+@functools.lru_cache(maxsize=1024)
+def _weather_icon_for(text):
     # 特殊な天気の判定を先に行う
     if "雷" in text:
         return ft.Icons.FLASH_ON, ft.Colors.YELLOW_800
@@ -244,39 +301,88 @@ def main(page: ft.Page):
         # 画面を更新して表示を反映させる
         page.update()
 
+    # --- データベースの準備 ---
+    # テーブルがなければ作り、古い weather.db には後から追加したインデックスなどを反映する
+    init_database()
+
     # --- データ取得処理 ---
 
-    # 気象庁の地域リスト（エリア定義）を取得するURL
-    area_url = "http://www.jma.go.jp/bosai/common/const/area.json"
-    
-    # APIから地域データを取得する
-    # requestsを使ってWeb上のデータをJSON形式として読み込む
-    response = requests.get(area_url)
-    area_data = response.json()
+    # サイドバーを描画し終えたかどうか（描画前にバックグラウンド更新が届いた場合に備える）
+    sidebar_ready = False
+
+    # 地域の索引。バックグラウンドの再検証は load_area_data の中で始まるので、
+    # 起動時の索引を作り終える前に新しい地域データが届くこともある。
+    # どちらもロックを持って作り、新しいデータの索引が先にできていれば、起動時の（古い）索引では上書きしない
+    region_index = None
+    region_index_lock = threading.Lock()
+
+    # バックグラウンドで新しい地域データが届いたときに呼ばれる関数
+    def on_area_data_update(new_area_data):
+        nonlocal region_index
+        with region_index_lock:
+            region_index = load_region_index(new_area_data, CACHE_FILE)
+        save_areas(new_area_data["offices"])
+        # すでに画面が出来上がっていれば、サイドバーを新しいデータで描き直す
+        if sidebar_ready:
+            render_sidebar()
+
+    # 地域リスト（エリア定義）を読み込む
+    # ディスクのキャッシュ（なければareasテーブル）を使うので、起動時に通信を待たない
+    # キャッシュが古い場合はバックグラウンドでETag/Last-Modifiedを使って再検証する
+    area_data, area_source = load_area_data(on_update=on_area_data_update)
 
     # 「centers」が地方（関東、近畿など）、「offices」が都道府県ごとの気象台を表している
-    centers = area_data["centers"]
-    offices = area_data["offices"]
+    # 名前の逆引きや親子をたどるたびに辞書を引かなくて済むよう、索引にしておく
+    # （キャッシュファイルから読んだときは、前回保存した索引を読むだけで済む）
+    with region_index_lock:
+        if region_index is None:
+            region_index = load_region_index(area_data, CACHE_FILE if area_source != "db" else None)
 
     # --- 取得した地域情報をデータベースに保存する ---
-    # データベースに接続する
-    conn = sqlite3.connect('weather.db')
-    cursor = conn.cursor()
-
-    # 取得したoffices（都道府県ごとの情報）をループしてデータベースに登録する
-    for code, info in offices.items():
-        name = info["name"]
-        # 重複してもエラーにならないよう INSERT OR IGNORE を使う
-        # areasテーブルに地域コードと地域名を保存する
-        cursor.execute("INSERT OR IGNORE INTO areas (area_code, area_name) VALUES (?, ?)", (code, name))
-    
-    # 変更を確定して接続を閉じる
-    conn.commit()
-    conn.close()
+    # 気象庁から新しく取得したときだけ保存する（キャッシュから読んだときは保存済み）
+    if area_source == "network":
+        save_areas(area_data["offices"])
 
     # --- お気に入り機能用の変数 ---
     # お気に入りに登録された地域コードを保存するセット（重複しないリストのようなもの）
-    favorite_codes = set()
+    # お気に入りはweather.dbのfavoritesテーブルに保存してあるので、起動時に読み込む
+    favorite_codes = set(load_favorites())
+
+    # --- お気に入りボタンの処理 ---
+    # お気に入りボタン（星）を作成する関数
+    def create_favorite_button(region_code):
+        button = ft.IconButton(
+            icon_size=30,
+            tooltip="お気に入りに追加/解除",
+            on_click=toggle_favorite,
+            data=region_code # ボタンにも地域コードを持たせる
+        )
+        set_favorite_button_state(button, region_code in favorite_codes)
+        return button
+
+    # お気に入りボタンが押されたときの関数
+    # 星ボタンとサイドバーのお気に入りセクションだけを書き換え、予報の再取得や画面全体の作り直しはしない
+    def toggle_favorite(e):
+        region_code = e.control.data
+        # 状態を反転させ、weather.dbにも保存する
+        if region_code in favorite_codes:
+            favorite_codes.remove(region_code)
+            remove_favorite(region_code)
+            message = "お気に入りから解除しました"
+        else:
+            favorite_codes.add(region_code)
+            add_favorite(region_code)
+            message = "お気に入りに追加しました"
+            # 追加したお気に入りをすぐに先読みしてもらう
+            prefetch_scheduler.refresh_now()
+
+        # 星の色を変える
+        set_favorite_button_state(e.control, region_code in favorite_codes)
+        # お気に入りセクションの中身を合わせる
+        sync_favorites_section()
+        # 追加機能: 追加・解除したことを画面下のメッセージでユーザーに伝える
+        # （show_message の page.update() で、星ボタンとお気に入りセクションの変更もまとめて送られる）
+        show_message(message)
 
     # --- 追加機能: 過去の予報閲覧機能のためのグローバル変数 ---
     # 現在選択されている地域のコードを保持するための変数。
@@ -285,12 +391,19 @@ def main(page: ft.Page):
     # --- UIパーツの定義 ---
 
     # --- 日付選択用のドロップダウンメニュー ---
+    # 取得日時は何万件にもなり得るので、選択肢には HISTORY_PAGE_SIZE 件ずつ（1ページ分）だけを入れる
     date_dropdown = ft.Dropdown(
         label="過去の取得日時を選択",
         options=[],
-        visible=False,
         width=300,
     )
+    # 前後のページに移動するボタン
+    newer_button = ft.IconButton(icon=ft.Icons.CHEVRON_LEFT, tooltip="新しい履歴")
+    older_button = ft.IconButton(icon=ft.Icons.CHEVRON_RIGHT, tooltip="古い履歴")
+    # 履歴の操作部分（ボタンとドロップダウン）をまとめたもの
+    history_bar = ft.Row([newer_button, date_dropdown, older_button], visible=False)
+    # 今ドロップダウンに入っている取得日時（新しい順）
+    history_times = []
     
     # 天気予報を表示するエリア（右側のメイン画面）
     # 初期状態では「地域を選択してください」と表示しておく
@@ -316,36 +429,37 @@ def main(page: ft.Page):
         )
     )
 
+    # --- 追加機能: 予報の読み込みを裏で行うための仕組み ---
+    # 最後にクリックした地域の結果だけが画面に反映される
+    forecast_loader = LatestOnlyLoader()
+
     # --- サイドバー更新用の関数定義 ---
-    # お気に入りが変更されるたびにサイドバーを作り直す必要があるため、関数化します
+    # サイドバーは最初に1回だけ組み立て、お気に入りが変更されたときはお気に入りの部分だけを更新する
     sidebar_column = ft.Column(scroll=ft.ScrollMode.AUTO, spacing=0)
+
+    # お気に入りセクションは1回だけ作り、中身のListTileだけを出し入れする
+    favorites_section, favorites_tile = create_favorites_section()
+    # 地域コード → お気に入りのListTile（どのListTileを取り除けばよいか探すため）
+    favorite_tiles = {}
+    # 地域リストの検索欄（1回だけ作り、サイドバーを描き直しても入力した文字が残るようにする）
+    search_field = create_search_field(lambda e: on_search_change(e))
+    # 地方ごとのExpansionTileのリスト（検索で絞り込むときに使う）
+    region_controls = []
     
     # --- 追加機能: 過去の予報を表示するための新しい関数 ---
     def display_forecast_from_db(region_code, fetched_at):
         # UIの部品にアクセスするため、親関数からいくつかの変数を参照する
-        nonlocal weather_column, offices, favorite_codes
+        nonlocal weather_column, favorite_codes
         
         # 地域名を取得する
-        region_name = offices[region_code]["name"]
+        region_name = region_index.name_of(region_code)
         
         # 画面の表示を一度クリアする
         weather_column.controls.clear()
         
         try:
-            # データベースに接続する
-            conn = sqlite3.connect('weather.db')
-            cursor = conn.cursor()
-            
             # 指定された地域コードと取得日時(fetched_at)に合致する予報データをDBから取得する
-            cursor.execute("""
-                SELECT target_date, weather_text 
-                FROM forecasts 
-                WHERE area_code = ? AND fetched_at = ?
-            """, (region_code, fetched_at))
-            
-            # 検索結果をすべて取得する
-            db_results = cursor.fetchall()
-            conn.close()
+            db_results = load_forecast(region_code, fetched_at)
             
             # データベースにデータがなかった場合の処理
             if not db_results:
@@ -356,35 +470,20 @@ def main(page: ft.Page):
             # --- ここから下のUI構築ロジックは、show_forecast関数とほぼ同じ ---
             # (ただし、APIアクセスやDB保存は行わず、DBから取得したデータを表示するだけ)
 
-            is_favorite = region_code in favorite_codes
-            fav_icon = ft.Icons.STAR if is_favorite else ft.Icons.STAR_BORDER
-            fav_color = ft.Colors.AMBER if is_favorite else ft.Colors.GREY
-
-            def toggle_favorite(e):
-                if region_code in favorite_codes:
-                    favorite_codes.remove(region_code)
-                    show_message("お気に入りから解除しました")
-                else:
-                    favorite_codes.add(region_code)
-                    show_message("お気に入りに追加しました")
-                render_sidebar()
-                # 状態を更新するために、最新の予報を再表示する
-                show_forecast(e)
-
             header = ft.Container(
                 content=ft.Row([
                     ft.Icon(ft.Icons.LOCATION_ON, color=ft.Colors.RED_400, size=30),
                     ft.Text(f"{region_name}の天気予報", size=28, weight="bold", color=ft.Colors.BLUE_GREY_900, expand=True),
-                    ft.IconButton(
-                        icon=fav_icon, icon_color=fav_color, icon_size=30,
-                        tooltip="お気に入りに追加/解除", on_click=toggle_favorite, data=region_code
-                    )
+                    create_favorite_button(region_code)
                 ]),
                 padding=ft.padding.only(bottom=20)
             )
             
+            # いつ取得したデータなのかを表示する（先読みしたデータを表示する場合もあるため）
+            updated_text = ft.Text(f"最終更新: {fetched_at}", size=14, color=ft.Colors.GREY_600)
+
             # 日付ドロップダウンをヘッダーに追加
-            weather_column.controls.extend([header, date_dropdown])
+            weather_column.controls.extend([header, updated_text, history_bar])
 
             cards_row = ft.Row(wrap=True, spacing=20, run_spacing=20)
             
@@ -410,11 +509,64 @@ def main(page: ft.Page):
         # 現在選択中の地域コード(current_selected_code)と、選択された取得日時を元に、
         # 過去の予報表示関数を呼び出す。
         if current_selected_code and selected_fetched_at:
+            # 読み込み中の最新予報があっても、選んだ日時の表示を優先する
+            forecast_loader.cancel()
             display_forecast_from_db(current_selected_code, selected_fetched_at)
 
     # ドロップダウンのon_changeイベントに、作成した関数を割り当てる。
     date_dropdown.on_change = on_date_dropdown_change
 
+    # --- 追加機能: 取得日時の1ページ分をドロップダウンに入れる関数 ---
+    def show_history_page(times, has_older, has_newer, selected_fetched_at):
+        history_times[:] = times
+
+        # ドロップダウンの選択肢を、このページの日時だけで作り直す。
+        # ft.dropdown.Optionのtextとkeyの両方に日時文字列を設定する。
+        date_dropdown.options = [ft.dropdown.Option(key=t, text=t) for t in times]
+        # 表示中の日時がこのページにあれば選択状態にする。
+        date_dropdown.value = selected_fetched_at if selected_fetched_at in times else None
+
+        # これ以上前後のページがないときはボタンを押せないようにする
+        older_button.disabled = not has_older
+        newer_button.disabled = not has_newer
+        # ドロップダウンを画面に表示する(visible=True)。
+        history_bar.visible = True
+
+    # --- 追加機能: 過去の取得日時をDBから取得し、ドロップダウンを更新する関数 ---
+    # 表示する日時(selected_fetched_at)から古い方に1ページ分だけ読み込む
+    def update_date_dropdown(region_code, selected_fetched_at):
+        times, has_older = fetch_times_before(
+            region_code, before=selected_fetched_at, limit=HISTORY_PAGE_SIZE, inclusive=True
+        )
+        # さらに新しい取得日時があるかどうかは、1件だけ読んで確かめる
+        has_newer = bool(times) and bool(fetch_times_after(region_code, times[0], limit=1)[0])
+        show_history_page(times, has_older, has_newer, selected_fetched_at)
+
+    # 「古い履歴」ボタン: 今のページの一番古い日時より前の1ページを読む
+    def on_older_click(e):
+        if not current_selected_code or not history_times:
+            return
+        times, has_older = fetch_times_before(
+            current_selected_code, before=history_times[-1], limit=HISTORY_PAGE_SIZE
+        )
+        if times:
+            show_history_page(times, has_older, True, date_dropdown.value)
+            history_bar.update()
+
+    # 「新しい履歴」ボタン: 今のページの一番新しい日時より後の1ページを読む
+    def on_newer_click(e):
+        if not current_selected_code or not history_times:
+            return
+        times, has_newer = fetch_times_after(
+            current_selected_code, after=history_times[0], limit=HISTORY_PAGE_SIZE
+        )
+        if times:
+            show_history_page(times, True, has_newer, date_dropdown.value)
+            history_bar.update()
+
+    older_button.on_click = on_older_click
+    newer_button.on_click = on_newer_click
+
     # 天気情報を取得・表示する関数（ListTileをクリックしたときに動く）
     # 関数内で関数を使うため、先に定義。
     def show_forecast(e):
@@ -432,8 +584,18 @@ def main(page: ft.Page):
         if isinstance(e.control, ft.ListTile):
             region_name = e.control.title.value
         else:
-            # ボタンなどの場合、辞書から名前を逆引きする（簡易的な実装）
-            region_name = offices[region_code]["name"]
+            # ボタンなどの場合、地域の索引から名前を逆引きする
+            region_name = region_index.name_of(region_code)
+
+        # --- 追加機能: お気に入りはバックグラウンドで先読みしているので、通信せずDBからすぐに表示する ---
+        if region_code in favorite_codes:
+            latest_fetched_at = latest_fetch_time(region_code)
+            if latest_fetched_at:
+                # 前にクリックした地域の読み込みが残っていれば、その結果は反映しないようにする
+                forecast_loader.cancel()
+                update_date_dropdown(region_code, latest_fetched_at)
+                display_forecast_from_db(region_code, latest_fetched_at)
+                return
         
         # 画面の表示を一度クリアする
         weather_column.controls.clear()
@@ -441,130 +603,56 @@ def main(page: ft.Page):
         weather_column.controls.append(ft.ProgressBar(width=None, color=ft.Colors.BLUE))
         page.update()
 
-        try:
-            # 選択された地域の天気予報JSONを取得するURLを作成する
-            forecast_url = f"https://www.jma.go.jp/bosai/forecast/data/forecast/{region_code}.json"
-            forecast_res = requests.get(forecast_url)
-            forecast_data = forecast_res.json()
-
-            # 取得したデータから必要な情報を取り出す
-            # データ構造: [0] -> timeSeries[0] -> areas[0] -> weathers (天気の配列)
-            # ※気象庁のJSONは複雑なため、ここでは一番手前の「詳細な天気」を取得する
-            time_series = forecast_data[0]["timeSeries"][0]
-            weather_list = time_series["areas"][0]["weathers"]
-            time_defines = time_series["timeDefines"]
-
-            # --- 追加機能: データベースへの保存と読み出し ---
-            
-            # 取得したAPIデータをデータベースに保存する
-            conn = sqlite3.connect('weather.db')
-            cursor = conn.cursor()
+        # --- 追加機能: 通信・保存は別のスレッドで行う ---
+        # ここではすぐに関数を抜けるので、ProgressBarが止まらず、続けて別の地域をクリックできる
+        # 別の地域がクリックされた場合、この地域の結果は画面に反映されない
+        def load(is_cancelled):
+            # 選択された地域の天気予報JSONを取得する
+            forecast_data = fetch_forecast(region_code)
+
+            # 取得している間に別の地域が選ばれていたら、保存もせずに終わる
+            if is_cancelled():
+                return None
+
+            # --- 追加機能: データベースへの保存 ---
             
             # データをいつ取得したか記録するために現在時刻を取得する
             current_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-            # 天気リスト（3日分など）をループして1件ずつ保存する
-            for i in range(len(weather_list)):
-                w_text = weather_list[i]
-                w_date = time_defines[i]
-                
-                # forecastsテーブルに、地域コード、日付、天気、取得日時を保存する
-                # weather_codeは今回は仮で空文字にしている
-                cursor.execute("""
-                    INSERT INTO forecasts (area_code, target_date, weather_text, weather_code, fetched_at)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (region_code, w_date, w_text, "", current_time))
-            
-            # 保存を確定する
-            conn.commit()
-        
-            # --- 追加機能: 過去の取得日時をDBから取得し、ドロップダウンを更新 ---
-            # これから表示する地域(region_code)について、過去にDBに保存された
-            # 全ての取得日時(fetched_at)を重複なく(DISTINCT)、新しい順(DESC)に取得する。
-            cursor.execute("""
-                SELECT DISTINCT fetched_at 
-                FROM forecasts 
-                WHERE area_code = ? 
-                ORDER BY fetched_at DESC
-            """, (region_code,))
-            
-            # 取得した日時データをリストに格納する。
-            past_dates = [row[0] for row in cursor.fetchall()]
-
-            # ドロップダウンの選択肢をクリアし、新しく取得した日時のリストで更新する。
-            date_dropdown.options.clear()
-            for past_date in past_dates:
-                # ft.dropdown.Optionのtextとkeyの両方に日時文字列を設定する。
-                date_dropdown.options.append(ft.dropdown.Option(key=past_date, text=past_date))
-
-            # ドロップダウンの値を、今回取得した最新の日時(current_time)に設定する。
-            date_dropdown.value = current_time
-            # ドロップダウンを画面に表示する(visible=True)。
-            date_dropdown.visible = True
-            
-            # 画面表示用にデータベースからデータを読み込む
-            # 今回保存したばかりのデータ（fetched_atがcurrent_timeと同じもの）を取得する
+            # 予報JSONの全体（気温・降水確率・週間予報なども含む）を1回のトランザクションでまとめて保存する
+            # 画面に表示する日付と天気のリストが返ってくるので、保存直後にSELECTで読み直す必要はない
             # ※これが「データベースに保存したものを表示する」という要件になる
-            cursor.execute("""
-                SELECT target_date, weather_text 
-                FROM forecasts 
-                WHERE area_code = ? AND fetched_at = ?
-            """, (region_code, current_time))
-            
-            # 検索結果をすべて取得する
-            db_results = cursor.fetchall()
-            
-            # 接続を閉じる
-            conn.close()
+            db_results = save_forecast(region_code, forecast_data, current_time)
+            return current_time, db_results
+
+        forecast_loader.submit(
+            load,
+            on_done=lambda result: render_forecast(region_code, region_name, *result),
+            on_error=render_forecast_error,
+        )
+
+    # 取得・保存が終わった予報を画面に表示する関数（最新の依頼のときだけ呼ばれる）
+    def render_forecast(region_code, region_name, current_time, db_results):
+        try:
+            # --- 追加機能: 過去の取得日時をDBから取得し、ドロップダウンを更新 ---
+            # 今回取得した最新の日時(current_time)を選択状態にする。
+            update_date_dropdown(region_code, current_time)
 
             # タイトルを更新する
             weather_column.controls.clear()
             
-            # --- お気に入りボタンの処理 ---
-            # 現在の地域がお気に入りに含まれているか確認する
-            is_favorite = region_code in favorite_codes
-            # アイコンの状態を決める（お気に入りなら塗りつぶし星、そうでなければ枠線のみ）
-            fav_icon = ft.Icons.STAR if is_favorite else ft.Icons.STAR_BORDER
-            fav_color = ft.Colors.AMBER if is_favorite else ft.Colors.GREY
-
-            # お気に入りボタンが押されたときの関数
-            def toggle_favorite(e):
-                # 状態を反転させる
-                if region_code in favorite_codes:
-                    favorite_codes.remove(region_code)
-                    # 追加機能: 解除したことを画面下のメッセージでユーザーに伝える
-                    show_message("お気に入りから解除しました")
-                else:
-                    favorite_codes.add(region_code)
-                    # 追加機能: 追加したことを画面下のメッセージでユーザーに伝える
-                    show_message("お気に入りに追加しました")
-                
-                # サイドバーを更新して、お気に入りリストに反映させる
-                render_sidebar()
-                
-                # 現在表示中の天気画面も再描画して、星の色を変える
-                # （show_forecastをもう一度呼ぶことで画面全体を更新する）
-                show_forecast(e)
-
             # デザイン変更: ヘッダー部分をリッチにする
             header = ft.Container(
                 content=ft.Row([
                     ft.Icon(ft.Icons.LOCATION_ON, color=ft.Colors.RED_400, size=30),
                     ft.Text(f"{region_name}の天気予報", size=28, weight="bold", color=ft.Colors.BLUE_GREY_900, expand=True),
                     # ここにお気に入りボタンを追加
-                    ft.IconButton(
-                        icon=fav_icon,
-                        icon_color=fav_color,
-                        icon_size=30,
-                        tooltip="お気に入りに追加/解除",
-                        on_click=toggle_favorite,
-                        data=region_code # ボタンにも地域コードを持たせる
-                    )
+                    create_favorite_button(region_code)
                 ]),
                 padding=ft.padding.only(bottom=20)
             )
             #  日付ドロップダウンをヘッダーの下に追加 
-            weather_column.controls.extend([header, date_dropdown])
+            weather_column.controls.extend([header, history_bar])
 
             # 天気予報の数だけループして表示を作る
             # デザイン変更: Rowを使ってカードを横並び（レスポンシブ）っぽく配置するコンテナを用意
@@ -590,34 +678,81 @@ def main(page: ft.Page):
             weather_column.controls.append(cards_row)
 
         except Exception as err:
-            # エラーが起きた場合は画面に表示する
-            weather_column.controls.clear()
-            # エラー発生時はドロップダウンを隠す
-            date_dropdown.visible = False
-            weather_column.controls.append(
-                ft.Container(
-                    content=ft.Text(f"エラーが発生しました: {err}", color=ft.Colors.WHITE),
-                    bgcolor=ft.Colors.RED_400,
-                    padding=10,
-                    border_radius=5
-                )
-            )
+            render_forecast_error(err)
+            return
         
         # 画面を更新して変更を反映する
         page.update()
 
+    # 取得・保存の途中でエラーが起きた場合に、画面に表示する関数
+    def render_forecast_error(err):
+        weather_column.controls.clear()
+        # エラー発生時はドロップダウンを隠す
+        history_bar.visible = False
+        weather_column.controls.append(
+            ft.Container(
+                content=ft.Text(f"エラーが発生しました: {err}", color=ft.Colors.WHITE),
+                bgcolor=ft.Colors.RED_400,
+                padding=10,
+                border_radius=5
+            )
+        )
+        # 画面を更新して変更を反映する
+        page.update()
+
     # --- サイドバーを構築する関数 ---
+    # 地域リスト全体を組み立てる（起動時と、地域データそのものが変わったときだけ呼ぶ）
     def render_sidebar():
         # 一度中身を空にする
         sidebar_column.controls.clear()
+        favorite_tiles.clear()
+        favorites_tile.controls.clear()
+        sync_favorites_section()
         
         # 長いUI構築ロジックの代わりに、新しい関数を呼び出すだけにする。
         # show_forecast関数を渡すことで、クリックイベントを正しく設定できる。
-        controls = create_sidebar_controls(centers, offices, favorite_codes, show_forecast)
-        sidebar_column.controls.extend(controls)
+        sidebar_column.controls.append(create_sidebar_title())
+        sidebar_column.controls.append(search_field)
+        sidebar_column.controls.append(favorites_section)
+        region_controls.clear()
+        region_controls.extend(create_region_controls(region_index, show_forecast))
+        sidebar_column.controls.extend(region_controls)
+        # 検索欄に文字が入っていれば、描き直した一覧にも同じ絞り込みをかける
+        apply_region_filter(search_field.content.value)
         # サイドバー部分を更新
         sidebar_column.update()
 
+    # 検索欄に入力された文字で、地域リストを絞り込む関数（画面の更新はしない）
+    # 一覧は作り直さず、一致しない地域と、一致する地域が1つもない地方を隠すだけにする
+    def apply_region_filter(query):
+        matches = set(region_index.search(query)) if query and query.strip() else None
+        for expansion_tile in region_controls:
+            any_visible = False
+            for tile in expansion_tile.controls:
+                tile.visible = matches is None or tile.data in matches
+                any_visible = any_visible or tile.visible
+            expansion_tile.visible = any_visible
+
+    # 検索欄の文字が変わるたびに呼ばれる関数
+    def on_search_change(e):
+        apply_region_filter(e.control.value)
+        sidebar_column.update()
+
+    # お気に入りセクションの中身を favorite_codes に合わせる関数（画面の更新はしない）
+    # 増えた地域のListTileだけを追加し、減った地域のListTileだけを取り除く
+    def sync_favorites_section():
+        for code in list(favorite_tiles):
+            if code not in favorite_codes:
+                favorites_tile.controls.remove(favorite_tiles.pop(code))
+        for code in favorite_codes:
+            # 地域コードから名前を取得する（地域の索引を使う）
+            if code not in favorite_tiles and region_index.name_of(code):
+                tile = create_favorite_tile(code, region_index.name_of(code), show_forecast)
+                favorite_tiles[code] = tile
+                favorites_tile.controls.append(tile)
+        # お気に入りが1つでもある場合のみ表示
+        favorites_section.visible = bool(favorite_tiles)
+
     # --- 初回起動時の処理 ---
     
     # サイドバー部分のコンテナを作成
@@ -647,6 +782,20 @@ def main(page: ft.Page):
     
     # ページに追加した後にサイドバーの中身を描画する（これでupdateが機能する）
     render_sidebar()
+    sidebar_ready = True
+
+    # --- 追加機能: お気に入りの予報をバックグラウンドで定期的に先読みする ---
+    # 同時に通信する数を制限し、取得間隔は少しずつばらつかせる
+    prefetch_scheduler = PrefetchScheduler(get_codes=lambda: list(favorite_codes))
+    prefetch_scheduler.start()
+    # アプリを閉じたら先読みと読み込み用のスレッドも止める
+    def on_page_close(e):
+        prefetch_scheduler.stop()
+        forecast_loader.shutdown()
+
+    page.on_close = on_page_close
 
 # アプリを実行する
-ft.app(target=main)
\ No newline at end of file
+# （benchmark.py などから部品だけを読み込んだときは、アプリを起動しない）
+if __name__ == "__main__":
+    ft.app(target=main)
\ No newline at end of file
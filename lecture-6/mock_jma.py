@@ -0,0 +1,286 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 気象庁のサーバーの代わりに、手元で地域データと天気予報JSONを返す模擬サーバー
+# ネットワークにつながっていなくても、アプリや benchmark.py の動作を確かめられる
+#   - fixtures/ に記録したJSON（--record で本物から保存できる）があればそれを返す
+#   - なければ、気象庁と同じ形のJSONをその場で作って返す
+#   - 応答の遅れ（--latency）や、一定の割合で失敗させること（--failure-rate）もできる
+#
+# 使い方:
+#   python mock_jma.py --port 8765 --latency 0.2 --failure-rate 0.1
+#   JMA_BASE_URL=http://127.0.0.1:8765 python main.py
+#
+# 本物のデータを記録する: python mock_jma.py --record
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+AREA_PATH = "/bosai/common/const/area.json"
+FORECAST_PATH = re.compile(r"^/bosai/forecast/data/forecast/(\d+)\.json$")
+
+# 記録したデータがないときに作る地域の数（都道府県の数に合わせる）
+SYNTHETIC_OFFICE_COUNT = 47
+
+_WEATHERS = [
+    ("100", "晴れ"),
+    ("101", "晴れ　時々　くもり"),
+    ("200", "くもり"),
+    ("202", "くもり　一時　雨"),
+    ("300", "雨"),
+    ("313", "雨　後　くもり"),
+    ("400", "雪"),
+]
+
+
+# 記録したデータがないときの地域データ（area.json と同じ形）を作る関数
+def synthetic_area_data(office_count=SYNTHETIC_OFFICE_COUNT):
+    centers = {}
+    offices = {}
+    class10s = {}
+    for i in range(1, office_count + 1):
+        office_code = f"{i:02d}0000"
+        center_code = f"0{(i - 1) // 10 + 1}0100"
+        center = centers.setdefault(center_code, {
+            "name": f"模擬地方{(i - 1) // 10 + 1}",
+            "children": [],
+        })
+        center["children"].append(office_code)
+
+        class10_code = f"{i:02d}0010"
+        offices[office_code] = {
+            "name": f"模擬県{i}",
+            "parent": center_code,
+            "children": [class10_code],
+        }
+        class10s[class10_code] = {"name": f"模擬県{i}北部", "parent": office_code}
+    return {"centers": centers, "offices": offices, "class10s": class10s}
+
+
+# 記録したデータがないときの天気予報JSON（forecast/{code}.json と同じ形）を作る関数
+# revision を変えると内容（天気・発表日時）が変わる。同じ revision なら毎回同じ内容を返す
+def synthetic_forecast(region_code, revision=0, now=None):
+    rng = random.Random(f"{region_code}:{revision}")
+    now = now or time.time()
+    today = time.strftime("%Y-%m-%d", time.localtime(now))
+    base = time.mktime(time.strptime(today, "%Y-%m-%d"))
+
+    def day(offset, hour=0):
+        return time.strftime(f"%Y-%m-%dT{hour:02d}:00:00+09:00", time.localtime(base + offset * 86400))
+
+    sub_area = {"code": region_code[:2] + "0010", "name": "模擬地域"}
+    station = {"code": region_code[:2] + "000", "name": "模擬観測点"}
+    daily = [rng.choice(_WEATHERS) for _ in range(3)]
+    weekly = [rng.choice(_WEATHERS) for _ in range(7)]
+
+    return [
+        {
+            "publishingOffice": "模擬気象台",
+            "reportDatetime": day(0, 5 + revision % 12),
+            "timeSeries": [
+                {
+                    "timeDefines": [day(i) for i in range(3)],
+                    "areas": [{
+                        "area": sub_area,
+                        "weatherCodes": [code for code, _ in daily],
+                        "weathers": [text for _, text in daily],
+                        "winds": ["北の風" for _ in daily],
+                        "waves": ["１メートル" for _ in daily],
+                    }],
+                },
+                {
+                    "timeDefines": [day(i // 4, (i % 4) * 6) for i in range(8)],
+                    "areas": [{"area": sub_area, "pops": [str(rng.randrange(0, 101, 10)) for _ in range(8)]}],
+                },
+                {
+                    "timeDefines": [day(1, 0), day(1, 9)],
+                    "areas": [{"area": station, "temps": [str(rng.randint(-5, 10)), str(rng.randint(5, 25))]}],
+                },
+            ],
+        },
+        {
+            "publishingOffice": "模擬気象台",
+            "reportDatetime": day(0, 11),
+            "timeSeries": [
+                {
+                    "timeDefines": [day(i) for i in range(7)],
+                    "areas": [{
+                        "area": sub_area,
+                        "weatherCodes": [code for code, _ in weekly],
+                        "pops": ["", *[str(rng.randrange(0, 101, 10)) for _ in range(6)]],
+                        "reliabilities": ["", "", *[rng.choice("ABC") for _ in range(5)]],
+                    }],
+                },
+                {
+                    "timeDefines": [day(i) for i in range(7)],
+                    "areas": [{
+                        "area": station,
+                        "tempsMin": ["", *[str(rng.randint(-5, 10)) for _ in range(6)]],
+                        "tempsMax": ["", *[str(rng.randint(5, 25)) for _ in range(6)]],
+                    }],
+                },
+            ],
+        },
+    ]
+
+
+# fixtures/ に記録したJSONを読む関数（ないときは None）
+def _read_fixture(fixtures_dir, *parts):
+    try:
+        with open(os.path.join(fixtures_dir, *parts), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class MockJMAHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        options = self.server.options
+        self.server.count_request()
+
+        # 応答の遅れを再現する（latency を中心に ±50% ばらつかせる）
+        if options["latency"] > 0:
+            time.sleep(options["latency"] * random.uniform(0.5, 1.5))
+
+        # 一定の割合で、混雑しているときのエラー（503）を返す
+        if random.random() < options["failure_rate"]:
+            self._send(503, b'{"error": "mock failure"}')
+            return
+
+        if self.path.split("?")[0] == AREA_PATH:
+            body = json.dumps(self.server.area_data, ensure_ascii=False).encode("utf-8")
+            etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+            # 条件付きリクエスト（area_cache.py の再検証）には、変わっていなければ本文なしで答える
+            if self.headers.get("If-None-Match") == etag:
+                self._send(304, b"", etag=etag)
+            else:
+                self._send(200, body, etag=etag)
+            return
+
+        match = FORECAST_PATH.match(self.path.split("?")[0])
+        if match and match.group(1) in self.server.area_data["offices"]:
+            code = match.group(1)
+            forecast_data = _read_fixture(options["fixtures_dir"], "forecast", f"{code}.json")
+            if forecast_data is None:
+                forecast_data = synthetic_forecast(code, self.server.revision_for(code))
+            self._send(200, json.dumps(forecast_data, ensure_ascii=False).encode("utf-8"))
+            return
+
+        self._send(404, b'{"error": "not found"}')
+
+    def _send(self, status, body, etag=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    # リクエストごとのログは表示しない（ベンチマークの邪魔になるため）
+    def log_message(self, format, *args):
+        pass
+
+
+class MockJMAServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # vary=True にすると、同じ地域を取得するたびに予報の内容が変わる（重複しない保存を試すため）
+    def __init__(self, address, latency=0.0, failure_rate=0.0, vary=False, fixtures_dir=FIXTURES_DIR):
+        super().__init__(address, MockJMAHandler)
+        self.options = {
+            "latency": latency,
+            "failure_rate": failure_rate,
+            "vary": vary,
+            "fixtures_dir": fixtures_dir,
+        }
+        self.area_data = _read_fixture(fixtures_dir, "area.json") or synthetic_area_data()
+        self.request_count = 0
+        self._revisions = {}
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count_request(self):
+        with self._lock:
+            self.request_count += 1
+
+    def revision_for(self, code):
+        if not self.options["vary"]:
+            return 0
+        with self._lock:
+            self._revisions[code] = self._revisions.get(code, -1) + 1
+            return self._revisions[code]
+
+
+# 模擬サーバーを別のスレッドで起動して返す関数（port=0 なら空いているポートを使う）
+# 使い終わったら server.shutdown() で止める
+def start_server(port=0, **options):
+    server = MockJMAServer(("127.0.0.1", port), **options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+# 本物の気象庁から地域データと天気予報JSONを取得して fixtures/ に保存する関数
+# limit を指定すると、その数の地域だけ記録する
+def record_fixtures(fixtures_dir=FIXTURES_DIR, limit=None):
+    import requests
+
+    from jma import FORECAST_URL, REQUEST_TIMEOUT
+
+    area_url = "https://www.jma.go.jp" + AREA_PATH
+    area_data = requests.get(area_url, timeout=REQUEST_TIMEOUT).json()
+
+    os.makedirs(os.path.join(fixtures_dir, "forecast"), exist_ok=True)
+    with open(os.path.join(fixtures_dir, "area.json"), "w", encoding="utf-8") as f:
+        json.dump(area_data, f, ensure_ascii=False)
+
+    codes = list(area_data["offices"])[:limit]
+    for code in codes:
+        response = requests.get(FORECAST_URL.format(code=code), timeout=REQUEST_TIMEOUT)
+        if response.status_code != 200:
+            print(f"記録できませんでした（{code}）: {response.status_code}")
+            continue
+        with open(os.path.join(fixtures_dir, "forecast", f"{code}.json"), "w", encoding="utf-8") as f:
+            f.write(response.text)
+        # 気象庁のサーバーに負担をかけないよう、少し間を空ける
+        time.sleep(0.5)
+    return len(codes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="気象庁のAPIの代わりになる模擬サーバー")
+    parser.add_argument("--port", type=int, default=8765, help="待ち受けるポート番号")
+    parser.add_argument("--latency", type=float, default=0.0, help="応答の遅れ（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="503エラーを返す割合（0〜1）")
+    parser.add_argument("--vary", action="store_true", help="取得するたびに予報の内容を変える")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="記録したJSONの保存先フォルダ")
+    parser.add_argument("--record", action="store_true", help="本物の気象庁からJSONを記録して終わる")
+    parser.add_argument("--limit", type=int, default=None, help="記録する地域の数（--record のとき）")
+    args = parser.parse_args()
+
+    if args.record:
+        count = record_fixtures(args.fixtures, args.limit)
+        print(f"{count} 地域分のJSONを {args.fixtures} に記録しました。")
+        raise SystemExit(0)
+
+    server = MockJMAServer(("127.0.0.1", args.port), latency=args.latency, failure_rate=args.failure_rate,
+                           vary=args.vary, fixtures_dir=args.fixtures)
+    print(f"模擬サーバーを起動しました: {server.base_url}")
+    print(f"アプリから使うには: JMA_BASE_URL={server.base_url} python main.py")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
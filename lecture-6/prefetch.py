@@ -0,0 +1,96 @@
+import datetime
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from jma import fetch_forecast
+from storage import save_forecast
+
+# お気に入り地域の予報をバックグラウンドで定期的に取得しておく仕組み
+# 先に取得してweather.dbに保存しておくことで、クリックしたときは通信せずDBから表示できる
+
+# 取得の間隔（秒）と、間隔をばらつかせる割合（0.2なら±20%）
+DEFAULT_INTERVAL = 30 * 60
+DEFAULT_JITTER = 0.2
+# 同時に通信する数の上限
+DEFAULT_MAX_WORKERS = 3
+
+
+class PrefetchScheduler:
+    # get_codes: 取得したい地域コードのリストを返す関数（お気に入りが変わっても毎回最新を使うため）
+    # on_fetched: 1地域の保存が終わるたびに on_fetched(region_code, fetched_at) で呼ばれる関数
+    def __init__(self, get_codes, on_fetched=None, interval=DEFAULT_INTERVAL,
+                 jitter=DEFAULT_JITTER, max_workers=DEFAULT_MAX_WORKERS, db_path=None):
+        self.get_codes = get_codes
+        self.on_fetched = on_fetched
+        self.interval = interval
+        self.jitter = jitter
+        self.max_workers = max_workers
+        self.db_path = db_path
+
+        self._stop_event = threading.Event()
+        # refresh_now() で待ち時間を打ち切るためのイベント
+        self._wake_event = threading.Event()
+        self._thread = None
+
+    # スケジューラーを開始する
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # スケジューラーを止める（実行中の取得が終わるのを待ってから抜ける）
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # 次の周期を待たずに、すぐ取得を始める（お気に入りに追加した直後など）
+    def refresh_now(self):
+        self._wake_event.set()
+
+    # 次の取得までの待ち時間を決める
+    # 全員が同じ間隔で動くとアクセスが同時に集中するので、少しだけばらつかせる
+    def next_delay(self):
+        spread = self.interval * self.jitter
+        return max(0.0, self.interval + random.uniform(-spread, spread))
+
+    # 1地域分の取得と保存
+    def _fetch_one(self, region_code):
+        forecast_data = fetch_forecast(region_code)
+        fetched_at = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        save_forecast(region_code, forecast_data, fetched_at, db_path=self.db_path)
+        return fetched_at
+
+    # お気に入り全部を1回ずつ取得する
+    # 同時に動くのは max_workers 件までに制限される
+    def run_once(self, executor):
+        codes = list(self.get_codes())
+        futures = {executor.submit(self._fetch_one, code): code for code in codes}
+        wait(futures)
+
+        for future, code in futures.items():
+            try:
+                fetched_at = future.result()
+            except Exception as e:
+                # 通信・保存のエラーだけでなく、形の崩れた予報JSONなども、その地域だけの失敗として扱う
+                print(f"先読みに失敗しました（{code}）: {e}")
+                continue
+            if self.on_fetched:
+                self.on_fetched(code, fetched_at)
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while not self._stop_event.is_set():
+                self._wake_event.clear()
+                # 1回分の取得で思わぬエラーが起きても、スレッドを終わらせずに次の周期でまた取得する
+                # （ここで止まると、そのあとアプリを閉じるまで先読みされなくなる）
+                try:
+                    self.run_once(executor)
+                except Exception as e:
+                    print(f"先読みに失敗しました: {e}")
+                # 次の周期まで待つ（refresh_now() か stop() が呼ばれたらすぐ起きる）
+                self._wake_event.wait(self.next_delay())
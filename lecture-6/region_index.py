@@ -0,0 +1,259 @@
+import bisect
+import json
+import os
+import unicodedata
+
+# 地域データ（area.json）から作る、地域を探すための索引
+# area.json は centers → offices → class10s → class15s → class20s と入れ子になっていて、
+# 名前を調べたり親子をたどったりするたびに辞書を何度も引く必要がある。
+# 最初に一度だけ「コード → 名前」「名前 → コード」「親」「子」の表と、検索用の並べ替えたキーの一覧を作っておき、
+# 作った索引はファイルに保存して、次回の起動ではそれを読むだけにする。
+#
+# 検索は、地域名・読みがな・英語名・その中の市区町村名の「前方一致」で行う
+# （例: 「とう」「東京」「tokyo」「しぶや」→ 東京都）
+
+# 索引の形式を変えたときに、古いファイルを使わないようにするための番号
+INDEX_VERSION = 1
+
+# 都道府県などの地域（offices）の読みがな（area.json には入っていないため用意しておく）
+OFFICE_KANA = {
+    "宗谷地方": "そうやちほう",
+    "上川・留萌地方": "かみかわ・るもいちほう",
+    "網走・北見・紋別地方": "あばしり・きたみ・もんべつちほう",
+    "十勝地方": "とかちちほう",
+    "釧路・根室地方": "くしろ・ねむろちほう",
+    "胆振・日高地方": "いぶり・ひだかちほう",
+    "石狩・空知・後志地方": "いしかり・そらち・しりべしちほう",
+    "渡島・檜山地方": "おしま・ひやまちほう",
+    "青森県": "あおもりけん",
+    "岩手県": "いわてけん",
+    "宮城県": "みやぎけん",
+    "秋田県": "あきたけん",
+    "山形県": "やまがたけん",
+    "福島県": "ふくしまけん",
+    "茨城県": "いばらきけん",
+    "栃木県": "とちぎけん",
+    "群馬県": "ぐんまけん",
+    "埼玉県": "さいたまけん",
+    "千葉県": "ちばけん",
+    "東京都": "とうきょうと",
+    "神奈川県": "かながわけん",
+    "新潟県": "にいがたけん",
+    "富山県": "とやまけん",
+    "石川県": "いしかわけん",
+    "福井県": "ふくいけん",
+    "山梨県": "やまなしけん",
+    "長野県": "ながのけん",
+    "岐阜県": "ぎふけん",
+    "静岡県": "しずおかけん",
+    "愛知県": "あいちけん",
+    "三重県": "みえけん",
+    "滋賀県": "しがけん",
+    "京都府": "きょうとふ",
+    "大阪府": "おおさかふ",
+    "兵庫県": "ひょうごけん",
+    "奈良県": "ならけん",
+    "和歌山県": "わかやまけん",
+    "鳥取県": "とっとりけん",
+    "島根県": "しまねけん",
+    "岡山県": "おかやまけん",
+    "広島県": "ひろしまけん",
+    "山口県": "やまぐちけん",
+    "徳島県": "とくしまけん",
+    "香川県": "かがわけん",
+    "愛媛県": "えひめけん",
+    "高知県": "こうちけん",
+    "福岡県": "ふくおかけん",
+    "佐賀県": "さがけん",
+    "長崎県": "ながさきけん",
+    "熊本県": "くまもとけん",
+    "大分県": "おおいたけん",
+    "宮崎県": "みやざきけん",
+    "奄美地方": "あまみちほう",
+    "鹿児島県（奄美地方除く）": "かごしまけん",
+    "沖縄本島地方": "おきなわほんとうちほう",
+    "大東島地方": "だいとうじまちほう",
+    "宮古島地方": "みやこじまちほう",
+    "八重山地方": "やえやまちほう",
+}
+
+# 検索キーの種類（小さいほうが検索結果の上に来る）
+_RANK_OFFICE = 0     # 地域そのものの名前・読みがな
+_RANK_SUB_AREA = 1   # その地域に含まれる細かい地域・市区町村の名前・読みがな
+
+
+# 検索しやすいように文字をそろえる関数
+# 全角英数字を半角に、カタカナをひらがなに、英字を小文字にして、空白を取り除く
+def normalize(text):
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = "".join(chr(ord(ch) - 0x60) if "ァ" <= ch <= "ヶ" else ch for ch in text)
+    return "".join(text.split())
+
+
+# 1つの名前から検索キーを作る関数（「上川・留萌地方」なら「上川」「留萌地方」でも見つかるようにする）
+def _search_keys(*names):
+    keys = set()
+    for name in names:
+        key = normalize(name)
+        if not key:
+            continue
+        keys.add(key)
+        keys.update(part for part in key.split("・") if part)
+    return keys
+
+
+class RegionIndex:
+    def __init__(self, data):
+        self._data = data
+        self._names = data["names"]
+        self._parents = data["parents"]
+        self._children = data["children"]
+        self._name_to_codes = data["name_to_codes"]
+        # 検索キーは並べ替えてあるので、二分探索で前方一致する範囲をすぐに見つけられる
+        self._keys = [key for key, _, _ in data["search_keys"]]
+        self._entries = data["search_keys"]
+
+    # コードから名前を返す（知らないコードなら None）
+    def name_of(self, code):
+        return self._names.get(code)
+
+    # 名前からコードのリストを返す（同じ名前の地域が複数あることもある）
+    def codes_of(self, name):
+        return self._name_to_codes.get(name, [])
+
+    # 親のコードを返す（地域 → 地方、細かい地域 → 地域）
+    def parent_of(self, code):
+        return self._parents.get(code)
+
+    # 子のコードのリストを返す
+    def children_of(self, code):
+        return self._children.get(code, [])
+
+    # 地方（centers）を area.json の順に [(地方コード, 地方名), ...] で返す
+    def centers(self):
+        return [(code, self._names[code]) for code in self._data["centers"]]
+
+    # 地方に含まれる地域（offices）を [(地域コード, 地域名), ...] で返す
+    def offices_in(self, center_code):
+        return [(code, self._names[code]) for code in self.children_of(center_code) if code in self._names]
+
+    # 地域（offices）の読みがなを返す（分からなければ None）
+    def kana_of(self, code):
+        return self._data["kana"].get(code)
+
+    # 前方一致で地域（offices）を探して、地域コードのリストを返す
+    # 地域そのものの名前で一致したものを先に、市区町村などの名前で一致したものを後に並べる
+    def search(self, query, limit=None):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+
+        best = {}
+        start = bisect.bisect_left(self._keys, prefix)
+        for key, rank, code in self._entries[start:]:
+            if not key.startswith(prefix):
+                break
+            best[code] = min(rank, best.get(code, rank))
+
+        codes = sorted(best, key=lambda code: (best[code], code))
+        return codes[:limit] if limit else codes
+
+    # ファイルに保存するための辞書を返す
+    def to_dict(self):
+        return self._data
+
+
+# 地域データ（area.json の中身）から索引を作る関数
+def build_region_index(area_data):
+    names = {}
+    parents = {}
+    children = {}
+    kana = {}
+    # 細かい地域や市区町村から、どの地域（offices）に含まれるかをたどるための表
+    office_of = {}
+    entries = set()
+
+    centers = area_data.get("centers", {})
+    offices = area_data.get("offices", {})
+
+    for center_code, center_info in centers.items():
+        names[center_code] = center_info["name"]
+        children[center_code] = list(center_info.get("children", []))
+        for office_code in children[center_code]:
+            parents[office_code] = center_code
+
+    for office_code, office_info in offices.items():
+        names[office_code] = office_info["name"]
+        children[office_code] = list(office_info.get("children", []))
+        office_of[office_code] = office_code
+        reading = OFFICE_KANA.get(office_info["name"])
+        if reading:
+            kana[office_code] = reading
+        for key in _search_keys(office_info["name"], reading, office_info.get("enName")):
+            entries.add((key, _RANK_OFFICE, office_code))
+
+    # 細かい地域（class10s → class15s → class20s）は、親をたどって地域（offices）に結びつける
+    for level in ("class10s", "class15s", "class20s"):
+        for code, info in area_data.get(level, {}).items():
+            parent = info.get("parent")
+            if parent not in office_of:
+                continue
+            office_of[code] = office_of[parent]
+            names[code] = info["name"]
+            parents[code] = parent
+            children.setdefault(parent, [])
+            if code not in children[parent]:
+                children[parent].append(code)
+            for key in _search_keys(info["name"], info.get("kana"), info.get("enName")):
+                entries.add((key, _RANK_SUB_AREA, office_of[code]))
+
+    name_to_codes = {}
+    for code, name in names.items():
+        name_to_codes.setdefault(name, []).append(code)
+
+    return RegionIndex({
+        "version": INDEX_VERSION,
+        "names": names,
+        "parents": parents,
+        "children": children,
+        "name_to_codes": name_to_codes,
+        "centers": list(centers),
+        "kana": kana,
+        "search_keys": sorted(entries),
+    })
+
+
+# 索引を読み込む関数（アプリ起動時に使う）
+# source_file（area.json のキャッシュファイル）を渡すと、その隣に索引を保存しておき、
+# 次回からは area.json が変わっていない限り（更新日時と大きさが同じなら）保存した索引を読むだけにする
+# source_file が None のとき（データベースから組み立てた地域データなど）は、保存せずにその場で作る
+def load_region_index(area_data, source_file=None):
+    if source_file is None:
+        return build_region_index(area_data)
+
+    index_file = os.path.join(os.path.dirname(source_file), "region_index.json")
+    try:
+        stat = os.stat(source_file)
+        fingerprint = f"{stat.st_mtime_ns}:{stat.st_size}"
+    except OSError:
+        return build_region_index(area_data)
+
+    try:
+        with open(index_file, encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("version") == INDEX_VERSION and saved.get("source") == fingerprint:
+            return RegionIndex(saved)
+    except (OSError, ValueError):
+        pass
+
+    index = build_region_index(area_data)
+    data = {**index.to_dict(), "source": fingerprint}
+    # 書き込み途中で落ちても壊れたファイルが残らないよう、一時ファイルに書いてから置き換える
+    tmp_path = index_file + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, index_file)
+    except OSError as e:
+        print(f"地域の索引を保存できませんでした: {e}")
+    return index
@@ -0,0 +1,268 @@
+import argparse
+import csv
+import datetime
+import glob
+import gzip
+import os
+import shutil
+
+from db import get_manager
+
+# weather.db の予報履歴が増え続けないように整理するプログラム
+#   1. 古いデータ（archive_days より前）は圧縮したCSVファイルに書き出してからDBから消す
+#      （書き出しは一時ファイルに行い、DBから消す変更を commit してから本来のファイルと置き換える）
+#   2. 少し前のデータ（keep_days より前）は、前回の取得から内容が変わった行だけを残す（間引き）
+#   3. 一定の間隔（vacuum_days）ごとに VACUUM してファイルの空き領域を詰める
+# 直近 keep_days 日分は、取得したものを全てそのまま残す
+#
+# cronなどで定期的に実行する: python retention.py --keep-days 14 --archive-days 365
+
+DEFAULT_KEEP_DAYS = 14
+DEFAULT_ARCHIVE_DAYS = 365
+DEFAULT_VACUUM_DAYS = 7
+
+# アーカイブ（CSV）の置き場所
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive")
+
+# fetched_at と同じ形式の日時文字列
+_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 新しい取得（cutoff以降）が「内容が同じなので最初に取得したときの行を使う」と参照している行
+# （storage.load_forecast を参照）。これを消すと新しい予報が表示できなくなるので、消さずに残す
+_REFERENCED_BY_RECENT_FETCH = """
+    EXISTS (
+        SELECT 1
+        FROM fetches AS x
+        JOIN forecast_payloads AS p ON p.payload_hash = x.payload_hash
+        WHERE x.area_code = forecasts.area_code
+          AND x.fetched_at >= :cutoff
+          AND p.first_fetched_at = forecasts.fetched_at
+    )
+"""
+
+
+# 今から days 日前の日時を、fetched_at と同じ形式の文字列で返す関数
+def days_ago(days, now=None):
+    now = now or datetime.datetime.now()
+    return (now - datetime.timedelta(days=days)).strftime(_TIME_FORMAT)
+
+
+# 書き出し途中のCSVファイルに付ける拡張子
+_PENDING_SUFFIX = ".pending"
+
+
+# 行を月ごとの圧縮CSVファイル（例: forecasts-2026-01.csv.gz）に追記する関数
+# month_index は各行の中で「年月を判定するための日時」が入っている列の番号
+# 本来のファイルには直接書かず、「今の中身 + 追記する行」を一時ファイル（.pending）に作るだけにする
+# （DBから消す変更を commit できたら _finish_archive で置き換える）
+def _append_csv(archive_dir, prefix, header, rows, month_index):
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(row[month_index][:7], []).append(row)
+
+    os.makedirs(archive_dir, exist_ok=True)
+    for month, month_rows in by_month.items():
+        path = os.path.join(archive_dir, f"{prefix}-{month}.csv.gz")
+        pending_path = path + _PENDING_SUFFIX
+        is_new = not os.path.exists(path)
+        if not is_new:
+            shutil.copyfile(path, pending_path)
+        # "at" で開くと、既存のファイルの後ろに追記される（gzipとしてそのまま読める）
+        with gzip.open(pending_path, "at", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            if is_new:
+                writer.writerow(header)
+            writer.writerows(month_rows)
+
+
+# 書き出し途中のCSVファイル（.pending）を片付ける関数
+# 前回の archive_cold_data の変更が commit されていれば（maintenance に 'archive' の記録があれば）本来のファイルと置き換え、
+# commit されていなければ（途中で落ちた・失敗した）捨てる。同じ行が2回書き出されることも、書き出さずに消えることもない
+def _finish_archive(manager, archive_dir):
+    with manager.writer() as conn:
+        committed = conn.execute("SELECT 1 FROM maintenance WHERE task = 'archive'").fetchone()
+        for pending_path in glob.glob(os.path.join(archive_dir, "*" + _PENDING_SUFFIX)):
+            if committed:
+                os.replace(pending_path, pending_path[:-len(_PENDING_SUFFIX)])
+            else:
+                os.remove(pending_path)
+        conn.execute("DELETE FROM maintenance WHERE task = 'archive'")
+
+
+# 古いデータをCSVに書き出して、DBから消す関数
+# CSVは一時ファイルに書くだけなので、呼び出し側で commit したあとに _finish_archive を呼ぶ
+# 戻り値は (書き出した予報の行数, 書き出した詳細データの行数)
+def archive_cold_data(conn, cutoff, archive_dir=ARCHIVE_DIR):
+    params = {"cutoff": cutoff}
+
+    cursor = conn.execute(
+        f"""
+        SELECT * FROM forecasts
+        WHERE fetched_at < :cutoff AND NOT {_REFERENCED_BY_RECENT_FETCH}
+        ORDER BY fetched_at
+        """,
+        params,
+    )
+    header = [column[0] for column in cursor.description]
+    forecast_rows = cursor.fetchall()
+    _append_csv(archive_dir, "forecasts", header, forecast_rows, header.index("fetched_at"))
+
+    # もう新しい取得から参照されていない、古い予報JSONの詳細データ
+    cold_payloads = """
+        SELECT payload_hash FROM forecast_payloads
+        WHERE first_fetched_at < :cutoff
+          AND payload_hash NOT IN (
+              SELECT payload_hash FROM fetches WHERE fetched_at >= :cutoff AND payload_hash IS NOT NULL
+          )
+    """
+    cursor = conn.execute(
+        f"""
+        SELECT p.first_fetched_at, d.*
+        FROM forecast_details AS d
+        JOIN forecast_payloads AS p ON p.payload_hash = d.payload_hash
+        WHERE d.payload_hash IN ({cold_payloads})
+        """,
+        params,
+    )
+    header = [column[0] for column in cursor.description]
+    detail_rows = cursor.fetchall()
+    _append_csv(archive_dir, "forecast_details", header, detail_rows, 0)
+
+    # 書き出し終わったものをDBから消す
+    conn.execute(
+        f"DELETE FROM forecasts WHERE fetched_at < :cutoff AND NOT {_REFERENCED_BY_RECENT_FETCH}",
+        params,
+    )
+    conn.execute(f"DELETE FROM forecast_details WHERE payload_hash IN ({cold_payloads})", params)
+    conn.execute(f"DELETE FROM forecast_payloads WHERE payload_hash IN ({cold_payloads})", params)
+    conn.execute("DELETE FROM fetches WHERE fetched_at < :cutoff", params)
+
+    # 一時ファイルを本来のファイルと置き換えてよいことを、消す変更と同じトランザクションで記録する
+    conn.execute(
+        "INSERT OR REPLACE INTO maintenance (task, last_run_at) VALUES ('archive', ?)",
+        (datetime.datetime.now().strftime(_TIME_FORMAT),),
+    )
+    return len(forecast_rows), len(detail_rows)
+
+
+# keep_days より前の予報を間引く関数
+# 同じ地域・同じ対象日の予報が、1つ前の取得と天気も天気コードも同じなら、その行を消す
+# （変わった行だけが残るので、「いつ予報が変わったか」は後からでも分かる）
+# 戻り値は消した行数
+def downsample(conn, cutoff):
+    params = {"cutoff": cutoff}
+    deleted = conn.execute(
+        f"""
+        DELETE FROM forecasts
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT
+                    id,
+                    fetched_at,
+                    weather_text,
+                    weather_code,
+                    LAG(weather_text) OVER w AS prev_text,
+                    LAG(weather_code) OVER w AS prev_code
+                FROM forecasts
+                WINDOW w AS (PARTITION BY area_code, substr(target_date, 1, 10) ORDER BY fetched_at)
+            )
+            WHERE fetched_at < :cutoff
+              AND prev_text IS NOT NULL
+              AND prev_text = weather_text
+              AND COALESCE(prev_code, '') = COALESCE(weather_code, '')
+        )
+        AND NOT {_REFERENCED_BY_RECENT_FETCH}
+        """,
+        params,
+    ).rowcount
+
+    # 予報の行が1つも残らなかった古い取得履歴は消し、残ったものは件数を数え直す
+    conn.execute(
+        """
+        DELETE FROM fetches
+        WHERE fetched_at < :cutoff
+          AND NOT EXISTS (
+              SELECT 1 FROM forecasts AS f
+              WHERE f.area_code = fetches.area_code AND f.fetched_at = fetches.fetched_at
+          )
+        """,
+        params,
+    )
+    conn.execute(
+        """
+        UPDATE fetches
+        SET row_count = (
+            SELECT COUNT(*) FROM forecasts AS f
+            WHERE f.area_code = fetches.area_code AND f.fetched_at = fetches.fetched_at
+        )
+        WHERE fetched_at < :cutoff
+        """,
+        params,
+    )
+
+    # どの取得履歴からも参照されなくなった予報JSONの詳細データも消す
+    conn.execute("""
+        DELETE FROM forecast_details
+        WHERE payload_hash NOT IN (SELECT payload_hash FROM fetches WHERE payload_hash IS NOT NULL)
+    """)
+    conn.execute("""
+        DELETE FROM forecast_payloads
+        WHERE payload_hash NOT IN (SELECT payload_hash FROM fetches WHERE payload_hash IS NOT NULL)
+    """)
+    return deleted
+
+
+# 前回の VACUUM から vacuum_days 日以上たっていれば VACUUM する関数
+# 実行した場合は True を返す
+def vacuum_if_due(manager, vacuum_days=DEFAULT_VACUUM_DAYS, force=False):
+    with manager.maintenance() as conn:
+        row = conn.execute("SELECT last_run_at FROM maintenance WHERE task = 'vacuum'").fetchone()
+        if not force and row and row[0] > days_ago(vacuum_days):
+            return False
+
+        # WALファイルの中身を本体に書き戻してから、空き領域を詰める
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        # 統計情報を更新して、検索の計画（どのインデックスを使うか）を最新にする
+        conn.execute("PRAGMA optimize")
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO maintenance (task, last_run_at) VALUES ('vacuum', ?)",
+                (datetime.datetime.now().strftime(_TIME_FORMAT),),
+            )
+    return True
+
+
+# 整理の全工程を実行する関数
+def apply_retention(db_path=None, keep_days=DEFAULT_KEEP_DAYS, archive_days=DEFAULT_ARCHIVE_DAYS,
+                    vacuum_days=DEFAULT_VACUUM_DAYS, archive_dir=ARCHIVE_DIR):
+    manager = get_manager(db_path)
+    # 前回が書き出しの途中で止まっていたら、先に片付ける
+    _finish_archive(manager, archive_dir)
+    with manager.writer() as conn:
+        archived, archived_details = archive_cold_data(conn, days_ago(archive_days), archive_dir)
+        downsampled = downsample(conn, days_ago(keep_days))
+    _finish_archive(manager, archive_dir)
+    vacuumed = vacuum_if_due(manager, vacuum_days)
+    return archived, archived_details, downsampled, vacuumed
+
+
+if __name__ == "__main__":
+    from db import init_database
+
+    parser = argparse.ArgumentParser(description="weather.db の古い予報を間引き・アーカイブする")
+    parser.add_argument("--db", default=None, help="整理するデータベースファイル（省略時は weather.db）")
+    parser.add_argument("--keep-days", type=int, default=DEFAULT_KEEP_DAYS, help="全ての取得をそのまま残す日数")
+    parser.add_argument("--archive-days", type=int, default=DEFAULT_ARCHIVE_DAYS, help="これより古いものはCSVに移す日数")
+    parser.add_argument("--vacuum-days", type=int, default=DEFAULT_VACUUM_DAYS, help="VACUUMする間隔（日）")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="CSVの保存先フォルダ")
+    args = parser.parse_args()
+
+    init_database(args.db)
+    archived, archived_details, downsampled, vacuumed = apply_retention(
+        db_path=args.db, keep_days=args.keep_days, archive_days=args.archive_days,
+        vacuum_days=args.vacuum_days, archive_dir=args.archive_dir,
+    )
+    print(f"アーカイブ: 予報 {archived} 行・詳細 {archived_details} 行")
+    print(f"間引き: {downsampled} 行を削除")
+    print("VACUUMを実行しました。" if vacuumed else "VACUUMは前回から間もないため省略しました。")
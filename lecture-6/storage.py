@@ -0,0 +1,278 @@
+import datetime
+
+from db import get_manager
+from jma import DETAIL_COLUMNS, extract_weathers, parse_forecast, payload_hash, report_datetime
+
+# weather.db への読み書きをまとめたモジュール
+# 画面側（main.py）からはSQLを直接書かず、ここにある関数を呼び出す
+
+# 気象庁の予報の時刻は日本時間
+JST = datetime.timezone(datetime.timedelta(hours=9))
+
+
+# 日時をUNIX時間（UTCの秒数）に直す関数
+# '2026-01-07T11:00:00+09:00' のようなタイムゾーン付きの文字列はそのタイムゾーンで、
+# '2026-01-07 10:56:33' のようなタイムゾーンなしの文字列や datetime はこのPCの時刻として扱う
+# 数値はそのまま返す
+def to_epoch(value):
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    return int(value.timestamp())
+
+
+# 地域情報（offices）をareasテーブルにまとめて保存する関数
+# 1件ずつexecuteするのではなく、executemanyで1回のトランザクションにまとめて書き込む
+def save_areas(offices, db_path=None):
+    rows = [(code, info["name"]) for code, info in offices.items()]
+
+    # writer() の中は1つのトランザクションになり、抜けるときに自動でcommitされる
+    with get_manager(db_path).writer() as conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO areas (area_code, area_name) VALUES (?, ?)",
+            rows,
+        )
+
+
+# 1回分の取得結果（予報JSON）を、開いている接続（トランザクションの中）に書き込む関数
+# save_forecast と save_forecasts の両方から使う
+# 前回までと全く同じ内容の予報だった場合は、予報の行は増やさず取得履歴（fetches）だけを記録する
+def _insert_snapshot(conn, area_code, forecast_data, fetched_at):
+    time_defines, weather_list, weather_codes = extract_weathers(forecast_data)
+    display_rows = list(zip(time_defines, weather_list))
+
+    content_hash = payload_hash(forecast_data)
+    fetched_epoch = to_epoch(fetched_at)
+    already_saved = conn.execute(
+        "SELECT 1 FROM forecast_payloads WHERE payload_hash = ?", (content_hash,)
+    ).fetchone()
+
+    if not already_saved:
+        conn.execute(
+            """
+            INSERT INTO forecast_payloads (payload_hash, area_code, report_datetime, first_fetched_at)
+            VALUES (?, ?, ?, ?)
+            """,
+            (content_hash, area_code, report_datetime(forecast_data), fetched_at),
+        )
+
+        # 全ての時系列・細かい地域の値を保存する
+        detail_rows = [
+            [content_hash, row["report_kind"], row["sub_area_code"], row["sub_area_name"], row["target_time"]]
+            + [row.get(column) for column in DETAIL_COLUMNS]
+            for row in parse_forecast(forecast_data)
+        ]
+        placeholders = ", ".join("?" * (5 + len(DETAIL_COLUMNS)))
+        conn.executemany(
+            f"""
+            INSERT INTO forecast_details (payload_hash, report_kind, sub_area_code, sub_area_name, target_time,
+                                          {", ".join(DETAIL_COLUMNS)})
+            VALUES ({placeholders})
+            """,
+            detail_rows,
+        )
+
+        # 画面のカード表示用の行（forecasts）も、天気コードと整数の日時付きで保存する
+        conn.executemany(
+            """
+            INSERT INTO forecasts (area_code, target_date, weather_text, weather_code, fetched_at,
+                                   target_epoch, fetched_epoch)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (area_code, target_date, weather_text, weather_code, fetched_at,
+                 to_epoch(target_date), fetched_epoch)
+                for target_date, weather_text, weather_code in zip(time_defines, weather_list, weather_codes)
+            ],
+        )
+
+    # 取得履歴（fetches）にも同じトランザクションで1行追加する
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO fetches (area_code, fetched_at, row_count, payload_hash, fetched_epoch)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        (area_code, fetched_at, len(display_rows), content_hash, fetched_epoch),
+    )
+    return display_rows
+
+
+# 1回分の取得結果（予報JSON）をまとめて保存する関数
+# 画面に表示する [(target_date, weather_text), ...] を返すので、保存直後に読み直す必要はない
+def save_forecast(area_code, forecast_data, fetched_at, db_path=None):
+    with get_manager(db_path).writer() as conn:
+        return _insert_snapshot(conn, area_code, forecast_data, fetched_at)
+
+
+# 複数地域の取得結果を、1回のトランザクションでまとめて保存する関数（一括取り込み用）
+# snapshots は (area_code, forecast_data, fetched_at) のリスト
+# 保存した予報の件数を返す
+def save_forecasts(snapshots, db_path=None):
+    total = 0
+    with get_manager(db_path).writer() as conn:
+        for area_code, forecast_data, fetched_at in snapshots:
+            total += len(_insert_snapshot(conn, area_code, forecast_data, fetched_at))
+    return total
+
+
+# 指定した地域・取得日時の予報を [(target_date, weather_text), ...] で返す関数
+# 内容が変わらず予報の行を保存しなかった取得日時は、同じ内容を最初に取得したときの行を読む
+def load_forecast(area_code, fetched_at, db_path=None):
+    with get_manager(db_path).reader() as conn:
+        return conn.execute(
+            """
+            SELECT target_date, weather_text
+            FROM forecasts
+            WHERE area_code = ? AND fetched_at = COALESCE(
+                (SELECT p.first_fetched_at
+                 FROM fetches AS x
+                 JOIN forecast_payloads AS p ON p.payload_hash = x.payload_hash
+                 WHERE x.area_code = ? AND x.fetched_at = ?),
+                ?
+            )
+            """,
+            (area_code, area_code, fetched_at, fetched_at),
+        ).fetchall()
+
+
+# --- 取得履歴のページ読み込み ---
+# 取得日時は何万件にもなり得るので、全件ではなく limit 件ずつ読む。
+# 「何件目から」（OFFSET）ではなく「どの日時より前/後か」で区切る（キーセット方式）ので、
+# fetchesテーブルの主キー（area_code, fetched_at）をたどるだけで済み、古いページでも遅くならない。
+
+# 指定した日時より古い取得日時を、新しい順に最大 limit 件返す関数
+# before が None なら一番新しいものから。inclusive=True なら before 自身も含める
+# 戻り値は (取得日時のリスト, さらに古いものがあるか)
+def fetch_times_before(area_code, before=None, limit=20, inclusive=False, db_path=None):
+    if before is None:
+        condition, params = "", (area_code, limit + 1)
+    else:
+        condition = "AND fetched_at <= ?" if inclusive else "AND fetched_at < ?"
+        params = (area_code, before, limit + 1)
+
+    with get_manager(db_path).reader() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT fetched_at
+            FROM fetches
+            WHERE area_code = ? {condition}
+            ORDER BY fetched_at DESC
+            LIMIT ?
+            """,
+            params,
+        ).fetchall()
+
+    # 1件多めに読んで、次のページがあるかどうかを判定する
+    times = [row[0] for row in rows]
+    return times[:limit], len(times) > limit
+
+
+# 指定した日時より新しい取得日時のうち、指定した日時に近いものを最大 limit 件、新しい順に返す関数
+# 戻り値は (取得日時のリスト, さらに新しいものがあるか)
+def fetch_times_after(area_code, after, limit=20, db_path=None):
+    with get_manager(db_path).reader() as conn:
+        rows = conn.execute(
+            """
+            SELECT fetched_at
+            FROM fetches
+            WHERE area_code = ? AND fetched_at > ?
+            ORDER BY fetched_at ASC
+            LIMIT ?
+            """,
+            (area_code, after, limit + 1),
+        ).fetchall()
+
+    times = [row[0] for row in rows]
+    return list(reversed(times[:limit])), len(times) > limit
+
+
+# --- 期間を指定した検索 ---
+# target_epoch / fetched_epoch（整数）のインデックスを範囲でたどるので、全地域をまとめて探しても速い。
+# start / end には datetime・日時の文字列・UNIX時間のどれを渡してもよい（start 以上 end 未満）
+
+# 指定した日（省略時は今日）を含む1週間（月曜0時〜次の月曜0時、日本時間）を (start, end) のUNIX時間で返す関数
+def week_range(day=None):
+    day = day or datetime.datetime.now(JST).date()
+    monday = datetime.datetime.combine(day - datetime.timedelta(days=day.weekday()), datetime.time(), JST)
+    return to_epoch(monday), to_epoch(monday + datetime.timedelta(days=7))
+
+
+# 対象日時が期間内の予報を、地域・対象日時ごとに一番新しく取得したものだけ返す関数
+# area_codes を渡すとその地域だけに絞る
+# 戻り値は [(area_code, target_date, weather_text, fetched_at), ...]（対象日時・地域の順）
+def forecasts_between(start, end, area_codes=None, db_path=None):
+    params = [to_epoch(start), to_epoch(end)]
+    condition = ""
+    if area_codes:
+        condition = f"AND area_code IN ({', '.join('?' * len(area_codes))})"
+        params.extend(area_codes)
+
+    with get_manager(db_path).reader() as conn:
+        # SQLiteでは MAX() と一緒に選んだ列は、最大値を持つ行の値になる（一番新しい取得の天気が返る）
+        rows = conn.execute(
+            f"""
+            SELECT area_code, target_date, weather_text, fetched_at, MAX(fetched_epoch)
+            FROM forecasts
+            WHERE target_epoch >= ? AND target_epoch < ? {condition}
+            GROUP BY target_epoch, area_code
+            ORDER BY target_epoch, area_code
+            """,
+            params,
+        ).fetchall()
+    return [row[:4] for row in rows]
+
+
+# 取得日時が期間内の取得履歴を、全地域まとめて古い順に返す関数
+# 戻り値は [(area_code, fetched_at), ...]
+def fetches_between(start, end, db_path=None):
+    with get_manager(db_path).reader() as conn:
+        return conn.execute(
+            """
+            SELECT area_code, fetched_at
+            FROM fetches
+            WHERE fetched_epoch >= ? AND fetched_epoch < ?
+            ORDER BY fetched_epoch, area_code
+            """,
+            (to_epoch(start), to_epoch(end)),
+        ).fetchall()
+
+
+# 指定した地域の一番新しい取得日時を返す関数（まだ保存がなければNone）
+def latest_fetch_time(area_code, db_path=None):
+    with get_manager(db_path).reader() as conn:
+        row = conn.execute(
+            """
+            SELECT fetched_at
+            FROM fetches
+            WHERE area_code = ?
+            ORDER BY fetched_at DESC
+            LIMIT 1
+            """,
+            (area_code,),
+        ).fetchone()
+
+    return row[0] if row else None
+
+
+# お気に入りに登録されている地域コードを、登録した順に返す関数
+def load_favorites(db_path=None):
+    with get_manager(db_path).reader() as conn:
+        rows = conn.execute("SELECT area_code FROM favorites ORDER BY added_at").fetchall()
+    return [row[0] for row in rows]
+
+
+# お気に入りに地域を追加する関数
+def add_favorite(area_code, db_path=None):
+    added_at = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    with get_manager(db_path).writer() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO favorites (area_code, added_at) VALUES (?, ?)",
+            (area_code, added_at),
+        )
+
+
+# お気に入りから地域を外す関数
+def remove_favorite(area_code, db_path=None):
+    with get_manager(db_path).writer() as conn:
+        conn.execute("DELETE FROM favorites WHERE area_code = ?", (area_code,))
@@ -3,12 +3,17 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import japanize_matplotlib  # 日本語豆腐化防止（インストールされていない場合は pip install japanize-matplotlib）
+from db import migrate_project_db
 
 def analyze_hypothesis():
     #  データベースからデータを読み込む
     db_path = 'travel_analysis.db'
     conn = sqlite3.connect(db_path)
+    # 古い形のデータベース（同じホテルの行が取得のたびに増えていた形）なら、ホテル1件につき1行の形にする
+    migrate_project_db(conn)
     
+    # hotels はホテル1件につき1行（一番新しく取得した点数・価格）なので、同じホテルを何回も数えることはない
+    # （取得ごとの推移は hotel_observations にある）
     # 0.0のデータ（取得失敗やデータなし）を除外して取得
     query = """
     SELECT name, total_score, breakfast_score, room_score, price 
@@ -0,0 +1,94 @@
+import gzip
+import hashlib
+import os
+import threading
+import datetime
+
+# 取得したHTMLをそのまま保存しておくための仕組み（アーカイブ）
+# 解析のやり方（どのタグから点数を取るかなど）を直したときに、サイトにもう一度アクセスしなくても
+# 保存しておいたHTMLから hotels を作り直せるようにする（scraping.py の --reparse）
+#
+# - HTMLの中身は、中身から計算したハッシュ値（SHA-256）をファイル名にして gzip で圧縮して保存する
+#   （同じ内容のページは何回取得しても1つのファイルにしかならない）
+#     archive/objects/ab/abcdef....html.gz
+# - 「どのURLを・いつ取得して・どの中身だったか」は travel_analysis.db の page_archive テーブルに記録する
+
+# アーカイブの置き場所（実行時のカレントディレクトリに左右されないよう、このファイルの場所を基準にする）
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive")
+
+
+def ensure_archive_table(conn):
+    """
+    page_archive テーブル（取得したページの記録）がなければ作る。
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS page_archive (
+            url TEXT NOT NULL,           -- 取得したURL
+            fetched_at TEXT NOT NULL,    -- 取得日時
+            kind TEXT NOT NULL,          -- ページの種類（search: 検索結果, review: 詳細・クチコミ）
+            content_hash TEXT NOT NULL,  -- HTMLの中身のハッシュ値（ファイル名になる）
+            PRIMARY KEY (url, fetched_at)
+        )
+    """)
+    # 種類ごとに、取得日時の順で探すためのインデックス
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_page_archive_kind
+        ON page_archive (kind, fetched_at)
+    """)
+
+
+class HtmlArchive:
+    """
+    取得したHTMLを保存する。
+    store() は詳細ページを取得する複数のスレッドから同時に呼ばれるので、ファイルの保存だけをその場で行い、
+    page_archive への記録はためておいて、データベースを使っているスレッドが flush() でまとめて書き込む。
+    """
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = root
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def path_for(self, content_hash):
+        return os.path.join(self.root, "objects", content_hash[:2], content_hash + ".html.gz")
+
+    def store(self, url, kind, html, fetched_at=None):
+        """
+        HTMLを保存して、ハッシュ値を返す。
+        fetched_at（取得日時）を省略すると、今の日時にする。
+        """
+        data = html.encode("utf-8")
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = self.path_for(content_hash)
+
+        # 同じ内容がすでに保存されていれば、ファイルは書かない
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 書き込み途中で落ちても壊れたファイルが残らないよう、一時ファイルに書いてから置き換える
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        fetched_at = fetched_at or datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            self._pending.append((url, fetched_at, kind, content_hash))
+        return content_hash
+
+    def load(self, content_hash):
+        """
+        保存しておいたHTMLを読み込む。
+        """
+        with gzip.open(self.path_for(content_hash), "rb") as f:
+            return f.read().decode("utf-8")
+
+    def flush(self, conn):
+        """
+        ためておいた記録を page_archive にまとめて書き込む（commit は呼び出し側で行う）。
+        """
+        with self._lock:
+            rows, self._pending = self._pending, []
+        conn.executemany("""
+            INSERT OR REPLACE INTO page_archive (url, fetched_at, kind, content_hash)
+            VALUES (?, ?, ?, ?)
+        """, rows)
+        return len(rows)
@@ -1,28 +1,140 @@
 import sqlite3
 
+# 以前の形の hotels で、前の行からこれ以上（分）あいていたら、別の回の取得とみなす
+LEGACY_FETCH_GAP_MINUTES = 30
+
+# データベースの形（テーブル・インデックス）を、保存されているデータを残したまま新しい形に変える関数
+# どこまで変更したかは PRAGMA user_version に番号で記録しておき、まだ行っていない変更だけを行う
+# scraping.py・analyze.py は、データベースを開いたら最初にこれを呼ぶ
+def migrate_project_db(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+
+    # バージョン1: ホテルを「詳細ページのホテル番号」で見分けて1件にまとめ、取得ごとの点数・価格は別のテーブルに残す
+    # それまでは実行するたびに同じホテルの行が増えていき、分析で同じホテルを何回も数えてしまっていた
+    if version < 1:
+        with conn:
+            # 以前の形の hotels（まだなければ空で作る）
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS hotels (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT,
+                    total_score REAL,
+                    breakfast_score REAL,
+                    room_score REAL,
+                    price INTEGER,
+                    fetched_at TEXT
+                )
+            """)
+
+            # 取得1回ごとの点数・価格（ホテルごとの時系列）
+            # 主キーの順（ホテル → 取得日時）に並んでいるので、1つのホテルの推移はそのまま順に読める
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS hotel_observations (
+                    hotel_key TEXT NOT NULL,      -- ホテルのキー（hotels.hotel_key）
+                    observed_at TEXT NOT NULL,    -- 検索結果ページを取得した日時
+                    total_score REAL,
+                    breakfast_score REAL,
+                    room_score REAL,
+                    price INTEGER,
+                    PRIMARY KEY (hotel_key, observed_at)
+                ) WITHOUT ROWID
+            """)
+            # 「ある期間に取得したもの」を探すためのインデックス
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_hotel_observations_observed_at
+                ON hotel_observations (observed_at)
+            """)
+
+            # これまでの行は詳細ページのURLを持っていないので、ホテル名でしか見分けられない
+            # ただし、1回の取得の中に同じ名前が何回も出てくるもの（チェーンの別の店舗など）は、どの行がどのホテルか分からない
+            # そういう名前は legacy_ambiguous_names に記録しておき、その行は1行ずつ別のキー（"legacy:以前の行番号"）で残す
+            # （1回の取得の中の行は続けて保存されているので、前の行から LEGACY_FETCH_GAP_MINUTES 分以上あいたら次の取得とみなす）
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS legacy_ambiguous_names (
+                    name TEXT PRIMARY KEY  -- 以前の1回の取得の中に、何回も出てきたホテル名
+                )
+            """)
+            conn.execute("""
+                INSERT OR IGNORE INTO legacy_ambiguous_names (name)
+                SELECT name
+                FROM (
+                    SELECT name, SUM(new_fetch) OVER (ORDER BY id) AS fetch_no
+                    FROM (
+                        SELECT id, name,
+                               CASE WHEN (julianday(fetched_at) - julianday(LAG(fetched_at) OVER (ORDER BY id))) * 24 * 60 < ?
+                                    THEN 0 ELSE 1 END AS new_fetch
+                        FROM hotels
+                    )
+                    WHERE name IS NOT NULL
+                )
+                GROUP BY name
+                HAVING COUNT(*) > COUNT(DISTINCT fetch_no)
+            """, (LEGACY_FETCH_GAP_MINUTES,))
+            conn.execute("""
+                CREATE TEMP VIEW legacy_hotels AS
+                SELECT hotels.*,
+                       CASE WHEN name IN (SELECT name FROM legacy_ambiguous_names) THEN 'legacy:' || id
+                            ELSE 'name:' || name END AS hotel_key
+                FROM hotels
+                WHERE name IS NOT NULL
+            """)
+
+            # それ以外は、ホテル名をキーにして時系列に移す
+            # （次に取得したときに、ホテル番号のキーに付け替える。scraping.py の save_hotel）
+            conn.execute("""
+                INSERT OR REPLACE INTO hotel_observations
+                    (hotel_key, observed_at, total_score, breakfast_score, room_score, price)
+                SELECT hotel_key, fetched_at, total_score, breakfast_score, room_score, price
+                FROM legacy_hotels
+                WHERE fetched_at IS NOT NULL
+                ORDER BY id
+            """)
+
+            # ホテル1件につき1行（一番新しく取得した点数・価格）の hotels を作り直す
+            conn.execute("""
+                CREATE TABLE hotels_new (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    hotel_key TEXT NOT NULL UNIQUE,  -- ホテルのキー（"hotel:ホテル番号"、分からなければ "name:ホテル名" か "legacy:以前の行番号"）
+                    name TEXT,                       -- ホテル名
+                    detail_url TEXT,                 -- 詳細ページのURL
+                    total_score REAL,                -- 総合評価
+                    breakfast_score REAL,            -- 朝食評価
+                    room_score REAL,                 -- 部屋評価
+                    price INTEGER,                   -- 最安料金（円）
+                    fetched_at TEXT,                 -- 一番新しく取得した日時
+                    first_seen_at TEXT               -- 初めて取得した日時
+                )
+            """)
+            conn.execute("""
+                INSERT INTO hotels_new
+                    (hotel_key, name, total_score, breakfast_score, room_score, price, fetched_at, first_seen_at)
+                SELECT hotel_key, name, total_score, breakfast_score, room_score, price, fetched_at, first_seen_at
+                FROM (
+                    SELECT *,
+                           ROW_NUMBER() OVER (PARTITION BY hotel_key ORDER BY fetched_at DESC, id DESC) AS newest,
+                           MIN(fetched_at) OVER (PARTITION BY hotel_key) AS first_seen_at
+                    FROM legacy_hotels
+                )
+                WHERE newest = 1
+            """)
+            conn.execute("DROP VIEW legacy_hotels")
+            conn.execute("DROP TABLE hotels")
+            conn.execute("ALTER TABLE hotels_new RENAME TO hotels")
+            conn.execute("PRAGMA user_version = 1")
+        version = 1
+
+
 # 分析用のデータベースを作成する
 def init_project_db():
     # 'travel_analysis.db' という新しいファイルを作る
     conn = sqlite3.connect('travel_analysis.db')
-    cursor = conn.cursor()
-
-    # ホテル情報を入れるテーブル（hotels）を作る
-    # すでにあったらエラーにならないように IF NOT EXISTS をつける
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS hotels (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,           -- ホテル名
-            total_score REAL,    -- 総合評価（4.5など、小数を扱うのでREAL）
-            breakfast_score REAL,-- 朝食評価
-            room_score REAL,     -- 部屋評価
-            price INTEGER,       -- 最安料金（円）
-            fetched_at TEXT      -- 取得日時
-        )
-    """)
-
-    conn.commit()
+
+    # ホテル情報を入れるテーブル（hotels）と、取得ごとの記録（hotel_observations）を作る
+    # すでにあればデータを残したまま、新しい形に変える
+    migrate_project_db(conn)
+
     conn.close()
     print("分析用データベース（travel_analysis.db）の準備完了。")
 
 if __name__ == "__main__":
-    init_project_db()
\ No newline at end of file
+    init_project_db()
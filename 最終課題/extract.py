@@ -0,0 +1,266 @@
+import re
+from html.parser import HTMLParser
+
+# 検索結果ページ・クチコミページから、必要な値だけを取り出すための解析
+# BeautifulSoup はページ全体の木（全てのタグのオブジェクト）を作ってから探すので、大きなページでは時間もメモリもかかる。
+# ここでは HTMLParser でHTMLを先頭から1回だけ読み、
+#   - 必要なタグ（ホテルの dl・h2・a、点数の div とその親）だけを記録し
+#   - 文字は1つのリストに順番にためておき、タグごとには「どこからどこまでか」の位置だけを持つ
+# ことで、木を作らずに BeautifulSoup の get_text() と同じ文字列を取り出す。
+#
+# 値の判定（点数・価格・ラベルの振り分け）は、BeautifulSoup を使う scraping.py の比較用の解析とこのファイルで
+# 同じ関数を使うので、どちらで解析しても結果は変わらない（parse_benchmark.py で確かめられる）。
+
+# あらかじめコンパイルしておく正規表現
+SCORE_PATTERN = re.compile(r'(\d\.\d+)')   # 「4.56」のような点数
+PRICE_PATTERN = re.compile(r'([\d,]+)円')  # 「12,345円」のような価格
+
+# 閉じタグのない要素（中に文字や他のタグを持たない）
+VOID_ELEMENTS = frozenset({
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+})
+# 中身を文字として扱わない要素（BeautifulSoup の get_text() にも含まれない）
+_SKIP_TEXT_ELEMENTS = frozenset({"script", "style", "template"})
+
+
+def get_score_from_text(text):
+    """
+    テキストの中から「4.5」のような浮動小数点数（スコア）を探し出す関数
+    例: "お客さまの声 4.56" -> 4.56
+    """
+    match = SCORE_PATTERN.search(text)
+    if match:
+        return float(match.group(1))
+    return 0.0
+
+def get_price_from_text(text):
+    """
+    テキストの中から「12,345円」のような価格を探し出して、整数で返す（なければ 0）。
+    """
+    match = PRICE_PATTERN.search(text)
+    if match:
+        return int(match.group(1).replace(",", ""))
+    return 0
+
+def build_hotel(name, detail_url, section_text, get_parent_text):
+    """
+    検索結果の1件分の文字から、ホテルの情報（辞書）を組み立てる。
+    get_parent_text は外側の箱の文字を返す関数（価格が見つからないときだけ呼ぶ）。
+    """
+    # 総合評価: "お客さまの声" という文字の近くにある数字を、セクション内のテキスト全体から探す
+    total_score = get_score_from_text(section_text)
+
+    # 価格は dl の外側にあるケースが多いが、内側にある場合もある。
+    # 取れなかった場合は、親要素（外側の箱）まで見に行く
+    price = get_price_from_text(section_text)
+    if price == 0:
+        price = get_price_from_text(get_parent_text())
+
+    return {
+        "name": name,
+        "total_score": total_score,
+        "price": price,
+        "detail_url": detail_url,
+    }
+
+def scores_from_labels(pairs):
+    """
+    [(点数の文字, 親要素の文字), ...] から、(部屋, 食事) の点数を決める。
+    親要素の文字（例: "部屋 4.56"）にあるラベルで振り分ける。
+    """
+    # 初期値（データがない場合は0.0）
+    room = 0.0
+    breakfast = 0.0
+
+    for score_text, check_text in pairs:
+        try:
+            # 箱の中の数字を取得
+            score_value = float(score_text)
+        except ValueError:
+            continue
+
+        # ラベルに応じた振り分け
+        if "部屋" in check_text:
+            room = score_value
+        elif "朝食" in check_text:
+            breakfast = score_value
+        elif "夕食" in check_text and breakfast == 0.0:
+            # 朝食がなく夕食評価がある場合は、それを食事スコアとして採用
+            breakfast = score_value
+        elif "食事" in check_text and breakfast == 0.0:
+            # まれに「食事」とだけ書かれているケースへの対応
+            breakfast = score_value
+
+    return room, breakfast
+
+
+class _Node:
+    """
+    開いているタグ1つ分。文字そのものは持たず、文字のリストの中の位置（start 〜 end）だけを持つ。
+    """
+    __slots__ = ("tag", "attrs", "parent", "start", "end")
+
+    def __init__(self, tag, attrs, parent, start):
+        self.tag = tag
+        self.attrs = attrs
+        self.parent = parent
+        self.start = start
+        self.end = None
+
+
+class _StreamParser(HTMLParser):
+    """
+    タグの入れ子（開いているタグの並び）と文字だけを記録しながら、HTMLを先頭から読む。
+    on_open / on_close を上書きして、必要なタグだけを覚えておく。
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.texts = []
+        self.stack = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_ELEMENTS:
+            return
+        node = _Node(tag, attrs, self.stack[-1] if self.stack else None, len(self.texts))
+        self.stack.append(node)
+        if tag in _SKIP_TEXT_ELEMENTS:
+            self._skip_depth += 1
+        self.on_open(node)
+
+    def handle_startendtag(self, tag, attrs):
+        # <br/> のように自分で閉じているタグは、中身がないので記録しない
+        pass
+
+    def handle_endtag(self, tag):
+        # 対応する開始タグがなければ無視し、あれば途中の閉じ忘れたタグもまとめて閉じる
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i].tag == tag:
+                break
+        else:
+            return
+        while len(self.stack) > i:
+            self._close(self.stack.pop())
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.texts.append(data)
+
+    def close(self):
+        super().close()
+        # 最後まで閉じられなかったタグを閉じる
+        while self.stack:
+            self._close(self.stack.pop())
+
+    def _close(self, node):
+        node.end = len(self.texts)
+        if node.tag in _SKIP_TEXT_ELEMENTS:
+            self._skip_depth -= 1
+        self.on_close(node)
+
+    def on_open(self, node):
+        pass
+
+    def on_close(self, node):
+        pass
+
+    # BeautifulSoup の get_text() と同じ文字列（node が None ならページ全体）
+    def text(self, node=None):
+        if node is None:
+            return "".join(self.texts)
+        return "".join(self.texts[node.start:node.end])
+
+    # BeautifulSoup の get_text(strip=True) と同じ文字列
+    def stripped_text(self, node):
+        return "".join(part.strip() for part in self.texts[node.start:node.end] if part.strip())
+
+
+def _attr(attrs, name):
+    for key, value in attrs:
+        if key == name:
+            return value
+    return None
+
+
+class _ListingParser(_StreamParser):
+    """
+    検索結果ページから、ホテル1件分の箱（dl.htlGnrlInfo）と、その中の最初の h2・h2 の中の最初の a を記録する。
+    """
+    def __init__(self):
+        super().__init__()
+        self.sections = []  # [dl, h2, a のhref, a を見つけたか]
+        self._current = None
+
+    def on_open(self, node):
+        if node.tag == "dl":
+            classes = (_attr(node.attrs, "class") or "").split()
+            if "htlGnrlInfo" in classes:
+                self._current = [node, None, None, False]
+                self.sections.append(self._current)
+            return
+        section = self._current
+        if section is None or section[0].end is not None:
+            return
+        if node.tag == "h2" and section[1] is None:
+            section[1] = node
+        elif node.tag == "a" and section[1] is not None and section[1].end is None and not section[3]:
+            section[2] = _attr(node.attrs, "href")
+            section[3] = True
+
+
+class _ReviewParser(_StreamParser):
+    """
+    クチコミページから、点数の箱（div[data-test-id=category-score]）を記録する。
+    """
+    def __init__(self):
+        super().__init__()
+        self.boxes = []
+
+    def on_close(self, node):
+        if node.tag == "div" and _attr(node.attrs, "data-test-id") == "category-score":
+            self.boxes.append(node)
+
+
+def extract_listing(html):
+    """
+    検索結果ページのHTMLから、ホテルの一覧（辞書のリスト）を取り出す。
+    """
+    # ホテルの箱が1つもないページは、読む必要がない
+    if "htlGnrlInfo" not in html:
+        return []
+
+    parser = _ListingParser()
+    parser.feed(html)
+    parser.close()
+
+    hotels = []
+    for dl, h2, href, _ in parser.sections:
+        if h2 is None:
+            continue
+        hotels.append(build_hotel(
+            parser.stripped_text(h2),
+            href,
+            parser.text(dl),
+            lambda dl=dl: parser.text(dl.parent),
+        ))
+    return hotels
+
+def extract_detail_scores(html):
+    """
+    クチコミページのHTMLから (部屋, 食事) の点数を取り出す。
+    """
+    # 点数の箱がないページは、読む必要がない
+    if "category-score" not in html:
+        return 0.0, 0.0
+
+    parser = _ReviewParser()
+    parser.feed(html)
+    parser.close()
+
+    pairs = [
+        (parser.text(box), parser.text(box.parent).strip())
+        for box in parser.boxes
+        if box.parent is not None
+    ]
+    return scores_from_labels(pairs)
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# 通信用のクライアント（接続の使い回し・タイムアウト・やり直し・サーキットブレーカー）の本体は、
+# lecture-5・lecture-6・最終課題で共有している common/http_client_core.py にある。
+# ここでは common フォルダを読み込み先に加えて、その中身をそのまま http_client として使えるようにする
+_COMMON_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common")
+if _COMMON_DIR not in sys.path:
+    sys.path.append(_COMMON_DIR)
+
+from http_client_core import *  # noqa: E402,F401,F403
@@ -0,0 +1,175 @@
+import datetime
+import json
+
+# スクレイピングの実行ごとの記録（台帳）
+# 大量のページをたどる途中で落ちたり、アクセスを止められたりしても、次の実行（scraping.py --resume）で
+# 最初からではなく、止まったところから続けられるようにする。
+#
+# travel_analysis.db に次の2つのテーブルを作る
+# - scrape_runs: 1回の実行（検索条件・状態）
+# - scrape_urls: その実行で扱ったURLごとの状態
+#     search（検索結果ページ）: 解析が終わったら done。そのページのホテルのキーを data に入れておく
+#     detail（詳細ページ）    : 取得待ちは pending、取得できたら done、失敗したら failed。ホテルの情報を data に入れておく
+#
+# hotels への保存と台帳の更新は同じトランザクションで commit するので、
+# 「保存したのに台帳では取得待ち」「台帳では取得済みなのに保存されていない」ということは起きない。
+
+# 状態
+RUNNING = "running"        # 実行中（または途中で止まった）
+INCOMPLETE = "incomplete"  # 最後まで実行したが、取得できなかったページがある
+FINISHED = "finished"      # 全て取得できた
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+def _now():
+    return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def ensure_ledger_tables(conn):
+    """
+    scrape_runs / scrape_urls テーブルがなければ作る。
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scrape_runs (
+            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at TEXT NOT NULL,   -- 開始日時
+            finished_at TEXT,           -- 終了日時（途中で止まった場合は NULL）
+            status TEXT NOT NULL,       -- running / incomplete / finished
+            queries TEXT NOT NULL,      -- 検索条件 [[駅の検索キー, 宿泊日], ...]（JSON）
+            max_pages INTEGER NOT NULL  -- 1つの検索条件でたどる最大ページ数
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scrape_urls (
+            run_id INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            kind TEXT NOT NULL,         -- search: 検索結果ページ, detail: 詳細ページ
+            status TEXT NOT NULL,       -- pending / done / failed
+            data TEXT,                  -- search: ホテルのキーのリスト, detail: ホテルの情報（JSON）
+            fetched_at TEXT,            -- 詳細ページを実際に取得した日時
+            updated_at TEXT NOT NULL,   -- 状態を変えた日時
+            PRIMARY KEY (run_id, url)
+        )
+    """)
+    # 「このURLの詳細ページを最近取得したか」を、実行をまたいで探すためのインデックス
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_scrape_urls_fresh
+        ON scrape_urls (url, status, fetched_at)
+    """)
+
+
+class RunLedger:
+    """
+    1回の実行の台帳。データベースへの書き込みは、呼び出し側と同じ接続・同じスレッドで行う
+    （commit は呼び出し側で、hotels への保存と一緒に行う）。
+    """
+    def __init__(self, conn, run_id, queries, max_pages):
+        self.conn = conn
+        self.run_id = run_id
+        self.queries = queries
+        self.max_pages = max_pages
+
+    @classmethod
+    def start(cls, conn, queries, max_pages):
+        """
+        新しい実行を記録して、その台帳を返す。
+        """
+        cursor = conn.execute("""
+            INSERT INTO scrape_runs (started_at, status, queries, max_pages)
+            VALUES (?, ?, ?, ?)
+        """, (_now(), RUNNING, json.dumps([list(query) for query in queries]), max_pages))
+        return cls(conn, cursor.lastrowid, queries, max_pages)
+
+    @classmethod
+    def latest_unfinished(cls, conn):
+        """
+        最後まで終わっていない実行のうち、一番新しいものの台帳を返す（なければ None）。
+        """
+        row = conn.execute("""
+            SELECT run_id, queries, max_pages
+            FROM scrape_runs
+            WHERE status != ?
+            ORDER BY run_id DESC
+            LIMIT 1
+        """, (FINISHED,)).fetchone()
+        if row is None:
+            return None
+        run_id, queries, max_pages = row
+        return cls(conn, run_id, [tuple(query) for query in json.loads(queries)], max_pages)
+
+    def _set(self, url, kind, status, data, fetched_at=None):
+        self.conn.execute("""
+            INSERT OR REPLACE INTO scrape_urls (run_id, url, kind, status, data, fetched_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (self.run_id, url, kind, status, json.dumps(data, ensure_ascii=False), fetched_at, _now()))
+
+    # --- 検索結果ページ ---
+
+    def page_done(self, url, keys):
+        self._set(url, "search", DONE, keys)
+
+    def done_page_keys(self, url):
+        """
+        この実行で解析が終わった検索結果ページなら、そのページのホテルのキーのリストを返す（まだなら None）。
+        """
+        row = self.conn.execute("""
+            SELECT data FROM scrape_urls
+            WHERE run_id = ? AND url = ? AND kind = 'search' AND status = ?
+        """, (self.run_id, url, DONE)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def seen_keys(self):
+        """
+        この実行で、すでに見つけたホテルのキー（解析が終わった検索結果ページに載っていたもの）。
+        """
+        keys = set()
+        for (data,) in self.conn.execute("""
+            SELECT data FROM scrape_urls
+            WHERE run_id = ? AND kind = 'search' AND status = ?
+        """, (self.run_id, DONE)):
+            keys.update(json.loads(data))
+        return keys
+
+    # --- 詳細ページ ---
+
+    def detail_pending(self, url, hotel):
+        self._set(url, "detail", PENDING, hotel)
+
+    def detail_done(self, url, hotel, fetched_at=None):
+        self._set(url, "detail", DONE, hotel, fetched_at or _now())
+
+    def detail_failed(self, url, hotel):
+        self._set(url, "detail", FAILED, hotel)
+
+    def unfinished_details(self):
+        """
+        この実行で、まだ取得できていない（取得待ち・失敗した）詳細ページのホテルの一覧。
+        """
+        return [json.loads(data) for (data,) in self.conn.execute("""
+            SELECT data FROM scrape_urls
+            WHERE run_id = ? AND kind = 'detail' AND status != ?
+            ORDER BY updated_at
+        """, (self.run_id, DONE))]
+
+    def fresh_detail(self, url, since):
+        """
+        since（'2026-02-26 12:00:00' の形）以降に、どの実行かで取得できた詳細ページなら
+        (そのときのホテルの情報, 取得日時) を返す（なければ None）。
+        """
+        row = self.conn.execute("""
+            SELECT data, fetched_at FROM scrape_urls
+            WHERE url = ? AND status = ? AND fetched_at >= ?
+            ORDER BY fetched_at DESC
+            LIMIT 1
+        """, (url, DONE, since)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def finish(self, status):
+        self.conn.execute("""
+            UPDATE scrape_runs SET status = ?, finished_at = ? WHERE run_id = ?
+        """, (status, _now() if status != RUNNING else None, self.run_id))
@@ -0,0 +1,118 @@
+import argparse
+import sqlite3
+import statistics
+import time
+import tracemalloc
+
+from archive import HtmlArchive, ensure_archive_table
+from scraping import parse_listing, parse_listing_with_soup, parse_detail_scores, parse_detail_scores_with_soup
+
+# HTMLの解析の速さを、保存しておいたページ（archive.py）を使って測るプログラム
+# 同じページを
+#   - これまでの解析（BeautifulSoup でページ全体の木を作ってから探す）
+#   - extract.py の解析（必要なタグだけを記録しながら1回読む）
+# の両方で解析して、1ページあたりの時間・使ったメモリの最大量を比べる。
+# 2つの解析の結果が違うページがあれば、その数も表示する（違う場合は解析のやり方を見直す）
+#
+# 使い方（先に scraping.py を実行して、ページを保存しておく）:
+#   python parse_benchmark.py
+#   python parse_benchmark.py --limit 50 --repeat 3
+
+# ページの種類ごとの (これまでの解析, 新しい解析)
+PARSERS = {
+    "search": (parse_listing_with_soup, parse_listing),
+    "review": (parse_detail_scores_with_soup, parse_detail_scores),
+}
+
+
+def measure(func, html, repeat):
+    """
+    func(html) を repeat 回実行して、(一番速かった秒数, 使ったメモリの最大量（バイト）, 戻り値) を返す。
+    時間はメモリの記録をしていない状態で測り、メモリはもう1回実行して測る。
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(html)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func(html)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(times), peak, result
+
+
+def load_pages(limit=None):
+    """
+    保存しておいたページを、種類ごとに [(URL, HTML), ...] で返す（同じ中身のページは1回だけ）。
+    """
+    conn = sqlite3.connect('travel_analysis.db')
+    try:
+        ensure_archive_table(conn)
+        rows = conn.execute("""
+            SELECT kind, MIN(url), content_hash
+            FROM page_archive
+            GROUP BY kind, content_hash
+            ORDER BY kind, MIN(fetched_at)
+        """).fetchall()
+    finally:
+        conn.close()
+
+    archive = HtmlArchive()
+    pages = {kind: [] for kind in PARSERS}
+    for kind, url, content_hash in rows:
+        if kind not in pages or (limit and len(pages[kind]) >= limit):
+            continue
+        pages[kind].append((url, archive.load(content_hash)))
+    return pages
+
+
+def run_benchmark(limit=None, repeat=3):
+    """
+    ページの種類ごとに、2つの解析の時間とメモリを測って表示する。
+    """
+    pages = load_pages(limit)
+    if not any(pages.values()):
+        print("保存されたページがありません。先に scraping.py を実行してください。")
+        return
+
+    for kind, (before_func, after_func) in PARSERS.items():
+        if not pages[kind]:
+            continue
+        before_times, after_times = [], []
+        before_peaks, after_peaks = [], []
+        mismatches = 0
+
+        for url, html in pages[kind]:
+            before_time, before_peak, before_result = measure(before_func, html, repeat)
+            after_time, after_peak, after_result = measure(after_func, html, repeat)
+            before_times.append(before_time)
+            after_times.append(after_time)
+            before_peaks.append(before_peak)
+            after_peaks.append(after_peak)
+            if before_result != after_result:
+                mismatches += 1
+                print(f"  結果が違います: {url}")
+
+        before_ms = statistics.median(before_times) * 1000
+        after_ms = statistics.median(after_times) * 1000
+        before_kb = statistics.median(before_peaks) / 1024
+        after_kb = statistics.median(after_peaks) / 1024
+        size_kb = statistics.median(len(html.encode("utf-8")) for _, html in pages[kind]) / 1024
+        print(f"{kind}: {len(pages[kind])} ページ（1ページの大きさ 中央値 {size_kb:.1f} KB）")
+        print(f"  時間（中央値）  : BeautifulSoup {before_ms:.2f} ms -> extract.py {after_ms:.2f} ms"
+              f"（{before_ms / after_ms:.1f} 倍速い）")
+        print(f"  メモリ（中央値）: BeautifulSoup {before_kb:.0f} KB -> extract.py {after_kb:.0f} KB"
+              f"（{before_kb / after_kb:.1f} 分の1）")
+        print(f"  結果が違うページ: {mismatches} 件")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="保存しておいたページで、HTMLの解析の速さとメモリを比べる")
+    parser.add_argument("--limit", type=int, default=None, help="種類ごとに使うページの最大数")
+    parser.add_argument("--repeat", type=int, default=3, help="1ページを何回解析して、一番速い時間をとるか")
+    args = parser.parse_args()
+    run_benchmark(limit=args.limit, repeat=args.repeat)
@@ -1,198 +1,730 @@
-import requests
 from bs4 import BeautifulSoup
 import sqlite3
 import time
 import random
 import datetime
 import re # 正規表現を使うためのライブラリ（数字の抽出に便利）
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit, urlencode, parse_qsl
+import requests
+# 接続の使い回し・タイムアウト・やり直し・サーキットブレーカーをまとめた通信用のクライアント
+from http_client import HttpClient, CircuitOpenError, format_metrics, retry_after_seconds
+# 取得したHTMLの保存（解析のやり方を直したときに、通信せずに作り直せるように）
+from archive import HtmlArchive, ensure_archive_table
+# HTMLから必要な値だけを取り出す解析（BeautifulSoup で木を作るより速く、メモリも少ない）
+from extract import extract_listing, extract_detail_scores, build_hotel, scores_from_labels
+# 実行ごとの記録（途中で止まっても --resume で続きから再開できるように）
+from ledger import RunLedger, ensure_ledger_tables, RUNNING, INCOMPLETE, FINISHED
+# hotels / hotel_observations テーブルの作成・変換
+from db import migrate_project_db
 
 TARGET_URL = "https://search.travel.rakuten.co.jp/ds/station/ensen?f_eki=0&f_page=1&f_hyoji=30&f_disp_type=hotel&f_ido=0.0&f_kdo=0.0&f_teikei=ensen&f_key=200%252C15503839%252C50887650&f_nen1=2026&f_tuki1=2&f_hi1=26&f_nen2=2026&f_tuki2=2&f_hi2=27&f_heya_su=1&f_otona_su=1&f_s1=0&f_s2=0&f_y1=0&f_y2=0&f_y3=0&f_y4=0&f_km=1.0&f_sort=hotel&f_tab=hotel&f_kin2=0&f_kin="
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/91.0.4472.124 Safari/537.36"
 }
-def get_detail_scores(detail_url):
+
+# 検索結果1ページあたりの件数（TARGET_URL の f_hyoji と同じ）
+PER_PAGE = 30
+# クロールモードで、1つの検索条件につき最大何ページまでたどるか
+DEFAULT_MAX_PAGES = 50
+# この件数を保存するか、この秒数がたつごとに commit する（途中で止まっても、それまでの結果が残るように）
+COMMIT_EVERY = 50
+COMMIT_INTERVAL = 10
+# この時間（時間）以内にどれかの実行で取得した詳細ページは、取得し直さずにそのときの点数を使う（0 なら毎回取得する）
+DEFAULT_FRESH_HOURS = 24
+
+# 詳細ページを同時に取得する数
+DEFAULT_WORKERS = 4
+# 同じサーバー（ホスト）に送る、1秒あたりのリクエスト数（最初のペース・上限・下限）と、続けて送ってよい数
+# （マナーとして、サーバーの様子を見ながら、サーバーごとに上限を超えないようにする）
+DEFAULT_RATE = 1.0
+DEFAULT_MAX_RATE = 4.0
+DEFAULT_MIN_RATE = 0.1
+DEFAULT_BURST = 2
+# ペースの調整のしかた
+RATE_INCREASE = 0.1        # 順調な応答1回ごとに増やす量（件/秒）
+RATE_BACKOFF = 0.5         # 混雑（429・5xx）や通信エラーのときに掛ける割合
+SLOW_LATENCY_FACTOR = 2.0  # 応答時間がこれまでの最速の何倍を超えたら、遅くなってきたとみなすか
+SLOW_DOWN = 0.9            # 遅くなってきたときに掛ける割合
+# 混雑（429・5xx）や通信エラーのときに、同じURLをやり直す回数
+# （やり直しも HostRateLimiter を通すので、待ち時間はペースと Retry-After で決まる）
+PAGE_RETRIES = 2
+
+# URLから取り出すための正規表現（何度も使うので、あらかじめコンパイルしておく）
+REVIEW_PATH_PATTERN = re.compile(r'/[^/]+\.html.*$')  # 詳細ページのファイル名以降
+HOTEL_ID_PATTERN = re.compile(r'/HOTEL/(\d+)')         # ホテル番号
+
+
+class _HostPace:
     """
-    詳細ページ（review.html）から「部屋」と「食事」の点数を取得する。
+    1つのサーバー（ホスト）に送るペースの状態。
     """
-    try:
-        time.sleep(2) # マナーとして待機
-        
-        #  URLをクチコミページ（review.html）になおす
-        review_url = re.sub(r'/[^/]+\.html.*$', '/review.html', detail_url)
-        if "review.html" not in review_url:
-             review_url = detail_url
-
-        #  ページへのアクセス
-        res = requests.get(review_url, headers=HEADERS, timeout=10)
-        
-        # クチコミページがない場合は、元のURLで再トライ
-        if res.status_code != 200:
-             res = requests.get(detail_url, headers=HEADERS, timeout=10)
+    def __init__(self, rate, burst):
+        self.rate = rate                # 今のペース（件/秒）
+        self.tokens = burst             # 残りのトークン
+        self.last = time.monotonic()    # トークンを最後に計算した時刻
+        self.paused_until = 0.0         # Retry-After で待つように言われた時刻まで送らない
+        self.latency = None             # 応答時間（最近の値ほど重く見た平均）
+        self.best_latency = None        # これまでで一番速かった応答時間（平均）
+        self.slowdowns = 0              # ペースを落とした回数
 
-        res.raise_for_status()
-        soup = BeautifulSoup(res.text, 'html.parser')
-        
-        # 初期値（データがない場合は0.0）
-        room = 0.0
-        breakfast = 0.0
 
-        #  検証で見つけた "data-test-id" を使って点数の箱を全て取得
-        score_boxes = soup.find_all("div", attrs={"data-test-id": "category-score"})
+class HostRateLimiter:
+    """
+    サーバー（ホスト）ごとのトークンバケット。
+    1秒に rate 個ずつトークンがたまり（最大 burst 個）、リクエストのたびに1個使う。
+    トークンがなければ、たまるまで待つ。複数のスレッドから呼んでも、ホストごとのペースは守られる。
 
-        for box in score_boxes:
-            try:
-                # 箱の中の数字を取得
-                score_value = float(box.get_text())
-                
-                # 親要素(p1)だけを見てラベル（部屋、朝食など）を判定
-                parent = box.find_parent()
-                if not parent:
-                    continue
-                
-                # 親要素のテキスト（例: "部屋 4.56"）を取得し、空白を除去
-                check_text = parent.get_text().strip()
-                
-                # ラベルに応じた振り分け
-                if "部屋" in check_text:
-                    room = score_value
-                elif "朝食" in check_text:
-                    breakfast = score_value
-                elif "夕食" in check_text and breakfast == 0.0:
-                    # 朝食がなく夕食評価がある場合は、それを食事スコアとして採用
-                    breakfast = score_value
-                elif "食事" in check_text and breakfast == 0.0:
-                    # まれに「食事」とだけ書かれているケースへの対応
-                    breakfast = score_value
-                    
-            except ValueError:
-                continue
+    rate はサーバーの応答を見て変わる（observe を HttpClient の on_response に渡しておく）。
+    - 順調に応答が返ってくる間は、少しずつ速くする（max_rate まで）
+    - 応答が遅くなってきたら、少し遅くする
+    - 混雑（429）・サーバーエラー（5xx）・通信エラーなら半分に落とし、Retry-After があればその秒数は送らない
+    """
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, max_rate=DEFAULT_MAX_RATE, min_rate=DEFAULT_MIN_RATE):
+        # ペースが0以下だと、トークンがたまるまでの待ち時間が計算できない
+        if rate <= 0 or max_rate <= 0 or min_rate <= 0:
+            raise ValueError("rate・max_rate・min_rate は0より大きい値にしてください")
+        self.rate = rate
+        self.burst = burst
+        self.max_rate = max(max_rate, rate)
+        self.min_rate = min(min_rate, rate)
+        self._hosts = {} # ホスト -> _HostPace
+        self._lock = threading.Lock()
 
-        return room, breakfast
+    def _pace(self, host):
+        pace = self._hosts.get(host)
+        if pace is None:
+            pace = self._hosts[host] = _HostPace(self.rate, self.burst)
+        return pace
 
-    except Exception as e:
+    def wait(self, url):
+        host = urlsplit(url).netloc
+        while True:
+            with self._lock:
+                pace = self._pace(host)
+                now = time.monotonic()
+                if now < pace.paused_until:
+                    wait_time = pace.paused_until - now
+                else:
+                    pace.tokens = min(self.burst, pace.tokens + (now - pace.last) * pace.rate)
+                    pace.last = now
+                    if pace.tokens >= 1:
+                        pace.tokens -= 1
+                        return
+                    wait_time = (1 - pace.tokens) / pace.rate
+            # ロックを放してから待つ（他のホストへのリクエストは待たせない）
+            time.sleep(wait_time)
+
+    def observe(self, url, response, elapsed):
+        """
+        1回の通信の結果から、そのホストのペースを調整する（response は通信エラーのとき None）。
+        """
+        host = urlsplit(url).netloc
+        with self._lock:
+            pace = self._pace(host)
+
+            if response is None or response.status_code == 429 or response.status_code >= 500:
+                pace.rate = max(self.min_rate, pace.rate * RATE_BACKOFF)
+                pace.slowdowns += 1
+                # たまっていたトークンも捨てて、次のリクエスト（やり直しを含む）は落としたペースの分だけ待たせる
+                # （失敗が続くほどペースが半分ずつになるので、待ち時間は倍ずつ延びる）
+                pace.tokens = min(pace.tokens, 0)
+                # 待ち時間を指定されたら、その間はこのホストに送らない
+                # （秒数でも日時でも指定できる。http_client.retry_after_seconds）
+                retry_after = retry_after_seconds(response) if response is not None else None
+                if retry_after is not None:
+                    pace.paused_until = max(pace.paused_until, time.monotonic() + retry_after)
+                    pace.tokens = 0
+                    pace.last = pace.paused_until
+                return
+
+            # 応答時間は、たまたま遅かった1回に振り回されないよう、最近の値ほど重く見た平均で判断する
+            pace.latency = elapsed if pace.latency is None else pace.latency * 0.8 + elapsed * 0.2
+            pace.best_latency = pace.latency if pace.best_latency is None else min(pace.best_latency, pace.latency)
+            if pace.latency > pace.best_latency * SLOW_LATENCY_FACTOR:
+                pace.rate = max(self.min_rate, pace.rate * SLOW_DOWN)
+                pace.slowdowns += 1
+            else:
+                pace.rate = min(self.max_rate, pace.rate + RATE_INCREASE)
+
+    def summary(self):
+        """
+        ホストごとの今のペースを、表示しやすい文字列にする。
+        """
+        with self._lock:
+            return "\n".join(
+                f"{host}: 最後のペース {pace.rate:.2f} 件/秒（ペースを落とした回数 {pace.slowdowns} 回）"
+                for host, pace in sorted(self._hosts.items())
+            )
+
+
+def get_page(url, client, limiter, retries=PAGE_RETRIES):
+    """
+    HostRateLimiter のペースを守ってURLを取得し、応答を返す。
+    混雑（429・5xx）や通信エラーのときは、retries 回までやり直す（やり直すときも limiter.wait で待つ）。
+    HttpClient は retries=0 で作っておく（HttpClient の中でやり直すと、ペースを無視して送ってしまうため）。
+    """
+    for attempt in range(retries + 1):
+        limiter.wait(url)
+        try:
+            response = client.get(url)
+        except CircuitOpenError:
+            # 失敗が続いて送信を止めているサーバーには、やり直しても送れない
+            raise
+        except requests.exceptions.RequestException:
+            if attempt == retries:
+                raise
+            continue
+        if not is_transient_status(response.status_code) or attempt == retries:
+            return response
+
+def get_review_url(detail_url):
+    """
+    詳細ページのURLを、クチコミページ（review.html）のURLになおす。
+    """
+    review_url = REVIEW_PATH_PATTERN.sub('/review.html', detail_url)
+    if "review.html" not in review_url:
+         review_url = detail_url
+    return review_url
+
+def is_transient_status(status_code):
+    """
+    時間をおけば取得できるかもしれない応答（混雑 429・サーバーエラー 5xx）かどうか。
+    """
+    return status_code == 429 or status_code >= 500
+
+def get_detail_scores(detail_url, client, limiter, archive=None):
+    """
+    詳細ページ（review.html）から「部屋」と「食事」の点数を取得する。
+    client には scrape_and_save で作った HttpClient を、limiter には HostRateLimiter を渡す。
+    archive（HtmlArchive）を渡すと、取得したHTMLを保存しておく。
+    複数のスレッドから同時に呼ばれる。
+
+    ページがない（404 など）場合は点数なし（0.0）を返す。
+    通信エラーやサーバー側のエラー（5xx・429）は、あとで取り直せるようにそのまま例外を投げる。
+    """
+    #  URLをクチコミページ（review.html）になおす
+    review_url = get_review_url(detail_url)
+    page_url = review_url
+
+    #  ページへのアクセス（マナーとして、決まったペースを超えないように待ってから送る）
+    res = get_page(review_url, client, limiter)
+
+    # サーバー側の一時的なエラーなら、元のURLで取り直さずに例外を投げる
+    # （元のURLには点数がないので、取り直すと「点数なし」として保存されてしまう）
+    if is_transient_status(res.status_code):
+        res.raise_for_status()
+
+    # クチコミページがない場合（404 など）は、元のURLで再トライ
+    if res.status_code != 200:
+         page_url = detail_url
+         res = get_page(detail_url, client, limiter)
+
+    try:
+        res.raise_for_status()
+    except requests.exceptions.HTTPError as e:
+        if is_transient_status(res.status_code):
+            raise
         print(f"  詳細取得エラー: {e}")
         return 0.0, 0.0
 
-def get_score_from_text(text):
+    if archive:
+        archive.store(page_url, "review", res.text)
+    return parse_detail_scores(res.text)
+
+def parse_detail_scores(html):
+    """
+    詳細ページ（review.html）のHTMLから「部屋」と「食事」の点数を取り出す。
+    ページ全体の木は作らず、点数の箱とその親だけを見る（extract.py）。
+    """
+    return extract_detail_scores(html)
+
+def parse_detail_scores_with_soup(html):
+    """
+    parse_detail_scores と同じことを BeautifulSoup で行う（比較用。parse_benchmark.py で使う）。
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+
+    #  検証で見つけた "data-test-id" を使って点数の箱を全て取得
+    score_boxes = soup.find_all("div", attrs={"data-test-id": "category-score"})
+
+    pairs = []
+    for box in score_boxes:
+        # 親要素(p1)だけを見てラベル（部屋、朝食など）を判定
+        parent = box.find_parent()
+        if not parent:
+            continue
+        # 親要素のテキスト（例: "部屋 4.56"）を取得し、空白を除去
+        pairs.append((box.get_text(), parent.get_text().strip()))
+
+    return scores_from_labels(pairs)
+
+def parse_hotel_section(section):
     """
-    テキストの中から「4.5」のような浮動小数点数（スコア）を探し出す関数
-    例: "お客さまの声 4.56" -> 4.56
+    検索結果の1件分（dlタグ）から、ホテル名・総合評価・価格・詳細ページのURLを取り出す。
+    ホテル名が見つからない場合は None を返す。（BeautifulSoup 版。比較用）
     """
-    match = re.search(r'(\d\.\d+)', text)
+    #  ホテル名 (h2タグ) 
+    name_tag = section.find("h2")
+    if not name_tag:
+        return None
+    name = name_tag.get_text(strip=True)
+
+    # 詳細ページへのリンクURLを取得する
+    # ホテル名（h2）の中に <a> タグ（リンク）が含まれているため、その href 属性を取り出す
+    link_tag = name_tag.find("a")
+    detail_url = link_tag.get("href") if link_tag else None
+
+    # 総合評価・価格は、セクション内のテキスト全体から探す（価格が取れなければ親要素まで見に行く）
+    parent = section.parent
+    return build_hotel(name, detail_url, section.get_text(),
+                       lambda: parent.get_text() if parent else "")
+
+def build_search_url(station_key=None, check_in=None, page=1, per_page=PER_PAGE):
+    """
+    TARGET_URL の検索条件のうち、駅（f_key）・宿泊日・ページ番号・件数を差し替えた検索URLを作る。
+    station_key は TARGET_URL の f_key と同じ形（例: "200%2C15503839%2C50887650"）、
+    check_in は "2026-02-26" のような日付の文字列（チェックアウトはその翌日になる）。
+    省略したものは TARGET_URL のまま使う。
+    """
+    base, query = TARGET_URL.split("?", 1)
+    params = dict(parse_qsl(query, keep_blank_values=True))
+    params["f_page"] = str(page)
+    params["f_hyoji"] = str(per_page)
+    if station_key:
+        params["f_key"] = station_key
+    if check_in:
+        day = datetime.date.fromisoformat(check_in)
+        next_day = day + datetime.timedelta(days=1)
+        params.update({
+            "f_nen1": str(day.year), "f_tuki1": str(day.month), "f_hi1": str(day.day),
+            "f_nen2": str(next_day.year), "f_tuki2": str(next_day.month), "f_hi2": str(next_day.day),
+        })
+    return base + "?" + urlencode(params)
+
+def hotel_key(hotel):
+    """
+    同じホテルかどうかを判定するためのキー。
+    詳細ページのURLにあるホテル番号（/HOTEL/12345/ の部分）を使い、なければホテル名を使う。
+    """
+    match = HOTEL_ID_PATTERN.search(hotel.get("detail_url") or "")
     if match:
-        return float(match.group(1))
-    return 0.0
+        return "hotel:" + match.group(1)
+    return "name:" + hotel["name"]
 
-def scrape_and_save():
+def fetch_listing(url, client, limiter, archive=None):
+    """
+    検索結果ページを1ページ取得して、ホテルの一覧（parse_hotel_section の結果に、取得日時 fetched_at を加えたもの）を返す。
+    archive（HtmlArchive）を渡すと、取得したHTMLを保存しておく。
+    """
+    response = get_page(url, client, limiter)
+    response.raise_for_status()
+    # 一覧の価格・総合評価は、このページを取得した日時のものとして保存する（--reparse でも同じ日時になる）
+    fetched_at = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    if archive:
+        archive.store(url, "search", response.text, fetched_at)
+    hotels = parse_listing(response.text)
+    for hotel in hotels:
+        hotel["fetched_at"] = fetched_at
+    return hotels
+
+def parse_listing(html):
+    """
+    検索結果ページのHTMLから、ホテルの一覧（parse_hotel_section の結果と同じ形の辞書のリスト）を取り出す。
+    ページ全体の木は作らず、ホテルの箱（dl.htlGnrlInfo）の中だけを見る（extract.py）。
+    """
+    return extract_listing(html)
+
+def parse_listing_with_soup(html):
+    """
+    parse_listing と同じことを BeautifulSoup で行う（比較用。parse_benchmark.py で使う）。
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # 「dl」タグを探す
+    # class_ には "htlGnrlInfo" を指定する
+    # （"htl-info__wrap" はスペース区切りの別クラスなので、片方指定
+    hotel_sections = soup.find_all("dl", class_="htlGnrlInfo")
+
+    hotels = []
+    for section in hotel_sections:
+        try:
+            hotel = parse_hotel_section(section)
+        except Exception as e:
+            print(f"エラー（一覧の解析）: {e}")
+            continue
+        if hotel:
+            hotels.append(hotel)
+    return hotels
+
+def scrape_and_save(workers=DEFAULT_WORKERS, rate=DEFAULT_RATE, queries=None, max_pages=1,
+                    resume=False, fresh_hours=DEFAULT_FRESH_HOURS, max_rate=DEFAULT_MAX_RATE):
+    """
+    検索結果ページからホテルの一覧を取り出し、詳細ページ（部屋・食事の点数）を
+    複数のスレッドで同時に取得して hotels テーブルに保存する。
+    待ち時間は一律の sleep ではなく、サーバーごとのトークンバケットで決まるので、
+    全体の時間は「通信の遅さ × 件数」ではなく「許されたペース」で決まる。
+    ペースは rate 件/秒から始めて、サーバーが順調なら max_rate 件/秒まで上げ、混雑していれば落とす（HostRateLimiter）。
+
+    queries に [(station_key, check_in), ...] を渡すとクロールモードになり、
+    検索条件ごとに結果がなくなるまで（最大 max_pages ページ）次のページをたどる。
+    同じホテルが複数の検索条件に出てきても、1回だけ保存する。
+    省略した場合は TARGET_URL の1ページだけを取得する（これまでと同じ動き）。
+
+    実行の様子は台帳（ledger.py）に記録し、COMMIT_EVERY 件または COMMIT_INTERVAL 秒ごとに commit する。
+    resume=True なら、最後まで終わっていない一番新しい実行を、その検索条件のまま続きから再開する
+    （解析済みの検索結果ページと、取得済みの詳細ページは取得し直さない）。
+    fresh_hours 時間以内にどれかの実行で取得した詳細ページは、取得し直さずにそのときの点数を使う。
+    """
     # DB接続
     conn = sqlite3.connect('travel_analysis.db')
     cursor = conn.cursor()
     
-    # テーブルが存在しない場合に備えて作成する（エラー回避のため）
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS hotels (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            total_score REAL,
-            breakfast_score REAL,
-            room_score REAL,
-            price INTEGER,
-            fetched_at TEXT
-        )
-    """)
+    # テーブルが存在しない場合や、古い形のままの場合に備えて作成・変換する（db.py）
+    migrate_project_db(conn)
     
-    print("スクレイピングを開始する...")
+    # 取得したHTMLは全て保存しておく（--reparse で、通信せずに hotels を作り直せる）
+    ensure_archive_table(conn)
+    archive = HtmlArchive()
 
-    try:
-        response = requests.get(TARGET_URL, headers=HEADERS)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
+    # 実行の台帳（再開する場合は、前回の検索条件をそのまま使う）
+    ensure_ledger_tables(conn)
+    ledger = RunLedger.latest_unfinished(conn) if resume else None
+    if ledger:
+        queries, max_pages = ledger.queries, ledger.max_pages
+        print(f"実行 {ledger.run_id} を続きから再開する...")
+    else:
+        if resume:
+            print("再開できる実行がないので、新しく始めます。")
+        if queries is None:
+            queries = [(None, None)]
+        ledger = RunLedger.start(conn, queries, max_pages)
+        print("スクレイピングを開始する...")
+    conn.commit()
 
-        # 「dl」タグを探す
-        # class_ には "htlGnrlInfo" を指定する
-        # （"htl-info__wrap" はスペース区切りの別クラスなので、片方指定
-        hotel_sections = soup.find_all("dl", class_="htlGnrlInfo")
-        
-        print(f"{len(hotel_sections)} 件のホテルが見つかった。")
+    # この日時より後に取得した詳細ページは、取得し直さない
+    fresh_since = None
+    if fresh_hours > 0:
+        fresh_since = (datetime.datetime.now() - datetime.timedelta(hours=fresh_hours)).strftime('%Y-%m-%d %H:%M:%S')
 
-        if len(hotel_sections) == 0:
-            print("警告: 0件です。URLが正しいか、または検索結果ページであることを確認してください。")
+    # 全てのリクエストで同じ接続を使い回す（HEADERS も毎回付く。タイムアウトは http_client.py の設定）
+    # 送るペースはサーバーの応答を見て rate から max_rate の間で調整する
+    limiter = HostRateLimiter(rate, max_rate=max_rate)
+    # やり直しは get_page が limiter を通して行うので、HttpClient の中ではやり直さない（retries=0）
+    client = HttpClient(headers=HEADERS, pool_size=workers, retries=0, on_response=limiter.observe)
+    start = time.monotonic()
 
-        for i, section in enumerate(hotel_sections): # i は進捗表示用に追加
-            try:
-                #  ホテル名 (h2タグ) 
-                name_tag = section.find("h2")
-                if not name_tag:
-                    continue
-                name = name_tag.get_text(strip=True)
-
-                # 総合評価 
-                # "お客さまの声" という文字の近くにある数字を探す戦略
-                # 特定のクラスが見つからなくても、セクション内のテキスト全体から数字を探す
-                text_content = section.get_text()
-                total_score = get_score_from_text(text_content)
-                
-                # ここから詳細データを取得するロジックに変更 
-                # 詳細ページへのリンクURLを取得する
-                # ホテル名（h2）の中に <a> タグ（リンク）が含まれているため、その href 属性を取り出す
-                link_tag = name_tag.find("a")
-                
-                # 初期値（リンクが見つからない場合用）
-                breakfast_score = 0.0
-                room_score = 0.0
-                
-                if link_tag:
-                    detail_url = link_tag.get("href")
-                    
-                    # 進捗を表示する（詳細取得は時間がかかるため、ユーザーに状況を伝える）
-                    print(f"[{i+1}/{len(hotel_sections)}] 詳細データ取得中: {name[:10]}... ", end="", flush=True)
-                    
-                    # 追加した関数を呼び出し、詳細ページの中身を見に行く
-                    room_score, breakfast_score = get_detail_scores(detail_url)
-                    
-                    print(f"-> 部屋:{room_score}, 食事:{breakfast_score}")
-                
-                # 価格
-                # 価格は dl の外側にあるケースが多いが、内側にある場合もある。
-                # "円" を含む数字を探してみる
-                price = 0
-                price_match = re.search(r'([\d,]+)円', text_content)
-                if price_match:
-                    price_str = price_match.group(1).replace(",", "")
-                    price = int(price_str)
-                
-                # 価格が取れなかった場合、親要素（外側の箱）まで見に行く
-                if price == 0:
-                    parent = section.parent
-                    if parent:
-                        parent_text = parent.get_text()
-                        price_match_parent = re.search(r'([\d,]+)円', parent_text)
-                        if price_match_parent:
-                            price_str = price_match_parent.group(1).replace(",", "")
-                            price = int(price_str)
-
-                #  データの保存 
-                now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-                cursor.execute("""
-                    INSERT INTO hotels (name, total_score, breakfast_score, room_score, price, fetched_at)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (name, total_score, breakfast_score, room_score, price, now))
+    seen = ledger.seen_keys()  # すでに見つけたホテル（hotel_key）
+    pending = {}  # 詳細ページを取得中の future -> ホテル
+    saved = 0
+    reused = 0    # 最近取得した点数を使った件数
+    failed = 0    # 取得できなかった件数（--resume で取り直せる）
+    uncommitted = 0
+    last_commit = time.monotonic()
+
+    # ためておいた書き込みを確定させる関数（件数か時間のどちらかが一定を超えたとき）
+    def checkpoint(force=False):
+        nonlocal uncommitted, last_commit
+        if not force and uncommitted < COMMIT_EVERY and time.monotonic() - last_commit < COMMIT_INTERVAL:
+            return
+        archive.flush(conn)
+        conn.commit()
+        uncommitted = 0
+        last_commit = time.monotonic()
+
+    # 1件分のホテルを保存し、台帳にも取得済みと記録する関数
+    def save_done(hotel, fetched_at=None):
+        nonlocal saved, uncommitted
+        save_hotel(cursor, hotel)
+        if hotel["detail_url"]:
+            ledger.detail_done(hotel["detail_url"], hotel, fetched_at)
+        saved += 1
+        uncommitted += 1
 
+    # 詳細ページの取得を始める関数（最近取得していれば、そのときの点数を使う）
+    def submit(hotel):
+        nonlocal reused
+        cached = ledger.fresh_detail(hotel["detail_url"], fresh_since) if fresh_since else None
+        if cached:
+            previous, fetched_at = cached
+            hotel["room_score"], hotel["breakfast_score"] = previous["room_score"], previous["breakfast_score"]
+            save_done(hotel, fetched_at)
+            reused += 1
+            return
+        ledger.detail_pending(hotel["detail_url"], hotel)
+        future = executor.submit(get_detail_scores, hotel["detail_url"], client, limiter, archive)
+        pending[future] = hotel
+
+    # 詳細ページの取得が終わったホテルを保存する関数（データベースへの書き込みはこのスレッドだけで行う）
+    # block=True なら、少なくとも1件終わるまで待つ
+    def save_finished(block=False):
+        nonlocal failed
+        if not pending:
+            return
+        if block:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        else:
+            done = [future for future in pending if future.done()]
+        for future in done:
+            hotel = pending.pop(future)
+            try:
+                hotel["room_score"], hotel["breakfast_score"] = future.result()
+                save_done(hotel)
             except Exception as e:
-                print(f"エラー（{name}）: {e}")
+                # 取得できなかったものは保存せず、台帳に失敗と記録しておく（--resume で取り直す）
+                print(f"  詳細取得エラー（{hotel['name']}）: {e}")
+                ledger.detail_failed(hotel["detail_url"], hotel)
+                failed += 1
                 continue
+            # 進捗を表示する（詳細取得は時間がかかるため、ユーザーに状況を伝える）
+            print(f"[{saved}] {hotel['name'][:10]}... "
+                  f"-> 部屋:{hotel['room_score']}, 食事:{hotel['breakfast_score']}")
+        # 一定の件数・時間ごとに commit して、途中までの結果を確定させる
+        checkpoint()
 
-        conn.commit()
-        print("保存完了！")
+    status = RUNNING
+    try:
+        # 詳細ページの取得と解析は、別々のスレッドで同時に進める
+        # 1件の通信を待っている間に、次の検索結果ページの取得や、他のホテルの解析が進む
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # 前回取得できなかった詳細ページから取り直す
+            for hotel in ledger.unfinished_details():
+                submit(hotel)
+
+            search_errors = 0
+            for station_key, check_in in queries:
+                previous_keys = None
+                for page in range(1, max_pages + 1):
+                    # 検索条件を省略した1ページ目は TARGET_URL と同じURLになる
+                    url = build_search_url(station_key, check_in, page)
+
+                    # この実行で解析が終わっているページは、取得し直さずに次のページへ
+                    page_keys = ledger.done_page_keys(url)
+                    if page_keys is None:
+                        try:
+                            hotels = fetch_listing(url, client, limiter, archive)
+                        except Exception as e:
+                            print(f"検索結果の取得エラー（{station_key} {check_in} {page}ページ目）: {e}")
+                            search_errors += 1
+                            break
+
+                        page_keys = [hotel_key(hotel) for hotel in hotels]
+                        new_hotels = [hotel for hotel in hotels if hotel_key(hotel) not in seen]
+                        print(f"{station_key or '既定の駅'} {check_in or '既定の日付'} {page}ページ目: "
+                              f"{len(hotels)} 件（新しいホテル {len(new_hotels)} 件）")
+                        if page == 1 and not hotels:
+                            print("警告: 0件です。URLが正しいか、または検索結果ページであることを確認してください。")
+
+                        for hotel in new_hotels:
+                            seen.add(hotel_key(hotel))
+                            if hotel["detail_url"]:
+                                submit(hotel)
+                            else:
+                                # リンクが見つからない場合は、詳細の点数なし（0.0）で保存する
+                                hotel["room_score"], hotel["breakfast_score"] = 0.0, 0.0
+                                save_done(hotel)
+                        ledger.page_done(url, page_keys)
+
+                    # 取得中のものが増えすぎないよう（メモリを使いすぎないよう）、多いときは終わるまで待つ
+                    save_finished()
+                    while len(pending) > workers * 4:
+                        save_finished(block=True)
+
+                    # 最後のページまで来たら次の検索条件へ
+                    # （件数が1ページ分に足りないか、範囲外のページで前のページと同じ結果が返ってきた場合）
+                    if len(page_keys) < PER_PAGE or page_keys == previous_keys:
+                        break
+                    previous_keys = page_keys
+
+            # 残りの詳細ページの取得が終わるのを待って保存する
+            while pending:
+                save_finished(block=True)
+
+        status = INCOMPLETE if failed or search_errors else FINISHED
+        print(f"保存完了！ {saved} 件（うち最近の点数を使ったもの {reused} 件・"
+              f"取得できなかったもの {failed} 件）（{time.monotonic() - start:.1f} 秒）")
+        if status == INCOMPLETE:
+            print("取得できなかったページがあります。python scraping.py --resume で続きを取得できます。")
 
     except Exception as e:
         print(f"全体エラー: {e}")
 
+    finally:
+        # 途中で止まった場合も、それまでに保存したものは確定させる（台帳は running のまま残り、--resume で再開できる）
+        try:
+            ledger.finish(status)
+            checkpoint(force=True)
+        except sqlite3.Error as e:
+            print(f"途中までの結果を保存できませんでした: {e}")
+        conn.close()
+        # サーバーごとのリクエスト数・エラー数・応答時間と、最後のペースを表示する
+        print(format_metrics(client.metrics()))
+        print(limiter.summary())
+        client.close()
+
+def save_hotel(cursor, hotel, fetched_at=None):
+    """
+    1件分のホテルの情報を保存する（commit は呼び出し側で行う）。
+    - hotels: ホテル1件につき1行。同じホテル（hotel_key が同じ）なら、より新しい取得の内容で上書きする
+    - hotel_observations: 取得ごとの点数・価格を1行ずつ残す（同じ取得日時なら上書き）
+    fetched_at を省略すると、hotel["fetched_at"]（検索結果ページを取得した日時）、それもなければ今の日時にする。
+    """
+    now = fetched_at or hotel.get("fetched_at") or datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    key = hotel_key(hotel)
+
+    # ホテル名をキーにしていた以前の行があれば、ホテル番号のキーに付け替える
+    # ただし、以前の1回の取得に同じ名前が何回も出てきた名前（チェーンの別の店舗など。db.py の legacy_ambiguous_names）は、
+    # どのホテルのことか分からないので付け替えない
+    if key.startswith("hotel:"):
+        name_key = "name:" + hotel["name"]
+        ambiguous = cursor.execute("SELECT 1 FROM legacy_ambiguous_names WHERE name = ?", (hotel["name"],)).fetchone()
+        if not ambiguous:
+            cursor.execute("UPDATE OR IGNORE hotels SET hotel_key = ? WHERE hotel_key = ?", (key, name_key))
+            cursor.execute("DELETE FROM hotels WHERE hotel_key = ?", (name_key,))
+            # 同じ取得日時の記録がすでにあって付け替えられなかったものは重複なので消す（新しいキーの記録を残す）
+            cursor.execute("UPDATE OR IGNORE hotel_observations SET hotel_key = ? WHERE hotel_key = ?",
+                           (key, name_key))
+            cursor.execute("DELETE FROM hotel_observations WHERE hotel_key = ?", (name_key,))
+
+    cursor.execute("""
+        INSERT INTO hotels (hotel_key, name, detail_url, total_score, breakfast_score, room_score, price,
+                            fetched_at, first_seen_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (hotel_key) DO UPDATE SET
+            name = excluded.name,
+            detail_url = COALESCE(excluded.detail_url, detail_url),
+            total_score = excluded.total_score,
+            breakfast_score = excluded.breakfast_score,
+            room_score = excluded.room_score,
+            price = excluded.price,
+            fetched_at = excluded.fetched_at
+        WHERE excluded.fetched_at >= fetched_at
+    """, (key, hotel["name"], hotel["detail_url"], hotel["total_score"], hotel["breakfast_score"],
+          hotel["room_score"], hotel["price"], now, now))
+    # 古い取得を後から保存した場合（--reparse など）は、初めて取得した日時だけを早める
+    cursor.execute("""
+        UPDATE hotels SET first_seen_at = ? WHERE hotel_key = ? AND first_seen_at > ?
+    """, (now, key, now))
+
+    cursor.execute("""
+        INSERT OR REPLACE INTO hotel_observations
+            (hotel_key, observed_at, total_score, breakfast_score, room_score, price)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (key, now, hotel["total_score"], hotel["breakfast_score"], hotel["room_score"], hotel["price"]))
+
+# --- 保存したHTMLからの作り直し（再解析） ---
+# 解析は時間がかかる（CPUを使う）ので、複数のプロセスで同時に行う
+# 各プロセスは、クチコミページのURL -> ハッシュ値の表を最初に1回だけ受け取る
+_reparse_archive = None
+_reparse_reviews = None
+
+def _init_reparse_worker(archive_root, review_hashes):
+    global _reparse_archive, _reparse_reviews
+    _reparse_archive = HtmlArchive(archive_root)
+    _reparse_reviews = review_hashes
+
+def _reparse_search_page(job):
+    """
+    保存しておいた検索結果ページ1つ分を解析し、各ホテルの点数を保存しておいたクチコミページから取り出す。
+    （別のプロセスで実行される）
+    """
+    fetched_at, content_hash = job
+    hotels = parse_listing(_reparse_archive.load(content_hash))
+    for hotel in hotels:
+        hotel["room_score"], hotel["breakfast_score"] = 0.0, 0.0
+        if not hotel["detail_url"]:
+            continue
+        review_url = get_review_url(hotel["detail_url"])
+        review_hash = _reparse_reviews.get(review_url) or _reparse_reviews.get(hotel["detail_url"])
+        if review_hash:
+            hotel["room_score"], hotel["breakfast_score"] = parse_detail_scores(_reparse_archive.load(review_hash))
+    return fetched_at, hotels
+
+def reparse_archive(workers=None):
+    """
+    保存しておいたHTMLだけを使って hotels・hotel_observations を作り直す（通信は一切しない）。
+    検索結果ページを取得した日時を、そのホテルの取得日時にする。
+    同じ日に同じホテルが何回も出てきた場合は、最初に取得したもの1件にまとめる（scrape_and_save と同じ）。
+    保存したHTMLにある取得の分だけを上書きするので、それ以外の記録は残る。
+    """
+    conn = sqlite3.connect('travel_analysis.db')
+    migrate_project_db(conn)
+    ensure_archive_table(conn)
+    archive = HtmlArchive()
+    start = time.monotonic()
+
+    try:
+        # クチコミページは、URLごとに一番新しく取得したものを使う
+        # （SQLiteでは MAX() と一緒に選んだ列は、最大値を持つ行の値になる）
+        review_hashes = {
+            url: content_hash
+            for url, content_hash, _ in conn.execute("""
+                SELECT url, content_hash, MAX(fetched_at)
+                FROM page_archive
+                WHERE kind = 'review'
+                GROUP BY url
+            """)
+        }
+        jobs = conn.execute("""
+            SELECT fetched_at, content_hash
+            FROM page_archive
+            WHERE kind = 'search'
+            ORDER BY fetched_at
+        """).fetchall()
+        print(f"検索結果ページ {len(jobs)} 件・クチコミページ {len(review_hashes)} 件を解析します...")
+
+        rows = {}
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_reparse_worker,
+                                 initargs=(archive.root, review_hashes)) as executor:
+            for fetched_at, hotels in executor.map(_reparse_search_page, jobs, chunksize=4):
+                for hotel in hotels:
+                    rows.setdefault((hotel_key(hotel), fetched_at[:10]), (hotel, fetched_at))
+
+        # 作り直した内容で上書きする（1つのトランザクションで行う）
+        cursor = conn.cursor()
+        for hotel, fetched_at in rows.values():
+            save_hotel(cursor, hotel, fetched_at)
+        conn.commit()
+        print(f"hotels・hotel_observations を作り直しました: {len(rows)} 件（{time.monotonic() - start:.1f} 秒）")
     finally:
         conn.close()
-        time.sleep(2)
+
+def positive_rate(value):
+    """
+    コマンドラインで指定されたペース（件/秒）を数にする（0以下なら指定の誤りとして扱う）。
+    """
+    rate = float(value)
+    if rate <= 0:
+        raise argparse.ArgumentTypeError(f"0より大きい値を指定してください: {value}")
+    return rate
 
 if __name__ == "__main__":
-    scrape_and_save()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="楽天トラベルの検索結果からホテルの評価を集める")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="詳細ページを同時に取得する数")
+    parser.add_argument("--rate", type=positive_rate, default=DEFAULT_RATE, help="1つのサーバーに送る1秒あたりのリクエスト数（最初のペース）")
+    parser.add_argument("--max-rate", type=positive_rate, default=DEFAULT_MAX_RATE, help="1つのサーバーに送る1秒あたりの最大リクエスト数")
+    # クロールモード: 駅と日付の組み合わせごとに、全てのページをたどる
+    # 例: python scraping.py --stations 200%2C15503839%2C50887650 --dates 2026-02-26 2026-03-05
+    parser.add_argument("--stations", nargs="+", default=None, help="駅の検索キー（TARGET_URL の f_key と同じ形）")
+    parser.add_argument("--dates", nargs="+", default=None, help="宿泊日（例: 2026-02-26）")
+    parser.add_argument("--max-pages", type=int, default=DEFAULT_MAX_PAGES, help="1つの検索条件でたどる最大ページ数")
+    # 再解析モード: 保存しておいたHTMLから hotels を作り直す（通信しない）
+    parser.add_argument("--reparse", action="store_true", help="保存しておいたHTMLから hotels を作り直す")
+    # 再開: 途中で止まった（取得できなかったページがある）一番新しい実行を、続きから行う
+    parser.add_argument("--resume", action="store_true", help="途中で止まった実行を続きから再開する")
+    parser.add_argument("--fresh-hours", type=float, default=DEFAULT_FRESH_HOURS,
+                        help="この時間以内に取得した詳細ページは取得し直さない（0 なら毎回取得する）")
+    args = parser.parse_args()
+
+    if args.reparse:
+        reparse_archive()
+    elif args.stations or args.dates:
+        crawl_queries = [(station, date) for station in (args.stations or [None]) for date in (args.dates or [None])]
+        scrape_and_save(workers=args.workers, rate=args.rate, queries=crawl_queries, max_pages=args.max_pages,
+                        resume=args.resume, fresh_hours=args.fresh_hours, max_rate=args.max_rate)
+    else:
+        scrape_and_save(workers=args.workers, rate=args.rate, resume=args.resume, fresh_hours=args.fresh_hours,
+                        max_rate=args.max_rate)